@@ -0,0 +1,108 @@
+"""
+Batch (album) uploads.
+
+A batch is a parent record over child jobs, one per uploaded file. The
+children are queued together by the worker that received the batch, and
+scheduling is per process, so that worker sees every status change of every
+child. It keeps their latest state here and rewrites the batch's aggregate
+status, one Redis key, on each change. Clients poll that one key instead of
+every child.
+
+The worker forgets a batch once every child has finished, or when its Redis
+key expires, whichever comes first. A child lost with its worker would
+otherwise keep its batch in memory for good.
+"""
+
+import collections
+import json
+import time
+from typing import Dict, Optional
+
+BATCH_KEY = "batch:{batch_id}"
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+
+class Batch:
+    def __init__(self, batch_id: str, user_id: str, children: Dict[str, str], created_at: Optional[float] = None):
+        self.batch_id = batch_id
+        self.user_id = user_id
+        # Job ID -> latest state, progress and filename, in upload order
+        self.children: Dict[str, dict] = {
+            job_id: {"filename": filename, "state": "uploaded", "progress": 0.0}
+            for job_id, filename in children.items()
+        }
+        self.created_at = created_at if created_at is not None else time.time()
+        self.finished_at: Optional[float] = None
+        # When the Redis key expires, as of the last save (None: never)
+        self.expires_at: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        return BATCH_KEY.format(batch_id=self.batch_id)
+
+    @property
+    def done(self) -> bool:
+        return all(child["state"] in TERMINAL_STATES for child in self.children.values())
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is not None and (now if now is not None else time.time()) >= self.expires_at
+
+    def update(self, job_id: str, state: str, progress: Optional[float]) -> bool:
+        """Record a child's status. Returns whether the aggregate changed."""
+        child = self.children.get(job_id)
+        if child is None:
+            return False
+        if state == "completed":
+            progress = 1.0
+        elif progress is None:
+            progress = child["progress"]
+        if child["state"] == state and child["progress"] == progress:
+            return False
+        child["state"], child["progress"] = state, progress
+        if self.done and self.finished_at is None:
+            self.finished_at = time.time()
+        return True
+
+    def state(self) -> str:
+        states = collections.Counter(child["state"] for child in self.children.values())
+        if not self.done:
+            return "processing" if states["uploaded"] < len(self.children) else "uploaded"
+        if states["completed"] == len(self.children):
+            return "completed"
+        # Some tracks came through, some didn't
+        return "partial" if states["completed"] else "failed"
+
+    def status(self) -> dict:
+        # Finished children, whatever their outcome, count as fully done
+        progress = [1.0 if child["state"] in TERMINAL_STATES else child["progress"] or 0.0
+                    for child in self.children.values()]
+        return {
+            "batchId": self.batch_id,
+            "userId": self.user_id,
+            "state": self.state(),
+            "progress": round(sum(progress) / len(progress), 4) if progress else 1.0,
+            "total": len(self.children),
+            "counts": dict(collections.Counter(child["state"] for child in self.children.values())),
+            "jobs": [{"jobId": job_id, **child} for job_id, child in self.children.items()],
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+    def save(self, store, ttl: Optional[int] = None):
+        """Write the aggregate status to ``store``, Redis or a pipeline."""
+        store.set(self.key, json.dumps(self.status()), ex=ttl)
+        self.expires_at = time.time() + ttl if ttl else None
+
+
+def prune(job_batches: Dict[str, Batch], now: Optional[float] = None) -> int:
+    """Drop the children of expired batches from a job ID -> batch map. Returns how many."""
+    expired = [job_id for job_id, batch in job_batches.items() if batch.expired(now)]
+    for job_id in expired:
+        del job_batches[job_id]
+    return len(expired)
+
+
+def load_status(redis_client, batch_id: str) -> Optional[dict]:
+    data = redis_client.get(BATCH_KEY.format(batch_id=batch_id))
+    return json.loads(data) if data else None
+
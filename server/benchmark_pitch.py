@@ -0,0 +1,112 @@
+"""
+Benchmark pitch-contour extraction speed against track length.
+
+Run from the server directory:
+
+    python benchmark_pitch.py --lengths 30 60 120 240 480 --repeats 3
+
+Each length is timed for the vectorized YIN on an already-decoded signal and
+for the whole write_pitch_file path (WAV read, decimation, analysis, file
+write). With --workers, the same tracks are also run through a process pool,
+the way the API runs them. --naive additionally times a per-frame Python loop
+over the same frames on the shortest length, for comparison.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import pitch
+
+
+def synthetic_vocals(seconds, sample_rate=44100, seed=0):
+    """A sung line: a gliding tone with vibrato and harmonics, phrases separated by rests."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    melody = 220 * 2 ** (np.round(4 * np.sin(2 * np.pi * t / 7)) / 12)
+    frequency = melody * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    phase = 2 * np.pi * np.cumsum(frequency) / sample_rate
+    voice = 0.4 * np.sin(phase) + 0.15 * np.sin(2 * phase) + 0.05 * np.sin(3 * phase)
+    voice *= (np.sin(2 * np.pi * t / 4) > -0.3)
+    voice += 0.005 * rng.standard_normal(t.shape[0])
+    return np.column_stack((voice, voice))
+
+
+def write_wav(path, samples, sample_rate=44100):
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.clip(samples * 32767, -32768, 32767).astype('<i2').tobytes())
+
+
+def naive_contour(signal, sample_rate):
+    """Reference per-frame loop: the YIN difference function in plain NumPy, one frame at a time."""
+    tau_min = max(2, int(sample_rate / pitch.MAX_FREQUENCY))
+    tau_max = min(pitch.FRAME_LENGTH - 3, int(np.ceil(sample_rate / pitch.MIN_FREQUENCY)))
+    padded = np.pad(signal, (pitch.FRAME_LENGTH // 2, pitch.FRAME_LENGTH // 2))
+    f0 = []
+    for start in range(0, padded.shape[0] - pitch.FRAME_LENGTH + 1, pitch.HOP_LENGTH):
+        frame = padded[start:start + pitch.FRAME_LENGTH]
+        difference = np.array([np.sum((frame[:-tau or None] - frame[tau:]) ** 2) for tau in range(tau_max + 1)])
+        normalized = difference[1:] * np.arange(1, tau_max + 1) / np.maximum(np.cumsum(difference[1:]), 1e-12)
+        below = np.flatnonzero(normalized[tau_min - 1:] < pitch.THRESHOLD)
+        f0.append(sample_rate / (below[0] + tau_min) if below.size else 0.0)
+    return np.array(f0)
+
+
+def best_of(repeats, fn, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lengths', type=float, nargs='+', default=[30, 60, 120, 240, 480])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--naive', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'seconds':>8} {'frames':>8} {'yin fps':>10} {'file fps':>10} {'x realtime':>11}")
+    with tempfile.TemporaryDirectory() as scratch:
+        paths = []
+        for seconds in args.lengths:
+            path = os.path.join(scratch, f"vocals_{seconds:g}.wav")
+            write_wav(path, synthetic_vocals(seconds))
+            paths.append(path)
+
+            signal, sample_rate = pitch.load_analysis_signal(path)
+            analysis_seconds, (f0, _, _) = best_of(args.repeats, pitch.pitch_contour, signal, sample_rate)
+            file_seconds, _ = best_of(args.repeats, pitch.write_pitch_file, path, f"{path}.pitch")
+            print(f"{seconds:>8g} {f0.shape[0]:>8} {f0.shape[0] / analysis_seconds:>10.0f} "
+                  f"{f0.shape[0] / file_seconds:>10.0f} {seconds / file_seconds:>11.0f}")
+
+        if args.naive:
+            signal, sample_rate = pitch.load_analysis_signal(paths[0])
+            naive_seconds, naive_f0 = best_of(1, naive_contour, signal, sample_rate)
+            print(f"Per-frame loop on {args.lengths[0]:g}s: {naive_f0.shape[0] / naive_seconds:.0f} frames/sec")
+
+        if args.workers:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                # Start the workers before timing
+                list(pool.map(pitch.write_pitch_file, paths[:1], [f"{paths[0]}.pitch"]))
+                start = time.perf_counter()
+                results = list(pool.map(pitch.write_pitch_file, paths, [f"{p}.pitch" for p in paths]))
+                elapsed = time.perf_counter() - start
+            frames = sum(result["frames"] for result in results)
+            print(f"{len(paths)} tracks in a pool of {args.workers}: {frames / elapsed:.0f} frames/sec, "
+                  f"{sum(args.lengths) / elapsed:.0f}x realtime")
+
+
+if __name__ == '__main__':
+    main()
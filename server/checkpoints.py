@@ -0,0 +1,58 @@
+"""
+Stage checkpoints for the processing pipeline.
+
+Each stage that finishes records its artifacts (file names in the job's
+output directory) in the job record. A retried job skips the completed
+prefix of its pipeline and resumes at the first stage that is not complete,
+so a failed Whisper call does not cost another separation. A checkpoint only
+counts while all of its artifacts are still on disk.
+"""
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class StageCheckpoints:
+    def __init__(self, stages: Optional[Dict[str, dict]] = None):
+        # Copied, so records loaded from a job status can be updated freely
+        self.stages: Dict[str, dict] = {name: dict(record) for name, record in (stages or {}).items()}
+
+    def _record(self, stage: str) -> dict:
+        return self.stages.setdefault(stage, {"state": "pending", "retries": 0})
+
+    def start(self, stage: str):
+        record = self._record(stage)
+        record["state"] = "running"
+        record.pop("error", None)
+
+    def complete(self, stage: str, artifacts: Iterable[str]):
+        record = self._record(stage)
+        record.update(state="completed", artifacts=sorted(artifacts), completedAt=time.time())
+        record.pop("error", None)
+
+    def fail(self, stage: str, error: str):
+        record = self._record(stage)
+        record.update(state="failed", error=error)
+
+    def retried(self, stage: str) -> int:
+        """Count a retry of ``stage``; returns the stage's total retries."""
+        record = self._record(stage)
+        record["retries"] = record.get("retries", 0) + 1
+        return record["retries"]
+
+    def is_complete(self, stage: str, job_dir: str) -> bool:
+        record = self.stages.get(stage)
+        if not record or record.get("state") != "completed":
+            return False
+        return all(os.path.exists(os.path.join(job_dir, name)) for name in record.get("artifacts", []))
+
+    def resume_index(self, pipeline: List[str], job_dir: str) -> int:
+        """Index of the first stage of ``pipeline`` that has to run (len(pipeline) if none)."""
+        for index, stage in enumerate(pipeline):
+            if not self.is_complete(stage, job_dir):
+                return index
+        return len(pipeline)
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {name: dict(record) for name, record in self.stages.items()}
@@ -0,0 +1,118 @@
+"""
+Application-lifetime HTTP client for inter-service calls.
+
+One ``aiohttp.ClientSession`` with a keep-alive connection pool serves all
+traffic to the Spleeter backends, with connect/read timeouts and per-request
+latency instrumentation through aiohttp's tracing hooks.
+"""
+
+import collections
+import threading
+import time
+from typing import Dict
+
+import aiohttp
+
+# Latency samples kept per endpoint for percentiles
+LATENCY_WINDOW = 512
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.samples = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds: float):
+        self.requests += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.samples.append(seconds)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "meanSeconds": self.total_seconds / self.requests if self.requests else None,
+            "p50Seconds": percentile(0.5),
+            "p95Seconds": percentile(0.95),
+            "maxSeconds": self.max_seconds,
+        }
+
+
+class ClientMetrics:
+    """Request latency (time to response headers) and connection reuse counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointStats] = collections.defaultdict(EndpointStats)
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connect_seconds = 0.0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.started = time.monotonic()
+            ctx.key = f"{params.method} {params.url.host}{params.url.path}"
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_started = time.monotonic()
+
+        async def on_connection_create_end(session, ctx, params):
+            with self._lock:
+                self.connections_created += 1
+                self.connect_seconds += time.monotonic() - ctx.connect_started
+
+        async def on_connection_reuseconn(session, ctx, params):
+            with self._lock:
+                self.connections_reused += 1
+
+        async def on_request_end(session, ctx, params):
+            with self._lock:
+                self.endpoints[ctx.key].record(time.monotonic() - ctx.started)
+
+        async def on_request_exception(session, ctx, params):
+            with self._lock:
+                self.endpoints[ctx.key].errors += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_start.append(on_connection_create_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "connectionsCreated": self.connections_created,
+                "connectionsReused": self.connections_reused,
+                "meanConnectSeconds": (
+                    self.connect_seconds / self.connections_created if self.connections_created else None
+                ),
+                "endpoints": {key: stats.snapshot() for key, stats in self.endpoints.items()},
+            }
+
+
+def create_session(metrics: ClientMetrics, connect_timeout: float, read_timeout: float,
+                   max_connections: int, max_connections_per_host: int,
+                   keepalive_timeout: float) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=max_connections,
+        limit_per_host=max_connections_per_host,
+        keepalive_timeout=keepalive_timeout,
+    )
+    # No total timeout: a long separation legitimately takes minutes, so
+    # only connecting and gaps between received bytes are bounded
+    timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[metrics.trace_config()])
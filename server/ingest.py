@@ -0,0 +1,85 @@
+"""
+Decode-once ingest stage.
+
+Every upload is decoded and resampled exactly once into a canonical PCM WAV
+(44.1 kHz, stereo, 16-bit) in the job's output directory. Later stages read
+that file instead of decoding the original upload again, either by sending
+it to Spleeter (which takes canonical WAV without running ffmpeg) or by
+memory-mapping its samples. The decode time and stream facts are recorded
+once per job in a small JSON sidecar.
+"""
+
+import json
+import os
+import subprocess
+import time
+from typing import Optional
+
+import numpy as np
+
+import waveform
+
+CANONICAL_SAMPLE_RATE = 44100
+CANONICAL_CHANNELS = 2
+CANONICAL_FILENAME = "source.wav"
+METADATA_FILENAME = "source.json"
+
+
+def decode_to_canonical(input_path: str, job_output_dir: str) -> dict:
+    """
+    Decode ``input_path`` into the job's canonical PCM file and record its metadata.
+
+    Blocking; run it in an executor.
+    """
+    output_path = os.path.join(job_output_dir, CANONICAL_FILENAME)
+    tmp_path = f"{output_path}.tmp"
+
+    start = time.time()
+    result = subprocess.run([
+        'ffmpeg', '-y', '-v', 'error', '-i', input_path,
+        '-vn',
+        '-ar', str(CANONICAL_SAMPLE_RATE),
+        '-ac', str(CANONICAL_CHANNELS),
+        '-c:a', 'pcm_s16le',
+        '-f', 'wav', tmp_path
+    ], capture_output=True, text=True)
+    decode_seconds = time.time() - start
+
+    if result.returncode != 0 or not os.path.exists(tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise Exception(f"Could not decode upload: {result.stderr.strip()}")
+    os.replace(tmp_path, output_path)
+
+    layout = waveform.read_pcm_layout(output_path)
+    metadata = {
+        "sampleRate": layout.sample_rate,
+        "channels": layout.channels,
+        "frames": layout.frames,
+        "duration": layout.frames / layout.sample_rate,
+        "decodeSeconds": round(decode_seconds, 3),
+        "sourceBytes": os.path.getsize(input_path),
+    }
+    with open(os.path.join(job_output_dir, METADATA_FILENAME), "w") as f:
+        json.dump(metadata, f)
+    return metadata
+
+
+def read_metadata(job_output_dir: str) -> Optional[dict]:
+    path = os.path.join(job_output_dir, METADATA_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_pcm(path: str) -> np.memmap:
+    """Memory-map a PCM WAV as a read-only ``(frames, channels)`` array."""
+    layout = waveform.read_pcm_layout(path)
+    return np.memmap(
+        path,
+        dtype=layout.dtype,
+        mode="r",
+        offset=layout.data_offset,
+        shape=(layout.frames, layout.channels),
+    )
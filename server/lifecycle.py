@@ -0,0 +1,274 @@
+"""
+Storage lifecycle management for uploads, job outputs and their Redis keys.
+
+Every artifact class has its own retention policy:
+
+- ``upload``: raw uploads in ``uploads/``, removed a fixed time after upload
+- ``partial``: resumable uploads that were never finalized, removed once
+  their upload session has expired
+- ``intermediate``: scratch files inside a job directory (e.g. the MP3 that
+  is sent to Whisper), removed shortly after they were written
+- ``output``: whole ``outputs/<job_id>/`` directories, removed once they have
+  not been accessed for the retention period
+
+On top of that an optional disk quota evicts the least-recently-accessed job
+outputs until usage drops below the low watermark. Jobs that are still
+uploading or processing are never touched, and neither are jobs whose outputs
+are leased by work that runs after the job finished (e.g. separating extra
+stems). Last-access times and leases live in Redis so that all workers share
+them.
+"""
+
+import fnmatch
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+ACCESS_KEY = "lifecycle:access"
+# Holders (e.g. stem models being separated) that keep a finished job's outputs
+LEASE_KEY = "lifecycle:lease:{job_id}"
+ACTIVE_STATES = {"uploaded", "processing"}
+
+# Scratch files that are safe to delete once a job has moved on
+INTERMEDIATE_PATTERNS = ("*_converted.mp3", "*_voiced.wav", "*.tmp", "*.tmp.npz")
+
+# Fraction of the quota to evict down to, so we don't evict on every sweep
+QUOTA_LOW_WATERMARK = 0.9
+
+
+class LifecycleConfig(NamedTuple):
+    upload_ttl: float
+    intermediate_ttl: float
+    output_ttl: float
+    disk_quota_bytes: int
+    sweep_interval: float
+    upload_session_ttl: float = 86400
+
+    @property
+    def key_ttl(self) -> Optional[int]:
+        """Expiry for job/project Redis keys; they live as long as the outputs."""
+        return int(self.output_ttl) if self.output_ttl > 0 else None
+
+
+def load_config() -> LifecycleConfig:
+    return LifecycleConfig(
+        upload_ttl=float(os.getenv("UPLOAD_RETENTION_HOURS", "24")) * 3600,
+        intermediate_ttl=float(os.getenv("INTERMEDIATE_RETENTION_HOURS", "1")) * 3600,
+        output_ttl=float(os.getenv("OUTPUT_RETENTION_DAYS", "30")) * 86400,
+        disk_quota_bytes=int(float(os.getenv("OUTPUT_DISK_QUOTA_MB", "0")) * 1024 * 1024),
+        sweep_interval=float(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", "600")),
+        upload_session_ttl=float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")) * 3600,
+    )
+
+
+class SweeperMetrics:
+    """Counters describing what the sweeper has done since startup."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.last_sweep_at = None
+        self.last_sweep_seconds = None
+        self.files_removed: Dict[str, int] = {"upload": 0, "partial": 0, "intermediate": 0, "output": 0}
+        self.bytes_freed: Dict[str, int] = {"upload": 0, "partial": 0, "intermediate": 0, "output": 0}
+        self.quota_evictions = 0
+        self.errors = 0
+        self.upload_bytes = 0
+        self.output_bytes = 0
+
+    def removed(self, artifact_class: str, files: int, size: int):
+        with self._lock:
+            self.files_removed[artifact_class] += files
+            self.bytes_freed[artifact_class] += size
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "sweeps": self.sweeps,
+                "lastSweepAt": self.last_sweep_at,
+                "lastSweepSeconds": self.last_sweep_seconds,
+                "filesRemoved": dict(self.files_removed),
+                "bytesFreed": dict(self.bytes_freed),
+                "quotaEvictions": self.quota_evictions,
+                "errors": self.errors,
+                "uploadBytes": self.upload_bytes,
+                "outputBytes": self.output_bytes,
+            }
+
+
+def record_access(redis_client, job_id: str, config: LifecycleConfig):
+    """Mark a job's outputs as used now and push back the expiry of its Redis keys."""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.zadd(ACCESS_KEY, {job_id: time.time()})
+        if config.key_ttl:
+            pipe.expire(f"job:{job_id}", config.key_ttl)
+            pipe.expire(f"project:{job_id}", config.key_ttl)
+        pipe.execute()
+    except Exception as e:
+        print(f"[WARNING] Failed to record access for job {job_id}: {e}")
+
+
+def acquire_lease(redis_client, job_id: str, holder: str, ttl: int):
+    """
+    Keep the sweeper off a job's outputs until ``release_lease``. The lease
+    expires after ``ttl`` seconds in case its holder never releases it.
+    """
+    key = LEASE_KEY.format(job_id=job_id)
+    pipe = redis_client.pipeline()
+    pipe.sadd(key, holder)
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def release_lease(redis_client, job_id: str, holder: str):
+    try:
+        redis_client.srem(LEASE_KEY.format(job_id=job_id), holder)
+    except Exception as e:
+        print(f"[WARNING] Failed to release lease {holder} on job {job_id}: {e}")
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _is_active(redis_client, job_id: str) -> bool:
+    try:
+        data = redis_client.get(f"job:{job_id}")
+    except Exception:
+        # If we can't tell, leave the job alone
+        return True
+    if not data:
+        return False
+    return json.loads(data).get("state") in ACTIVE_STATES
+
+
+def _is_leased(redis_client, job_id: str) -> bool:
+    try:
+        return bool(redis_client.exists(LEASE_KEY.format(job_id=job_id)))
+    except Exception:
+        return True
+
+
+def _has_upload_session(redis_client, upload_id: str) -> bool:
+    try:
+        return bool(redis_client.exists(f"upload:{upload_id}"))
+    except Exception:
+        return True
+
+
+def _last_access(redis_client, job_id: str, fallback: float) -> float:
+    try:
+        score = redis_client.zscore(ACCESS_KEY, job_id)
+    except Exception:
+        score = None
+    return score if score is not None else fallback
+
+
+def evict_job(redis_client, output_dir: str, job_id: str) -> int:
+    """Delete a job's outputs and Redis records. Returns the number of bytes freed."""
+    job_dir = os.path.join(output_dir, job_id)
+    size = _tree_size(job_dir)
+    shutil.rmtree(job_dir, ignore_errors=True)
+    try:
+        redis_client.delete(f"job:{job_id}", f"project:{job_id}")
+        redis_client.zrem(ACCESS_KEY, job_id)
+    except Exception as e:
+        print(f"[WARNING] Failed to delete Redis keys for evicted job {job_id}: {e}")
+    return size
+
+
+def sweep(redis_client, upload_dir: str, output_dir: str, config: LifecycleConfig,
+          metrics: SweeperMetrics, now: Optional[float] = None, partial_dir: Optional[str] = None):
+    """Apply every retention policy and the disk quota once."""
+    started = time.time()
+    now = now if now is not None else started
+
+    # Raw uploads
+    upload_bytes = 0
+    for entry in os.scandir(upload_dir):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        job_id = os.path.splitext(entry.name)[0]
+        if config.upload_ttl > 0 and now - stat.st_mtime > config.upload_ttl and not _is_active(redis_client, job_id):
+            try:
+                os.remove(entry.path)
+                metrics.removed("upload", 1, stat.st_size)
+                continue
+            except OSError:
+                metrics.errors += 1
+        upload_bytes += stat.st_size
+
+    # Abandoned resumable uploads; a live session keeps its partial file
+    if partial_dir and os.path.isdir(partial_dir):
+        for entry in os.scandir(partial_dir):
+            if not entry.is_file() or not entry.name.endswith(".part"):
+                continue
+            stat = entry.stat()
+            upload_id = entry.name[:-len(".part")]
+            if now - stat.st_mtime > config.upload_session_ttl and not _has_upload_session(redis_client, upload_id):
+                try:
+                    os.remove(entry.path)
+                    metrics.removed("partial", 1, stat.st_size)
+                    continue
+                except OSError:
+                    metrics.errors += 1
+            upload_bytes += stat.st_size
+
+    # Job outputs and their intermediates
+    jobs = []
+    for entry in os.scandir(output_dir):
+        if not entry.is_dir():
+            continue
+        job_id = entry.name
+        if _is_active(redis_client, job_id) or _is_leased(redis_client, job_id):
+            continue
+
+        for name in os.listdir(entry.path):
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in INTERMEDIATE_PATTERNS):
+                continue
+            path = os.path.join(entry.path, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > config.intermediate_ttl:
+                    os.remove(path)
+                    metrics.removed("intermediate", 1, stat.st_size)
+            except OSError:
+                metrics.errors += 1
+
+        last_access = _last_access(redis_client, job_id, entry.stat().st_mtime)
+        if config.output_ttl > 0 and now - last_access > config.output_ttl:
+            metrics.removed("output", 1, evict_job(redis_client, output_dir, job_id))
+            continue
+        jobs.append((last_access, job_id, _tree_size(entry.path)))
+
+    # Disk quota: evict least-recently-accessed outputs first
+    output_bytes = sum(size for _, _, size in jobs)
+    if config.disk_quota_bytes > 0 and output_bytes > config.disk_quota_bytes:
+        target = config.disk_quota_bytes * QUOTA_LOW_WATERMARK
+        for _, job_id, size in sorted(jobs):
+            if output_bytes <= target:
+                break
+            freed = evict_job(redis_client, output_dir, job_id)
+            metrics.removed("output", 1, freed)
+            metrics.quota_evictions += 1
+            output_bytes -= size
+            print(f"[INFO] Evicted outputs of job {job_id} ({size} bytes) to stay within disk quota")
+
+    with metrics._lock:
+        metrics.sweeps += 1
+        metrics.last_sweep_at = now
+        metrics.last_sweep_seconds = time.time() - started
+        metrics.upload_bytes = upload_bytes
+        metrics.output_bytes = output_bytes
@@ -0,0 +1,159 @@
+"""
+Load test for the live singing score: how many concurrent singers one core serves.
+
+In-process, against a synthetic song (no server needed):
+
+    python loadtest_scoring.py --singers 1 16 32 64 128
+
+Every 20 ms tick of audio, each singer's chunk is scored one after the other
+on a single thread, as a worker's event loop would. A tick must be done
+before the next one is due for every singer to get real-time feedback.
+Capacity is the chunk length over the mean cost of one singer's chunk; the
+p99 tick shows the jitter at each load.
+
+Against a running worker (one uvicorn worker is one core) and a completed job,
+with an access token of the job's owner:
+
+    python loadtest_scoring.py --url ws://localhost:8000 --job <job_id> --token <token> --singers 8 32
+
+streams real-time microphone chunks from each singer and reports the time
+from sending a chunk to receiving its pitch frames.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import wave
+
+import aiohttp
+import numpy as np
+
+import pitch
+import scoring
+
+SAMPLE_RATE = 44100
+
+
+def synthetic_song(seconds, sample_rate=SAMPLE_RATE):
+    """A melody of semitone steps with vibrato, in phrases separated by rests."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    frequency = 220 * 2 ** (np.round(4 * np.sin(2 * np.pi * t / 7)) / 12) * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    phase = 2 * np.pi * np.cumsum(frequency) / sample_rate
+    voice = 0.4 * np.sin(phase) + 0.15 * np.sin(2 * phase)
+    return (voice * (np.sin(2 * np.pi * t / 4) > -0.3)).astype(np.float32)
+
+
+def singer_takes(song, count, seed=0):
+    """Slightly detuned, noisy takes of the song, one per singer."""
+    rng = np.random.default_rng(seed)
+    takes = []
+    for _ in range(count):
+        detune = 2 ** (rng.normal(0, 20) / 1200)
+        positions = np.arange(0, song.shape[0] - 1, detune)
+        take = np.interp(positions, np.arange(song.shape[0]), song) + 0.01 * rng.standard_normal(positions.shape[0])
+        takes.append(np.clip(take * 32767, -32768, 32767).astype('<i2').tobytes())
+    return takes
+
+
+def build_reference(song, scratch):
+    wav_path = os.path.join(scratch, "vocals.wav")
+    with wave.open(wav_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes((song * 32767).astype('<i2').tobytes())
+    pitch_path = os.path.join(scratch, pitch.PITCH_FILENAME)
+    pitch.write_pitch_file(wav_path, pitch_path)
+    return pitch_path
+
+
+def in_process(singers, seconds, chunk_seconds):
+    chunk_bytes = 2 * int(chunk_seconds * SAMPLE_RATE)
+    song = synthetic_song(seconds)
+    with tempfile.TemporaryDirectory() as scratch:
+        pitch_path = build_reference(song, scratch)
+        print(f"{'singers':>8} {'tick p50 ms':>12} {'tick p99 ms':>12} {'ms/frame':>9} {'core used':>10} {'score':>6}")
+        for count in singers:
+            takes = singer_takes(song, count)
+            sessions = [scoring.LiveScore(scoring.ReferenceMelody.load(pitch_path), SAMPLE_RATE) for _ in takes]
+            ticks = []
+            for position in range(0, min(len(take) for take in takes), chunk_bytes):
+                began = time.perf_counter()
+                for session, take in zip(sessions, takes):
+                    result = session.push(scoring.decode_pcm16(take[position:position + chunk_bytes]))
+                    scoring.pitch_message(result)
+                ticks.append(time.perf_counter() - began)
+            ticks = np.array(ticks) * 1000
+            frames = sum(session.tracker.frames for session in sessions)
+            scores = [session.finish()[1] for session in sessions]
+            print(f"{count:>8} {np.percentile(ticks, 50):>12.2f} {np.percentile(ticks, 99):>12.2f} "
+                  f"{ticks.sum() / frames:>9.3f} {ticks.sum() / 1000 / seconds:>9.0%} {np.mean(scores):>6.1f}")
+        capacity = chunk_seconds * 1000 / (ticks.sum() / len(ticks) / count)
+        print(f"About {capacity:.0f} singers fit on one core at {chunk_seconds * 1000:.0f} ms chunks "
+              f"(mean cost per singer per tick, before protocol and JSON overhead)")
+
+
+async def over_websocket(url, job_id, token, singers, seconds, chunk_seconds):
+    chunk_bytes = 2 * int(chunk_seconds * SAMPLE_RATE)
+    takes = singer_takes(synthetic_song(seconds), max(singers))
+
+    async def singer(session, take, latencies):
+        params = {"sample_rate": SAMPLE_RATE, "token": token}
+        async with session.ws_connect(f"{url}/api/score/{job_id}", params=params) as ws:
+            ready = await ws.receive_json()
+            if ready["type"] != "ready":
+                raise RuntimeError(ready.get("detail"))
+            sent = []
+
+            async def receive():
+                async for message in ws:
+                    data = message.json()
+                    if data["type"] == "pitch" and sent:
+                        # Answers the latest chunk; a chunk too short to complete a frame gets none
+                        latencies.append(time.perf_counter() - sent[-1])
+                    elif data["type"] == "summary":
+                        return data
+
+            receiver = asyncio.create_task(receive())
+            started = time.perf_counter()
+            for index, position in enumerate(range(0, len(take), chunk_bytes)):
+                # Real-time pacing, like a microphone
+                await asyncio.sleep(max(0.0, started + index * chunk_seconds - time.perf_counter()))
+                sent[:] = [time.perf_counter()]
+                await ws.send_bytes(take[position:position + chunk_bytes])
+            await ws.send_str("end")
+            return await receiver
+
+    print(f"{'singers':>8} {'p50 ms':>8} {'p99 ms':>8} {'score':>6}")
+    async with aiohttp.ClientSession() as session:
+        for count in singers:
+            latencies = []
+            summaries = await asyncio.gather(*(singer(session, take, latencies) for take in takes[:count]))
+            latencies = np.array(latencies) * 1000
+            scores = [summary["score"] or 0 for summary in summaries]
+            print(f"{count:>8} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f} "
+                  f"{np.mean(scores):>6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--singers', type=int, nargs='+', default=[1, 16, 32, 64, 128])
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--chunk-ms', type=float, default=20)
+    parser.add_argument('--url', help="Base ws:// URL of a running worker")
+    parser.add_argument('--job', help="Completed job whose vocals to sing against, with --url")
+    parser.add_argument('--token', help="Access token of the job's owner, with --url")
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.job or not args.token:
+            parser.error("--url needs --job and --token")
+        asyncio.run(over_websocket(args.url.rstrip('/'), args.job, args.token, args.singers, args.seconds, args.chunk_ms / 1000))
+    else:
+        in_process(args.singers, args.seconds, args.chunk_ms / 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Time-indexed lyrics lookup.
+
+Lyric lines and (when Whisper returns them) individual words are kept in
+parallel NumPy arrays sorted by start time. Window queries use binary search
+over the start times plus a running maximum of the end times, so looking up
+the lines/words active in ``[start, end)`` costs O(log n + k) no matter how
+long the song is.
+
+The index is stored next to ``lyrics.json`` as an uncompressed ``.npz`` file.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+LYRICS_INDEX_FILENAME = "lyrics_index.npz"
+
+# Number of loaded indexes kept in memory per process
+INDEX_CACHE_SIZE = 64
+
+
+def build_lyrics(segments: List[dict], words: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Convert Whisper segments (and optional word timings) into lyric lines.
+
+    Every word is attached to the segment containing its midpoint. Lines
+    keep the ``startTime``/``endTime``/``text`` shape the client already
+    uses; ``words`` is only added when word timings are available.
+    """
+    lyrics = [
+        {
+            "startTime": segment["start"],
+            "endTime": segment["end"],
+            "text": segment["text"]
+        }
+        for segment in sorted(segments, key=lambda s: s["start"])
+    ]
+    if not words or not lyrics:
+        return lyrics
+
+    line_starts = np.array([line["startTime"] for line in lyrics], dtype=np.float64)
+    word_starts = np.array([word["start"] for word in words], dtype=np.float64)
+    word_ends = np.array([word["end"] for word in words], dtype=np.float64)
+    owners = np.searchsorted(line_starts, (word_starts + word_ends) / 2, side="right") - 1
+    owners = np.clip(owners, 0, len(lyrics) - 1)
+
+    for line in lyrics:
+        line["words"] = []
+    for word, owner in zip(words, owners.tolist()):
+        lyrics[owner]["words"].append({
+            "startTime": word["start"],
+            "endTime": word["end"],
+            "text": word["word"]
+        })
+    return lyrics
+
+
+class LyricsIndex:
+    """Array-backed index over lyric lines and words."""
+
+    def __init__(self, arrays: dict):
+        self.line_starts = arrays["line_starts"]
+        self.line_ends = arrays["line_ends"]
+        self.line_texts = arrays["line_texts"]
+        self.word_starts = arrays["word_starts"]
+        self.word_ends = arrays["word_ends"]
+        self.word_texts = arrays["word_texts"]
+        self.word_lines = arrays["word_lines"]
+        # Running maxima make "first item ending after t" a binary search
+        # even when items overlap or are not sorted by end time.
+        self._line_max_ends = np.maximum.accumulate(self.line_ends) if len(self.line_ends) else self.line_ends
+        self._word_max_ends = np.maximum.accumulate(self.word_ends) if len(self.word_ends) else self.word_ends
+
+    @classmethod
+    def from_lyrics(cls, lyrics: List[dict]) -> "LyricsIndex":
+        lines = sorted(lyrics, key=lambda line: line["startTime"])
+        word_rows = [
+            (word["startTime"], word["endTime"], word["text"], line_no)
+            for line_no, line in enumerate(lines)
+            for word in line.get("words", [])
+        ]
+        word_rows.sort(key=lambda row: row[0])
+        return cls({
+            "line_starts": np.array([line["startTime"] for line in lines], dtype=np.float64),
+            "line_ends": np.array([line["endTime"] for line in lines], dtype=np.float64),
+            "line_texts": np.array([line["text"] for line in lines], dtype=np.str_),
+            "word_starts": np.array([row[0] for row in word_rows], dtype=np.float64),
+            "word_ends": np.array([row[1] for row in word_rows], dtype=np.float64),
+            "word_texts": np.array([row[2] for row in word_rows], dtype=np.str_),
+            "word_lines": np.array([row[3] for row in word_rows], dtype=np.int32),
+        })
+
+    @classmethod
+    def load(cls, path: str) -> "LyricsIndex":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            line_starts=self.line_starts,
+            line_ends=self.line_ends,
+            line_texts=self.line_texts,
+            word_starts=self.word_starts,
+            word_ends=self.word_ends,
+            word_texts=self.word_texts,
+            word_lines=self.word_lines,
+        )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _window(starts: np.ndarray, ends: np.ndarray, max_ends: np.ndarray, start: float, end: float) -> np.ndarray:
+        """Indices of the items overlapping ``[start, end)``."""
+        lo = int(np.searchsorted(max_ends, start, side="right"))
+        hi = int(np.searchsorted(starts, end, side="left"))
+        if hi <= lo:
+            return np.empty(0, dtype=np.intp)
+        candidates = np.arange(lo, hi)
+        return candidates[ends[lo:hi] > start]
+
+    def query(self, start: float, end: float) -> dict:
+        """Lines overlapping ``[start, end)``, each with its words that overlap the window."""
+        line_ids = self._window(self.line_starts, self.line_ends, self._line_max_ends, start, end)
+        word_ids = self._window(self.word_starts, self.word_ends, self._word_max_ends, start, end)
+
+        lines = {}
+        for i in line_ids.tolist():
+            lines[i] = {
+                "index": i,
+                "startTime": float(self.line_starts[i]),
+                "endTime": float(self.line_ends[i]),
+                "text": str(self.line_texts[i]),
+                "words": []
+            }
+        for i in word_ids.tolist():
+            line = lines.get(int(self.word_lines[i]))
+            if line is not None:
+                line["words"].append({
+                    "startTime": float(self.word_starts[i]),
+                    "endTime": float(self.word_ends[i]),
+                    "text": str(self.word_texts[i])
+                })
+        return {"start": start, "end": end, "lines": list(lines.values())}
+
+
+_index_cache: "OrderedDict[tuple, LyricsIndex]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def load_lyrics_index(job_output_dir: str) -> Optional[LyricsIndex]:
+    """
+    Load the lyrics index for a job, building it from ``lyrics.json`` for
+    jobs processed before the index existed. Loaded indexes are cached per
+    file modification time.
+    """
+    index_path = os.path.join(job_output_dir, LYRICS_INDEX_FILENAME)
+    lyrics_path = os.path.join(job_output_dir, "lyrics.json")
+    source = index_path if os.path.exists(index_path) else lyrics_path
+    if not os.path.exists(source):
+        return None
+
+    key = (source, os.path.getmtime(source))
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    if source == index_path:
+        index = LyricsIndex.load(index_path)
+    else:
+        with open(lyrics_path) as f:
+            index = LyricsIndex.from_lyrics(json.load(f))
+
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
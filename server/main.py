@@ -1,13 +1,18 @@
-from fastapi import FastAPI, UploadFile, HTTPException, BackgroundTasks, Depends, Cookie, status
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, HTTPException, BackgroundTasks, Depends, Cookie, Header, Request, status
+from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 import os
 import uuid
 import aiofiles
 import json
-from typing import Optional, Dict, List, Union
+from typing import Optional, Dict, List, Tuple, Union
+from enum import Enum
 import aiohttp
 import redis
 from dotenv import load_dotenv
@@ -16,6 +21,7 @@ import openai  # Import only the openai module
 from fastapi.openapi.utils import get_openapi
 import asyncio
 import subprocess
+import shutil
 import sys
 from fastapi.staticfiles import StaticFiles
 import logging
@@ -23,11 +29,41 @@ from datetime import datetime, timedelta
 from passlib.context import CryptContext
 import jwt
 import secrets
+import hmac
+import collections
+import waveform
+import lyrics_index
+import lifecycle
+import ingest
+from spleeter_pool import BackendBusy, BackendUnavailable, SpleeterPool
+import http_client
+import resumable
+import users
+import startup
+import tracing
+import profiler
+import scheduler
+import singleflight
+import checkpoints
+import batches
+import contextvars
+import voicing
+import pitch
+import scoring
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
 
 load_dotenv()
 
+# Import and startup hook timings, and whether this process may take traffic
+startup_tracker = startup.StartupTracker(_import_started)
+
 # JWT Configuration
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_hex(32))
+SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+if not SECRET_KEY:
+    # Tokens from one worker won't validate on another with a per-process key
+    print("[WARNING] JWT_SECRET_KEY is not set; using a random key. Set it when running more than one worker")
+    SECRET_KEY = secrets.token_hex(32)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # Configure logging
@@ -37,6 +73,10 @@ logger = logging.getLogger(__name__)
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
+# bcrypt releases the GIL, so a few threads hash on separate cores without
+# blocking the event loop; the pool size bounds the CPU spent on logins
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 # User models
 class UserBase(BaseModel):
@@ -63,16 +103,12 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
     
-# User database (in-memory for simplicity, replace with proper database)
-users_db = {}
-
-# Check if ffmpeg is available for audio conversion
-try:
-    ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
-    print(f"[INFO] ffmpeg is available: {ffmpeg_version.stdout.splitlines()[0]}")
-except Exception as e:
-    print(f"[WARNING] ffmpeg not found. Audio conversion fallback will not work: {e}")
-    print("[WARNING] Please install ffmpeg for better audio compatibility with Whisper API")
+# Users are shared by all workers through Redis, cached briefly per process
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# Verified access tokens, so repeat requests skip JWT decoding
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
 
 # Initialize FastAPI
 app = FastAPI()
@@ -91,8 +127,11 @@ UPLOAD_DIR = "uploads"
 OUTPUT_DIR = "outputs"
 TEST_DATA_DIR = "test_data"  # Relative to the app directory
 
+PARTIAL_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "partial")
+
 # Create directories
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(PARTIAL_UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(TEST_DATA_DIR, exist_ok=True)
 
@@ -110,8 +149,22 @@ app.mount("/test_data", StaticFiles(directory=TEST_DATA_DIR), name="test_data")
 api_key = os.getenv("OPEN_AI_API_KEY")
 openai.api_key = api_key  # Set the API key at the module level
 
+# Ask Whisper for word-level timestamps in addition to segments
+WHISPER_WORD_TIMESTAMPS = os.getenv("WHISPER_WORD_TIMESTAMPS", "true").lower() == "true"
+
+# What lyrics-only jobs transcribe: the original "mix" (no separation at all)
+# or the separated "vocals" (slower, but Whisper hears less accompaniment)
+LYRICS_MODE_SOURCE = os.getenv("LYRICS_MODE_SOURCE", "mix").lower()
+
+# Send Whisper only the voiced regions of the vocals stem
+VOICED_COMPACTION = os.getenv("VOICED_COMPACTION", "true").lower() == "true"
+
 # Create a simple function to call the API
 async def transcribe_audio(audio_file_path):
+    with tracer.span("whisper", file=os.path.basename(audio_file_path)):
+        return await _transcribe_audio(audio_file_path)
+
+async def _transcribe_audio(audio_file_path):
     # This is a blocking operation, so we'll run it in a thread pool
     import asyncio
     loop = asyncio.get_event_loop()
@@ -121,33 +174,6 @@ async def transcribe_audio(audio_file_path):
         print(f"[DEBUG] File exists: {os.path.exists(audio_file_path)}")
         print(f"[DEBUG] File size: {os.path.getsize(audio_file_path)} bytes")
         
-        # Debug information about the file
-        try:
-            import wave
-            try:
-                with wave.open(audio_file_path, 'rb') as wave_file:
-                    channels = wave_file.getnchannels()
-                    sample_width = wave_file.getsampwidth()
-                    frame_rate = wave_file.getframerate()
-                    frames = wave_file.getnframes()
-                    duration = frames / frame_rate
-                    print(f"[DEBUG] WAV file details: channels={channels}, sample_width={sample_width}, frame_rate={frame_rate}, frames={frames}, duration={duration:.2f}s")
-            except Exception as wave_err:
-                print(f"[DEBUG] Not a valid WAV file or error reading WAV metadata: {str(wave_err)}")
-                
-                # Try with FFmpeg if available
-                import subprocess
-                try:
-                    result = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 
-                                            'format=duration,size,bit_rate:stream=codec_name,codec_type,sample_rate,channels,bits_per_sample', 
-                                            '-of', 'json', audio_file_path], 
-                                           capture_output=True, text=True)
-                    print(f"[DEBUG] FFprobe result: {result.stdout}")
-                except Exception as ffmpeg_err:
-                    print(f"[DEBUG] Error running ffprobe: {str(ffmpeg_err)}")
-        except ImportError:
-            print("[DEBUG] Wave module not available for debugging")
-            
         try:
             print("[DEBUG] Opening file for Whisper API...")
             with open(audio_file_path, "rb") as audio_file:
@@ -157,12 +183,17 @@ async def transcribe_audio(audio_file_path):
                 print(f"[DEBUG] First 16 bytes of file: {first_bytes.hex()}")
                 
                 print("[DEBUG] Calling Whisper API...")
+                extra_params = {}
+                if WHISPER_WORD_TIMESTAMPS:
+                    # Multipart list field, sent as repeated "timestamp_granularities[]" values
+                    extra_params["timestamp_granularities[]"] = ["word", "segment"]
                 # Use the module-level API
                 response = openai.Audio.transcribe(
                     "whisper-1",
                     audio_file,
                     response_format="verbose_json",
-                    file_format=os.path.splitext(audio_file_path)[1][1:].lower()  # Extract format from filename
+                    file_format=os.path.splitext(audio_file_path)[1][1:].lower(),  # Extract format from filename
+                    **extra_params
                 )
                 print("[DEBUG] Whisper API call completed successfully")
                 return response
@@ -175,15 +206,185 @@ async def transcribe_audio(audio_file_path):
 
 SPLEETER_API_URL = os.getenv("SPLEETER_API_URL", "http://localhost:8000")
 
+# Comma-separated Spleeter instances to balance jobs across; defaults to SPLEETER_API_URL alone
+SPLEETER_API_URLS = [
+    url.strip() for url in os.getenv("SPLEETER_API_URLS", SPLEETER_API_URL).split(",") if url.strip()
+]
+spleeter_pool = SpleeterPool(
+    SPLEETER_API_URLS,
+    max_attempts=int(os.getenv("SPLEETER_MAX_ATTEMPTS", "3")),
+    health_interval=float(os.getenv("SPLEETER_HEALTH_INTERVAL_SECONDS", "10"))
+)
+# Responses that mean "this instance can't take the job right now", not "the job is bad".
+# 503 is Spleeter's own concurrency limit: the instance is busy, not failing.
+SPLEETER_BUSY_STATUS = 503
+SPLEETER_RETRY_STATUSES = {502, SPLEETER_BUSY_STATUS, 504}
+
+# Shared client pool for Spleeter traffic. The read timeout bounds silence on
+# the socket, which covers the whole separation before the first stem byte.
+SPLEETER_CONNECT_TIMEOUT = float(os.getenv("SPLEETER_CONNECT_TIMEOUT_SECONDS", "10"))
+SPLEETER_READ_TIMEOUT = float(os.getenv("SPLEETER_READ_TIMEOUT_SECONDS", "900"))
+SPLEETER_MAX_CONNECTIONS = int(os.getenv("SPLEETER_MAX_CONNECTIONS", "32"))
+SPLEETER_MAX_CONNECTIONS_PER_HOST = int(os.getenv("SPLEETER_MAX_CONNECTIONS_PER_HOST", "8"))
+SPLEETER_KEEPALIVE_SECONDS = float(os.getenv("SPLEETER_KEEPALIVE_SECONDS", "60"))
+http_metrics = http_client.ClientMetrics()
+# Separation stage latency per tier, including failover and stem download
+separation_metrics = collections.defaultdict(http_client.EndpointStats)
+_http_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the application-wide client session, creating it on first use."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = http_client.create_session(
+            http_metrics,
+            connect_timeout=SPLEETER_CONNECT_TIMEOUT,
+            read_timeout=SPLEETER_READ_TIMEOUT,
+            max_connections=SPLEETER_MAX_CONNECTIONS,
+            max_connections_per_host=SPLEETER_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=SPLEETER_KEEPALIVE_SECONDS
+        )
+    return _http_session
+
+# Read size when streaming stems from Spleeter to disk
+STEM_CHUNK_SIZE = 1024 * 1024
+# Read size when copying an uploaded file to disk
+UPLOAD_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Stems that get a precomputed waveform peaks file after separation
+PEAK_STEMS = ("vocals", "accompaniment")
+
+# Pitch analysis is CPU-bound NumPy work, so it runs in worker processes off the event loop.
+# Spawned rather than forked, since this process runs threads.
+PITCH_WORKERS = int(os.getenv("PITCH_WORKERS", str(min(2, os.cpu_count() or 1))))
+pitch_executor = ProcessPoolExecutor(max_workers=PITCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+# Extra stems separated on first request, and the Spleeter multi-stem model each one comes from
+EXTRA_STEMS = {"drums": "4stems", "bass": "4stems", "piano": "5stems"}
+# Lease that keeps the storage sweeper off a job while its extra stems are
+# separated; covers the wait for a job slot as well as the separation
+EXTRA_STEM_LEASE_SECONDS = int(os.getenv("EXTRA_STEM_LEASE_SECONDS", "3600"))
+# One separation per (job, model) at a time; later requests wait for it
+extra_stem_tasks: Dict[Tuple[str, str], asyncio.Future] = {}
+
+# Live singing score sessions per worker. Chunks are analysed on the event loop:
+# one takes a fraction of a millisecond, less than handing it to an executor would
+LIVE_SCORE_MAX_SESSIONS = int(os.getenv("LIVE_SCORE_MAX_SESSIONS", "32"))
+# Processing time per sung frame above which a chunk counts as over budget
+LIVE_SCORE_FRAME_BUDGET_MS = float(os.getenv("LIVE_SCORE_FRAME_BUDGET_MS", "2"))
+# Longest microphone chunk accepted, which bounds the work done per message
+LIVE_SCORE_MAX_CHUNK_SECONDS = 0.5
+live_score_sessions = 0
+
 # Configure Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
 redis_client = redis.from_url(REDIS_URL)
 
+user_store = users.UserStore(redis_client, USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+token_cache = users.LocalCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS)
+
+# Retention policies, disk quota and Redis key expiry for stored artifacts
+STORAGE_LIFECYCLE = lifecycle.load_config()
+storage_metrics = lifecycle.SweeperMetrics()
+
+# Per-job traces: spans go to a JSON-lines file for a collector and to Redis for /api/jobs/{id}/timeline,
+# written in batches from a background thread. The file defaults to traces/ beside uploads/ and outputs/.
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "api-spans.jsonl"))
+TRACE_FILE = os.path.abspath(TRACE_FILE) if TRACE_FILE else None
+TRACE_FLUSH_INTERVAL_SECONDS = float(os.getenv("TRACE_FLUSH_INTERVAL_SECONDS", "1"))
+trace_exporter = tracing.BufferedExporter([
+    *([tracing.FileExporter(TRACE_FILE)] if TRACE_FILE else []),
+    tracing.RedisTimelineExporter(redis_client, STORAGE_LIFECYCLE.key_ttl)
+], flush_interval=TRACE_FLUSH_INTERVAL_SECONDS)
+tracer = tracing.Tracer("api", [trace_exporter])
+
+class ProcessingMode(str, Enum):
+    full = "full"                   # separation and transcription
+    instrumental = "instrumental"   # separation only, no Whisper
+    lyrics = "lyrics"               # transcription only, of LYRICS_MODE_SOURCE
+
+class SeparationTier(str, Enum):
+    fast = "fast"          # narrower-bandwidth model, quicker turnaround
+    quality = "quality"    # full-bandwidth model
+
+DEFAULT_SEPARATION_TIER = SeparationTier(os.getenv("DEFAULT_SEPARATION_TIER", "fast"))
+
+class JobPriority(str, Enum):
+    interactive = "interactive"   # a user waiting on a single upload
+    batch = "batch"               # bulk imports
+
+# Jobs are started by a fair-share scheduler instead of all at once
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "4"))
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", "2"))
+job_scheduler = scheduler.JobScheduler(
+    max_concurrent=MAX_CONCURRENT_JOBS,
+    max_per_user=MAX_JOBS_PER_USER,
+    class_weights={
+        JobPriority.interactive.value: float(os.getenv("INTERACTIVE_WEIGHT", "8")),
+        JobPriority.batch.value: float(os.getenv("BATCH_WEIGHT", "1")),
+    }
+)
+
+# Concurrent jobs for the same audio and options share one pipeline
+job_flights = singleflight.SingleFlight()
+
+# Batch (album) uploads: the batch of each child job this worker queued, until the batch
+# finishes or its Redis key expires
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "50"))
+job_batches: Dict[str, batches.Batch] = {}
+# Spleeter affinity key of the job being run; children of a batch share one
+spleeter_affinity: contextvars.ContextVar = contextvars.ContextVar("spleeter_affinity", default=None)
+
+# A stage that fails with a transient error is retried in place this many times
+STAGE_MAX_RETRIES = int(os.getenv("STAGE_MAX_RETRIES", "2"))
+STAGE_RETRY_BACKOFF_SECONDS = float(os.getenv("STAGE_RETRY_BACKOFF_SECONDS", "2"))
+
+TRANSIENT_ERRORS = (
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    ConnectionError,
+    BackendUnavailable,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    openai.error.APIConnectionError,
+    openai.error.APIError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+)
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether `error`, or an error it was raised from, is worth retrying."""
+    while error is not None:
+        if isinstance(error, TRANSIENT_ERRORS):
+            return True
+        error = error.__cause__
+    return False
+
+# Resumable uploads
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE_BYTES", str(5 * 1024 * 1024)))
+MAX_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    chunkSize: Optional[int] = None
+    mode: ProcessingMode = ProcessingMode.full
+    tier: SeparationTier = DEFAULT_SEPARATION_TIER
+    priority: JobPriority = JobPriority.interactive
+
 class ProcessingStatus(BaseModel):
     state: str
     progress: Optional[float] = None
     error: Optional[str] = None
     message: Optional[str] = None
+    mode: Optional[ProcessingMode] = None
+    tier: Optional[SeparationTier] = None
+    priority: Optional[JobPriority] = None
+    # Jobs ahead of this one in the scheduler, while it waits to start
+    queuePosition: Optional[int] = None
+    # Per-stage checkpoints: state, artifacts and retry count
+    stages: Optional[Dict[str, dict]] = None
 
 # Use Redis for job storage
 def get_job_status(job_id: str) -> Optional[ProcessingStatus]:
@@ -197,28 +398,50 @@ def get_job_status(job_id: str) -> Optional[ProcessingStatus]:
 def set_job_status(job_id: str, status: ProcessingStatus):
     try:
         # Store status in Redis
-        redis_client.set(f"job:{job_id}", status.json())
+        redis_client.set(f"job:{job_id}", status.json(), ex=STORAGE_LIFECYCLE.key_ttl)
         print(f"Job {job_id} status updated: {status.state}")
     except Exception as e:
         print(f"Error in set_job_status: {e}")
+    batch = job_batches.get(job_id)
+    if batch is not None and batch.expired():
+        # Its aggregate status is gone from Redis; don't bring it back for one late child
+        for child_id in batch.children:
+            job_batches.pop(child_id, None)
+    elif batch is not None:
+        update_batch_status(batch, job_id, status)
+
+def update_batch_status(batch: batches.Batch, job_id: str, status: ProcessingStatus):
+    """Fold a child's status into its batch's aggregate status."""
+    if not batch.update(job_id, status.state, status.progress):
+        return
+    try:
+        batch.save(redis_client, STORAGE_LIFECYCLE.key_ttl)
+    except Exception as e:
+        print(f"Error saving status of batch {batch.batch_id}: {e}")
+    if batch.done:
+        print(f"[INFO] Batch {batch.batch_id} finished: {batch.state()}")
+        for child_id in batch.children:
+            job_batches.pop(child_id, None)
 
 # Authentication helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(password_hash_executor, pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(password_hash_executor, pwd_context.hash, password)
 
 def get_user(username: str):
-    if username in users_db:
-        user_dict = users_db[username]
-        return UserInDB(**user_dict)
+    record = user_store.get(username)
+    if record:
+        return UserInDB.parse_raw(record)
 
-def authenticate_user(username: str, password: str):
+async def authenticate_user(username: str, password: str):
     user = get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -238,14 +461,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    username = token_cache.get(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except jwt.PyJWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except jwt.PyJWTError:
-        raise credentials_exception
+        # Never serve a token from the cache past its own expiry; one without
+        # an expiry is cached for the cache's own TTL
+        expires_at = time.monotonic() + payload["exp"] - time.time() if "exp" in payload else None
+        token_cache.put(token, username, expires_at=expires_at)
+    token_data = TokenData(username=username)
     user = get_user(token_data.username)
     if user is None:
         raise credentials_exception
@@ -276,13 +505,13 @@ async def health_check():
 # Authentication endpoints
 @app.post("/api/auth/register", response_model=User)
 async def register(user: UserCreate):
-    if user.username in users_db:
+    if get_user(user.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     user_id = str(uuid.uuid4())
     user_obj = UserInDB(
         id=user_id,
@@ -292,8 +521,12 @@ async def register(user: UserCreate):
         created_at=datetime.utcnow()
     )
     
-    # Store in the in-memory db (in a real app, you'd use a database)
-    users_db[user.username] = user_obj.dict()
+    # Another worker may have registered the same name while we were hashing
+    if not user_store.create(user.username, user_obj.json()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already registered"
+        )
     
     # Return user without the hashed_password
     return User(
@@ -305,7 +538,7 @@ async def register(user: UserCreate):
 
 @app.post("/api/auth/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -325,184 +558,420 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 async def save_upload_file(upload_file: UploadFile, destination: str):
+    # A chunk at a time, so an upload never sits in memory whole
     async with aiofiles.open(destination, 'wb') as out_file:
-        content = await upload_file.read()
-        await out_file.write(content)
+        while True:
+            chunk = await upload_file.read(UPLOAD_COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            await out_file.write(chunk)
+
+async def generate_waveform_peaks(job_output_dir: str):
+    """Write a peaks file next to each separated stem so clients can draw waveforms without the WAVs."""
+    loop = asyncio.get_event_loop()
+    for stem in PEAK_STEMS:
+        wav_path = os.path.join(job_output_dir, f"{stem}.wav")
+        if not os.path.exists(wav_path):
+            continue
+        peaks_path = os.path.join(job_output_dir, f"{stem}{waveform.PEAKS_EXTENSION}")
+        try:
+            await loop.run_in_executor(None, waveform.write_peaks_file, wav_path, peaks_path)
+            print(f"[DEBUG] Waveform peaks saved at: {peaks_path}, size: {os.path.getsize(peaks_path)} bytes")
+        except Exception as e:
+            # Peaks are a convenience for the client, never fail the job over them
+            print(f"[WARNING] Failed to compute waveform peaks for {stem}: {str(e)}")
 
-async def process_audio(job_id: str, input_path: str):
+async def extract_pitch_contour(job_output_dir: str):
+    """Store the vocal pitch contour used to score singing against."""
+    vocals_path = os.path.join(job_output_dir, "vocals.wav")
+    if not os.path.exists(vocals_path):
+        return
+    loop = asyncio.get_event_loop()
     try:
-        # Create output directory for this job
-        job_output_dir = os.path.join(OUTPUT_DIR, job_id)
-        os.makedirs(job_output_dir, exist_ok=True)
+        result = await loop.run_in_executor(pitch_executor, pitch.write_pitch_file, vocals_path,
+                                            os.path.join(job_output_dir, pitch.PITCH_FILENAME))
+        print(f"[DEBUG] Pitch contour saved: {result['frames']} frames, {result['voicedFrames']} voiced")
+    except Exception as e:
+        # Like peaks, scoring data is never worth failing the job over
+        print(f"[WARNING] Failed to extract pitch contour: {str(e)}")
+
+async def receive_stems(response: aiohttp.ClientResponse, job_output_dir: str):
+    """
+    Read a multipart/mixed separation response, writing each stem part
+    straight to `<stem>.wav` in the job directory as it arrives.
 
-        # Update job status
-        set_job_status(job_id, ProcessingStatus(state="processing", progress=0.1))
+    Returns the separation metadata and the paths of the stems received.
+    """
+    metadata = {}
+    stems = {}
+    reader = aiohttp.MultipartReader.from_response(response)
+    async for part in reader:
+        if part.headers.get(aiohttp.hdrs.CONTENT_TYPE, "").startswith("application/json"):
+            metadata = await part.json()
+            continue
 
-        # Send file to Spleeter service
-        async with aiohttp.ClientSession() as session:
-            # Prepare the file for upload
+        stem_path = os.path.join(job_output_dir, f"{part.name}.wav")
+        async with aiofiles.open(stem_path, 'wb') as out_file:
+            while True:
+                chunk = await part.read_chunk(STEM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await out_file.write(chunk)
+        stems[part.name] = stem_path
+        print(f"[DEBUG] {part.name} file saved at: {stem_path}, size: {os.path.getsize(stem_path)} bytes")
+    return metadata, stems
+
+async def request_separation(source_path: str, output_dir: str, params: Dict[str, str]):
+    """
+    Send the canonical source to a Spleeter backend with query `params` and
+    receive the stems it returns into `output_dir`. Returns the separation
+    metadata and the stem paths.
+    """
+    # Send file to Spleeter service over the shared keep-alive session
+    session = get_http_session()
+
+    async def separate_on(backend_url: str):
+        with open(source_path, 'rb') as source_file, tracer.span("spleeter.request", backend=backend_url):
+            # Canonical WAV lets Spleeter skip decoding entirely
             data = aiohttp.FormData()
             data.add_field('file',
-                          open(input_path, 'rb'),
-                          filename=os.path.basename(input_path),
-                          content_type='audio/mpeg')
-
-            # Send request to Spleeter service
-            try:
-                # Send the actual request
-                async with session.post(f"{SPLEETER_API_URL}/separate", data=data) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"Spleeter processing failed: {error_text}")
-                    
-                    # Parse the JSON response from Spleeter
-                    response_data = await response.json()
-                    print(f"[DEBUG] Spleeter response: {response_data}")
-                    
-                    # Update progress
-                    set_job_status(job_id, ProcessingStatus(state="processing", progress=0.5))
-                    
-                    # Get the separation ID and file URLs
-                    separation_id = response_data.get('separation_id')
-                    files = response_data.get('files', {})
-                    
-                    if not separation_id or not files:
-                        raise Exception("Invalid response from Spleeter service - missing separation_id or files")
-                    
-                    print(f"[DEBUG] Spleeter separation ID: {separation_id} (Server job ID: {job_id})")
-                    
-                    # Download vocals file
-                    vocals_url = files.get('vocals')
-                    if vocals_url:
-                        vocals_path = os.path.join(job_output_dir, "vocals.wav")
-                        async with session.get(f"{SPLEETER_API_URL}{vocals_url}") as vocals_response:
-                            if vocals_response.status == 200:
-                                vocals_data = await vocals_response.read()
-                                print(f"[DEBUG] Downloaded vocals, size: {len(vocals_data)} bytes")
-                                with open(vocals_path, 'wb') as f:
-                                    f.write(vocals_data)
-                                
-                                # Verify the saved file
-                                if os.path.exists(vocals_path):
-                                    print(f"[DEBUG] Vocals file saved at: {vocals_path}, size: {os.path.getsize(vocals_path)} bytes")
-                                    
-                                    # Check if it looks like a valid audio file
-                                    try:
-                                        with open(vocals_path, 'rb') as f:
-                                            header = f.read(12)  # Read first 12 bytes
-                                            print(f"[DEBUG] Vocals file header: {header.hex()}")
-                                            
-                                            # Basic check for WAV header
-                                            if header.startswith(b'RIFF') and b'WAVE' in header:
-                                                print(f"[DEBUG] Vocals file appears to have valid WAV header")
-                                            else:
-                                                print(f"[DEBUG] WARNING: Vocals file doesn't have expected WAV header!")
-                                    except Exception as e:
-                                        print(f"[DEBUG] Error checking vocals file header: {str(e)}")
-                                else:
-                                    print(f"[DEBUG] ERROR: Vocals file not found after saving!")
-                            else:
-                                error_text = await vocals_response.text()
-                                raise Exception(f"Failed to download vocals from Spleeter: {error_text}")
-                    else:
-                        raise Exception("Vocals URL not found in Spleeter response")
-                    
-                    # Download accompaniment file
-                    accompaniment_url = files.get('accompaniment')
-                    if accompaniment_url:
-                        accompaniment_path = os.path.join(job_output_dir, "accompaniment.wav")
-                        async with session.get(f"{SPLEETER_API_URL}{accompaniment_url}") as accompaniment_response:
-                            if accompaniment_response.status == 200:
-                                accompaniment_data = await accompaniment_response.read()
-                                print(f"[DEBUG] Downloaded accompaniment, size: {len(accompaniment_data)} bytes")
-                                with open(accompaniment_path, 'wb') as f:
-                                    f.write(accompaniment_data)
-                                print(f"[DEBUG] Accompaniment file saved at: {accompaniment_path}")
-                            else:
-                                error_text = await accompaniment_response.text()
-                                print(f"[WARNING] Failed to download accompaniment from Spleeter: {error_text}")
-                                # Don't fail the entire job if only accompaniment fails
-                    else:
-                        print(f"[WARNING] Accompaniment URL not found in Spleeter response")
-                    
-            except Exception as e:
-                print(f"[DEBUG] Error: {str(e)}")
-                set_job_status(job_id, ProcessingStatus(state="failed", error=str(e)))
-                raise e
-
-        set_job_status(job_id, ProcessingStatus(state="processing", progress=0.7))
-
-        # Process vocals with Whisper API
+                          source_file,
+                          filename=ingest.CANONICAL_FILENAME,
+                          content_type='audio/wav')
+
+            # Stems are separated in memory and streamed back as multipart/mixed
+            async with session.post(f"{backend_url}/separate/stream", params=params, data=data,
+                                    headers=tracer.inject()) as response:
+                if response.status in SPLEETER_RETRY_STATUSES:
+                    error_text = await response.text()
+                    error = BackendBusy if response.status == SPLEETER_BUSY_STATUS else BackendUnavailable
+                    raise error(f"{backend_url} returned {response.status}: {error_text}")
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"Spleeter processing failed: {error_text}")
+                with tracer.span("receive_stems"):
+                    return await receive_stems(response, output_dir)
+
+    return await spleeter_pool.run(separate_on, affinity=spleeter_affinity.get())
+
+def export_remote_spans(job_id: str, metadata: dict):
+    """Export the spans Spleeter returned; they are already children of our request span."""
+    remote_spans = metadata.pop("spans", [])
+    for span in remote_spans:
+        span["jobId"] = job_id
+    tracer.export(remote_spans)
+
+async def separate_stems(job_id: str, source_path: str, job_output_dir: str,
+                         tier: SeparationTier = DEFAULT_SEPARATION_TIER):
+    """Separate the canonical source into stems with Spleeter, writing them to the job directory. Returns their paths."""
+    # Send request to Spleeter service
+    try:
+        separation_start = time.monotonic()
+        metadata, stems = await request_separation(source_path, job_output_dir, {"tier": tier.value})
+        separation_metrics[tier.value].record(time.monotonic() - separation_start)
+        export_remote_spans(job_id, metadata)
+        print(f"[DEBUG] Spleeter response: {metadata}")
+        print(f"[DEBUG] Spleeter separation ID: {metadata.get('separation_id')} (Server job ID: {job_id})")
+        
+        if "vocals" not in stems:
+            raise Exception("Vocals not found in Spleeter response")
+        if "accompaniment" not in stems:
+            # Don't fail the entire job if only accompaniment fails
+            print(f"[WARNING] Accompaniment not found in Spleeter response")
+        return stems
+        
+    except Exception as e:
+        separation_metrics[tier.value].errors += 1
+        print(f"[DEBUG] Error: {str(e)}")
+        raise e
+
+async def compact_for_transcription(audio_path: str, job_output_dir: str):
+    """
+    Cut the unvoiced parts out of a vocals stem before transcription. Returns
+    the path to transcribe and the offset map back to song time (None if
+    nothing was cut).
+    """
+    compact_path = os.path.join(job_output_dir, f"{os.path.splitext(os.path.basename(audio_path))[0]}_voiced.wav")
+    loop = asyncio.get_event_loop()
+    with tracer.span("compact_voiced") as span:
+        offset_map = await loop.run_in_executor(None, voicing.compact_voiced, audio_path, compact_path)
+        if offset_map is None:
+            return audio_path, None
+        source_info = ingest.read_metadata(job_output_dir) or {}
+        span.set(regions=len(offset_map.durations), compactSeconds=round(offset_map.compact_duration, 2),
+                 songSeconds=source_info.get("duration"))
+    offset_map.save(os.path.join(job_output_dir, voicing.OFFSET_MAP_FILENAME))
+    print(f"[DEBUG] Compacted {audio_path} to {offset_map.compact_duration:.1f}s of voiced audio "
+          f"in {len(offset_map.durations)} regions")
+    return compact_path, offset_map
+
+async def transcribe_lyrics(audio_path: str, job_output_dir: str, compact: bool = False):
+    """
+    Transcribe `audio_path` with Whisper and save the timed lyrics and their
+    index. With `compact`, only the voiced regions of the (vocals) audio are
+    sent, and the returned timestamps are mapped back to song time.
+    """
+    offset_map = None
+    if compact and VOICED_COMPACTION:
         try:
-            vocals_path = os.path.join(job_output_dir, "vocals.wav")
+            audio_path, offset_map = await compact_for_transcription(audio_path, job_output_dir)
+        except Exception as e:
+            # Transcribing the whole stem is slower, not wrong
+            print(f"[WARNING] Voiced-region compaction failed, transcribing the whole file: {str(e)}")
+
+    # Process audio with Whisper API
+    try:
+        mp3_path = os.path.join(job_output_dir, f"{os.path.splitext(os.path.basename(audio_path))[0]}_converted.mp3")
+        
+        # Add a conversion step as a fallback if the original file has issues
+        try:
+            print(f"[DEBUG] Attempting to convert audio file to ensure compatibility...")
+            import subprocess
             
-            # Add a conversion step as a fallback if the original file has issues
-            try:
-                print(f"[DEBUG] Attempting to convert audio file to ensure compatibility...")
-                import subprocess
-                mp3_path = os.path.join(job_output_dir, "vocals_converted.mp3")
-                
-                # Use ffmpeg to convert the file to MP3 format
+            # Use ffmpeg to convert the file to MP3 format
+            with tracer.span("transcode"):
                 result = subprocess.run([
-                    'ffmpeg', '-y', '-i', vocals_path, 
+                    'ffmpeg', '-y', '-i', audio_path, 
                     '-ar', '44100',  # 44.1kHz sample rate 
                     '-ac', '1',      # Mono
                     '-c:a', 'libmp3lame', 
                     '-b:a', '128k',  # 128kbps bitrate
                     mp3_path
                 ], capture_output=True, text=True)
-                
-                if os.path.exists(mp3_path) and os.path.getsize(mp3_path) > 0:
-                    print(f"[DEBUG] Successfully converted audio to MP3: {mp3_path}, size: {os.path.getsize(mp3_path)} bytes")
-                    print(f"[DEBUG] ffmpeg stdout: {result.stdout}")
-                    print(f"[DEBUG] ffmpeg stderr: {result.stderr}")
-                    
-                    # Use the converted file for transcription
-                    transcript = await transcribe_audio(mp3_path)
-                else:
-                    print(f"[DEBUG] Conversion failed, falling back to original file")
-                    print(f"[DEBUG] ffmpeg stdout: {result.stdout}")
-                    print(f"[DEBUG] ffmpeg stderr: {result.stderr}")
-                    transcript = await transcribe_audio(vocals_path)
-            except Exception as conv_e:
-                print(f"[DEBUG] Error in conversion attempt: {str(conv_e)}")
-                # Fall back to original method if conversion fails
-                transcript = await transcribe_audio(vocals_path)
             
-            # Convert response to dict for easier handling
-            if isinstance(transcript, dict):
-                transcript_data = transcript
+            if os.path.exists(mp3_path) and os.path.getsize(mp3_path) > 0:
+                print(f"[DEBUG] Successfully converted audio to MP3: {mp3_path}, size: {os.path.getsize(mp3_path)} bytes")
+                print(f"[DEBUG] ffmpeg stdout: {result.stdout}")
+                print(f"[DEBUG] ffmpeg stderr: {result.stderr}")
+                
+                # Use the converted file for transcription
+                transcript = await transcribe_audio(mp3_path)
             else:
-                # Fallback for different response types
-                transcript_data = transcript
-        except Exception as e:
-            raise Exception(f"Whisper API transcription failed: {str(e)}")
-
-        # Format lyrics with timestamps
-        lyrics = []
+                print(f"[DEBUG] Conversion failed, falling back to original file")
+                print(f"[DEBUG] ffmpeg stdout: {result.stdout}")
+                print(f"[DEBUG] ffmpeg stderr: {result.stderr}")
+                transcript = await transcribe_audio(audio_path)
+        except Exception as conv_e:
+            print(f"[DEBUG] Error in conversion attempt: {str(conv_e)}")
+            # Fall back to original method if conversion fails
+            transcript = await transcribe_audio(audio_path)
+        
+        # The MP3 only exists for the Whisper upload
+        if os.path.exists(mp3_path):
+            os.remove(mp3_path)
+        if offset_map is not None and os.path.exists(audio_path):
+            os.remove(audio_path)
         
-        # Handle different response formats
-        if "segments" in transcript_data:
-            # Dictionary format
-            for segment in transcript_data["segments"]:
-                lyrics.append({
-                    "startTime": segment["start"],
-                    "endTime": segment["end"],
-                    "text": segment["text"]
-                })
+        # Convert response to dict for easier handling
+        if isinstance(transcript, dict):
+            transcript_data = transcript
         else:
-            # Fallback if no segments found
-            raise Exception("No segments found in transcription response")
+            # Fallback for different response types
+            transcript_data = transcript
+    except Exception as e:
+        raise Exception(f"Whisper API transcription failed: {str(e)}") from e
+
+    if offset_map is not None:
+        # Whisper timed the compacted audio; move everything back to song time
+        offset_map.remap(transcript_data.get("segments") or [])
+        offset_map.remap(transcript_data.get("words") or [])
+
+    # Format lyrics with timestamps
+    if "segments" in transcript_data:
+        # Word timings are only present when Whisper returned them
+        lyrics = lyrics_index.build_lyrics(transcript_data["segments"], transcript_data.get("words"))
+    else:
+        # Fallback if no segments found
+        raise Exception("No segments found in transcription response")
 
-        # Save lyrics
+    # Save lyrics
+    with tracer.span("save_lyrics"):
         with open(os.path.join(job_output_dir, "lyrics.json"), "w") as f:
             json.dump(lyrics, f)
+        lyrics_index.LyricsIndex.from_lyrics(lyrics).save(
+            os.path.join(job_output_dir, lyrics_index.LYRICS_INDEX_FILENAME)
+        )
 
-        set_job_status(job_id, ProcessingStatus(state="completed", progress=1.0))
-
-    except Exception as e:
-        set_job_status(job_id, ProcessingStatus(state="failed", error=str(e)))
+async def separate_extra_stems(job_id: str, stem_model: str):
+    """Separate every extra stem that comes from `stem_model` out of the job's decoded source."""
+    job_output_dir = os.path.join(OUTPUT_DIR, job_id)
+    wanted = [stem for stem, model in EXTRA_STEMS.items() if model == stem_model]
+    # Received off to the side, so a stem only appears in the job directory once complete
+    scratch_dir = os.path.join(job_output_dir, f".{stem_model}.partial")
+    os.makedirs(scratch_dir, exist_ok=True)
+    try:
+        with tracer.span("extra_stems", job_id=job_id, model=stem_model):
+            start = time.monotonic()
+            metadata, stems = await request_separation(
+                os.path.join(job_output_dir, ingest.CANONICAL_FILENAME), scratch_dir,
+                {"stems": stem_model, "only": ",".join(wanted)}
+            )
+            separation_metrics[stem_model].record(time.monotonic() - start)
+            export_remote_spans(job_id, metadata)
+            for stem in wanted:
+                if stem in stems:
+                    os.replace(stems[stem], os.path.join(job_output_dir, f"{stem}.wav"))
+    except Exception:
+        separation_metrics[stem_model].errors += 1
         raise
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def stage_plan(mode: ProcessingMode) -> Dict[str, bool]:
+    """Which pipeline stages a job in `mode` has to run."""
+    transcribe_vocals = mode == ProcessingMode.full or (
+        mode == ProcessingMode.lyrics and LYRICS_MODE_SOURCE == "vocals"
+    )
+    return {
+        "separate": mode != ProcessingMode.lyrics or transcribe_vocals,
+        "transcribe": mode != ProcessingMode.instrumental,
+        "transcribeVocals": transcribe_vocals,
+    }
+
+def pipeline_stages(plan: Dict[str, bool]) -> List[str]:
+    """The checkpointed stages a job with `plan` runs, in order."""
+    stages = ["ingest"]
+    if plan["separate"]:
+        stages += ["separate", "peaks", "pitch"]
+    if plan["transcribe"]:
+        stages.append("transcribe")
+    return stages
+
+async def process_audio(job_id: str, input_path: str, mode: ProcessingMode = ProcessingMode.full,
+                        tier: SeparationTier = DEFAULT_SEPARATION_TIER,
+                        priority: JobPriority = JobPriority.interactive):
+    # Jobs coalesced into this one; None when the job was started outside enqueue_job
+    flight = job_flights.led_by(job_id)
+
+    # Checkpoints left by an earlier attempt, if this is a retry
+    previous = get_job_status(job_id)
+    stage_checkpoints = checkpoints.StageCheckpoints(previous.stages if previous else None)
+
+    def subscribers() -> List[str]:
+        return list(flight.subscribers) if flight is not None else [job_id]
+
+    def update(**fields):
+        fields["stages"] = stage_checkpoints.to_dict()
+        if flight is not None:
+            flight.last_update = fields
+        for subscriber in subscribers():
+            set_job_status(subscriber, ProcessingStatus(mode=mode, tier=tier, priority=priority, **fields))
+
+    async def release_outputs():
+        # Closed first, so no job can attach after the outputs were shared
+        job_flights.finish(job_id)
+        followers = [subscriber for subscriber in subscribers() if subscriber != job_id]
+        if followers:
+            with tracer.span("share_outputs", jobs=len(followers)):
+                await loop.run_in_executor(None, singleflight.share_outputs, job_output_dir,
+                                           [os.path.join(OUTPUT_DIR, follower) for follower in followers])
+        if job_id not in subscribers():
+            # The job that started the pipeline was cancelled; only its followers wanted it
+            shutil.rmtree(job_output_dir, ignore_errors=True)
+
+    loop = asyncio.get_event_loop()
+    profile_token = sampling_profiler.job_started()
+    job_output_dir = os.path.join(OUTPUT_DIR, job_id)
+    source_path = os.path.join(job_output_dir, ingest.CANONICAL_FILENAME)
+    plan = stage_plan(mode)
+
+    # Each stage returns the artifacts it left in the job directory
+
+    async def run_ingest():
+        # Decode the upload once; every later stage reads the canonical PCM file
+        source_info = await loop.run_in_executor(None, ingest.decode_to_canonical, input_path, job_output_dir)
+        print(f"[DEBUG] Decoded upload for job {job_id} in {source_info['decodeSeconds']:.2f}s: "
+              f"{source_info['duration']:.2f}s of audio, {os.path.getsize(source_path)} bytes")
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        return [ingest.CANONICAL_FILENAME]
+
+    async def run_separate():
+        stems = await separate_stems(job_id, source_path, job_output_dir, tier)
+        return [os.path.basename(path) for path in stems.values()]
+
+    async def run_peaks():
+        await generate_waveform_peaks(job_output_dir)
+        peak_files = [f"{stem}{waveform.PEAKS_EXTENSION}" for stem in PEAK_STEMS]
+        return [name for name in peak_files if os.path.exists(os.path.join(job_output_dir, name))]
+
+    async def run_pitch():
+        await extract_pitch_contour(job_output_dir)
+        return [pitch.PITCH_FILENAME] if os.path.exists(os.path.join(job_output_dir, pitch.PITCH_FILENAME)) else []
+
+    async def run_transcribe():
+        if plan["transcribeVocals"]:
+            await transcribe_lyrics(os.path.join(job_output_dir, "vocals.wav"), job_output_dir, compact=True)
+        else:
+            await transcribe_lyrics(source_path, job_output_dir)
+        return ["lyrics.json", lyrics_index.LYRICS_INDEX_FILENAME]
+
+    runners = {
+        "ingest": (run_ingest, 0.1, {}),
+        "separate": (run_separate, 0.5, {}),
+        "peaks": (run_peaks, 0.6, {}),
+        "pitch": (run_pitch, 0.7, {}),
+        "transcribe": (run_transcribe, 0.9, {"source": "vocals" if plan["transcribeVocals"] else "mix"}),
+    }
+
+    # A child of the upload span, so the whole job shares one trace
+    with tracer.span("process_audio", job_id=job_id, mode=mode.value, tier=tier.value):
+        try:
+            # Create output directory for this job
+            os.makedirs(job_output_dir, exist_ok=True)
+
+            stages = pipeline_stages(plan)
+            resume_at = stage_checkpoints.resume_index(stages, job_output_dir)
+            if resume_at:
+                print(f"[INFO] Job {job_id} resumes after its completed stages: {', '.join(stages[:resume_at])}")
+            progress = runners[stages[resume_at - 1]][1] if resume_at else 0.05
+
+            # Update job status
+            update(state="processing", progress=progress)
+
+            for stage in stages[resume_at:]:
+                run_stage, stage_progress, attributes = runners[stage]
+                attempt = 0
+                while True:
+                    stage_checkpoints.start(stage)
+                    try:
+                        with tracer.span(stage, attempt=attempt, **attributes):
+                            artifacts = await run_stage()
+                    except Exception as e:
+                        if attempt < STAGE_MAX_RETRIES and is_transient_error(e):
+                            attempt += 1
+                            stage_checkpoints.retried(stage)
+                            delay = STAGE_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+                            print(f"[WARNING] Stage {stage} of job {job_id} failed: {str(e)}; "
+                                  f"retry {attempt}/{STAGE_MAX_RETRIES} in {delay:.1f}s")
+                            update(state="processing", progress=progress, message=f"Retrying {stage}")
+                            await asyncio.sleep(delay)
+                            continue
+                        stage_checkpoints.fail(stage, str(e))
+                        raise
+                    stage_checkpoints.complete(stage, artifacts)
+                    progress = stage_progress
+                    update(state="processing", progress=progress)
+                    break
+
+            await release_outputs()
+            update(state="completed", progress=1.0)
+
+        except asyncio.CancelledError:
+            # Every job detached, and each was already marked cancelled
+            print(f"[INFO] Pipeline for job {job_id} cancelled")
+            if os.path.exists(input_path):
+                os.remove(input_path)
+            shutil.rmtree(job_output_dir, ignore_errors=True)
+            raise
+        except Exception as e:
+            # Followers get the finished stages too, so each of them can be retried
+            await release_outputs()
+            update(state="failed", error=str(e))
+            raise
+        finally:
+            job_flights.finish(job_id)
+            sampling_profiler.job_finished(profile_token)
 
 # helper function to broadcast completed status after delay
 async def delayed_status_update(job_id: str):
@@ -514,6 +983,9 @@ async def delayed_status_update(job_id: str):
 async def upload_file(
     file: UploadFile, 
     background_tasks: BackgroundTasks,
+    mode: ProcessingMode = ProcessingMode.full,
+    tier: SeparationTier = DEFAULT_SEPARATION_TIER,
+    priority: JobPriority = JobPriority.interactive,
     current_user: User = Depends(get_current_active_user)
 ):
     if TEST_MODE:
@@ -529,22 +1001,245 @@ async def upload_file(
     job_id = str(uuid.uuid4())
     input_path = os.path.join(UPLOAD_DIR, f"{job_id}.mp3")
 
-    await save_upload_file(file, input_path)
-    set_job_status(job_id, ProcessingStatus(state="uploaded"))
+    # Root span of the job's trace; processing continues it in a background task
+    with tracer.span("upload", job_id=job_id, filename=file.filename, mode=mode.value, tier=tier.value,
+                     priority=priority.value):
+        await save_upload_file(file, input_path)
+        await enqueue_job(job_id, input_path, current_user, file.filename, mode, tier, priority)
+    
+    return {"jobId": job_id, "userId": current_user.id}
+
+async def enqueue_job(job_id: str, input_path: str, current_user: User, filename: str,
+                mode: ProcessingMode = ProcessingMode.full,
+                tier: SeparationTier = DEFAULT_SEPARATION_TIER,
+                priority: JobPriority = JobPriority.interactive):
+    """Record a new job for an upload that is fully on disk and queue it for processing."""
+    record_job(redis_client, job_id, current_user, filename, mode, tier, priority)
+    loop = asyncio.get_event_loop()
+    key = await loop.run_in_executor(None, singleflight.content_key, input_path, mode.value, tier.value)
+    start_job(job_id, key, input_path, current_user, mode, tier, priority)
+
+def record_job(store, job_id: str, current_user: User, filename: str, mode: ProcessingMode,
+               tier: SeparationTier, priority: JobPriority, batch_id: Optional[str] = None):
+    """Write the status and project records of a new job to `store`, Redis or a pipeline."""
+    store.set(f"job:{job_id}", ProcessingStatus(state="uploaded", mode=mode, tier=tier, priority=priority).json(),
+              ex=STORAGE_LIFECYCLE.key_ttl)
     
     # Add user ID information to the job in Redis
     project_data = {
         "jobId": job_id,
         "userId": current_user.id,
         "username": current_user.username,
-        "filename": file.filename,
+        "filename": filename,
+        "mode": mode.value,
+        "tier": tier.value,
+        "priority": priority.value,
         "createdAt": datetime.utcnow().isoformat()
     }
+    if batch_id:
+        project_data["batchId"] = batch_id
     # Store project data
-    redis_client.set(f"project:{job_id}", json.dumps(project_data))
-    
-    asyncio.create_task(process_audio(job_id, input_path))
-    
+    store.set(f"project:{job_id}", json.dumps(project_data), ex=STORAGE_LIFECYCLE.key_ttl)
+
+def start_job(job_id: str, key: str, input_path: str, current_user: User, mode: ProcessingMode,
+              tier: SeparationTier, priority: JobPriority):
+    """Attach a recorded job to the pipeline for its content `key`, queueing a new pipeline if there is none."""
+    flight, started = job_flights.join(key, job_id)
+    if not started:
+        # The same audio with the same options is already queued or running; wait for its result
+        print(f"[INFO] Job {job_id} attached to the pipeline of job {flight.leader}")
+        os.remove(input_path)
+        if flight.last_update:
+            set_job_status(job_id, ProcessingStatus(mode=mode, tier=tier, priority=priority, **flight.last_update))
+        return
+    flight.input_path = input_path
+
+    job_scheduler.submit(
+        job_id, current_user.id, priority.value,
+        lambda: process_audio(job_id, input_path, mode, tier, priority)
+    )
+
+@app.post("/api/batches")
+async def upload_batch(
+    files: List[UploadFile],
+    mode: ProcessingMode = ProcessingMode.full,
+    tier: SeparationTier = DEFAULT_SEPARATION_TIER,
+    priority: JobPriority = JobPriority.batch,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Upload many files, such as an album, as one batch: a child job per
+    file, queued together in upload order, with aggregate progress at
+    /api/batches/{batch_id}.
+    """
+    if not files:
+        raise HTTPException(400, "No files uploaded")
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(400, f"At most {MAX_BATCH_FILES} files per batch")
+    # Nothing is written unless every file is acceptable
+    for file in files:
+        if not file.filename.endswith(('.mp3', '.wav')):
+            raise HTTPException(400, f"Only MP3 and WAV files are supported: {file.filename}")
+
+    batch_id = str(uuid.uuid4())
+    children = {str(uuid.uuid4()): file.filename for file in files}
+    input_paths = {job_id: os.path.join(UPLOAD_DIR, f"{job_id}.mp3") for job_id in children}
+
+    with tracer.span("batch_upload", batch_id=batch_id, files=len(files), mode=mode.value, tier=tier.value,
+                     priority=priority.value):
+        # One file at a time: the disk is the bottleneck anyway, and memory stays at one chunk
+        for job_id, file in zip(children, files):
+            await save_upload_file(file, input_paths[job_id])
+
+        # Every record in one round trip
+        batch = batches.Batch(batch_id, current_user.id, children)
+        pipe = redis_client.pipeline()
+        for job_id, filename in children.items():
+            record_job(pipe, job_id, current_user, filename, mode, tier, priority, batch_id=batch_id)
+        batch.save(pipe, STORAGE_LIFECYCLE.key_ttl)
+        pipe.execute()
+        pruned = batches.prune(job_batches)
+        if pruned:
+            print(f"[INFO] Forgot {pruned} jobs of expired batches")
+        for job_id in children:
+            job_batches[job_id] = batch
+
+        loop = asyncio.get_event_loop()
+        keys = await asyncio.gather(*(
+            loop.run_in_executor(None, singleflight.content_key, input_paths[job_id], mode.value, tier.value)
+            for job_id in children
+        ))
+        # Queued in upload order, the children carry the batch's Spleeter affinity into their pipelines
+        affinity = spleeter_affinity.set(batch.key)
+        try:
+            for job_id, key in zip(children, keys):
+                start_job(job_id, key, input_paths[job_id], current_user, mode, tier, priority)
+        finally:
+            spleeter_affinity.reset(affinity)
+
+    return {"batchId": batch_id, "jobIds": list(children), "userId": current_user.id}
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch_status(batch_id: str, current_user: User = Depends(get_current_active_user)):
+    """Get the aggregate state and progress of one of your batches, and the state of each of its jobs."""
+    status = batches.load_status(redis_client, batch_id)
+    if status is None:
+        raise HTTPException(404, "Batch not found")
+    if status["userId"] != current_user.id:
+        raise HTTPException(403, "Batch belongs to another user")
+    return status
+
+def get_upload_session(upload_id: str, current_user: User) -> dict:
+    data = redis_client.get(resumable.session_key(upload_id))
+    if not data:
+        raise HTTPException(404, "Upload session not found or expired")
+    session = json.loads(data)
+    if session["userId"] != current_user.id:
+        raise HTTPException(403, "Upload session belongs to another user")
+    return session
+
+def upload_session_progress(session: dict) -> dict:
+    received = [int(i) for i in redis_client.smembers(resumable.chunks_key(session["uploadId"]))]
+    return {
+        **session,
+        "receivedChunks": len(received),
+        "missingChunks": resumable.missing_chunks(received, session["totalChunks"]),
+        "offset": resumable.contiguous_offset(received, session["size"], session["chunkSize"])
+    }
+
+@app.post("/api/uploads")
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Start a resumable upload. Chunks are then PUT by index and the upload finalized."""
+    if not upload.filename.endswith(('.mp3', '.wav')):
+        raise HTTPException(400, "Only MP3 and WAV files are supported")
+    if upload.size <= 0 or upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(400, f"File size must be between 1 and {MAX_UPLOAD_BYTES} bytes")
+    chunk_size = upload.chunkSize or UPLOAD_CHUNK_SIZE
+    if chunk_size <= 0 or chunk_size > MAX_UPLOAD_CHUNK_SIZE:
+        raise HTTPException(400, f"Chunk size must be between 1 and {MAX_UPLOAD_CHUNK_SIZE} bytes")
+
+    upload_id = str(uuid.uuid4())
+    session = {
+        "uploadId": upload_id,
+        "userId": current_user.id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "chunkSize": chunk_size,
+        "totalChunks": resumable.total_chunks(upload.size, chunk_size),
+        "mode": upload.mode.value,
+        "tier": upload.tier.value,
+        "priority": upload.priority.value,
+        "createdAt": datetime.utcnow().isoformat()
+    }
+    # Preallocate so chunks can be written at their offsets in any order
+    await asyncio.get_event_loop().run_in_executor(
+        None, resumable.preallocate, resumable.partial_path(PARTIAL_UPLOAD_DIR, upload_id), upload.size
+    )
+    redis_client.set(resumable.session_key(upload_id), json.dumps(session), ex=int(STORAGE_LIFECYCLE.upload_session_ttl))
+    return upload_session_progress(session)
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload_progress(upload_id: str, current_user: User = Depends(get_current_active_user)):
+    """Get which chunks have arrived and the contiguous byte offset received so far."""
+    return upload_session_progress(get_upload_session(upload_id, current_user))
+
+@app.put("/api/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Write one chunk at its offset. Chunks may be sent in any order, in parallel, and retried."""
+    session = get_upload_session(upload_id, current_user)
+    if index < 0 or index >= session["totalChunks"]:
+        raise HTTPException(400, f"Chunk index must be between 0 and {session['totalChunks'] - 1}")
+    expected = resumable.chunk_length(session["size"], session["chunkSize"], index)
+
+    written = 0
+    async with aiofiles.open(resumable.partial_path(PARTIAL_UPLOAD_DIR, upload_id), 'r+b') as out_file:
+        await out_file.seek(index * session["chunkSize"])
+        async for data in request.stream():
+            written += len(data)
+            if written > expected:
+                raise HTTPException(400, f"Chunk {index} must be exactly {expected} bytes")
+            await out_file.write(data)
+    if written != expected:
+        raise HTTPException(400, f"Chunk {index} must be exactly {expected} bytes, got {written}")
+
+    # Each chunk pushes back the expiry of an upload that is still making progress
+    ttl = int(STORAGE_LIFECYCLE.upload_session_ttl)
+    pipe = redis_client.pipeline()
+    pipe.sadd(resumable.chunks_key(upload_id), index)
+    pipe.expire(resumable.chunks_key(upload_id), ttl)
+    pipe.expire(resumable.session_key(upload_id), ttl)
+    pipe.execute()
+    return upload_session_progress(session)
+
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, current_user: User = Depends(get_current_active_user)):
+    """Finalize a resumable upload once every chunk has arrived and queue its processing job."""
+    session = get_upload_session(upload_id, current_user)
+    progress = upload_session_progress(session)
+    if progress["missingChunks"]:
+        raise HTTPException(409, {"message": "Upload incomplete", "missingChunks": progress["missingChunks"]})
+
+    # Only the first finalize call wins the session
+    if not redis_client.delete(resumable.session_key(upload_id)):
+        raise HTTPException(409, "Upload already finalized")
+    redis_client.delete(resumable.chunks_key(upload_id))
+
+    job_id = str(uuid.uuid4())
+    input_path = os.path.join(UPLOAD_DIR, f"{job_id}.mp3")
+    # The chunks were assembled in place, so finalizing is a rename
+    with tracer.span("upload", job_id=job_id, filename=session["filename"], uploadId=upload_id):
+        os.replace(resumable.partial_path(PARTIAL_UPLOAD_DIR, upload_id), input_path)
+        await enqueue_job(job_id, input_path, current_user, session["filename"], ProcessingMode(session["mode"]),
+                    SeparationTier(session["tier"]), JobPriority(session["priority"]))
+
     return {"jobId": job_id, "userId": current_user.id}
 
 
@@ -560,8 +1255,89 @@ async def get_status(job_id: str):
     status = get_job_status(job_id)
     if not status:
         raise HTTPException(404, "Job not found")
+    if status.state == "uploaded":
+        # Only known to the worker that queued the job
+        status.queuePosition = job_scheduler.position(job_id)
     return status
 
+def get_owned_project(job_id: str, current_user: User) -> dict:
+    project = redis_client.get(f"project:{job_id}")
+    if not project:
+        raise HTTPException(404, "Job not found")
+    project = json.loads(project)
+    if project["userId"] != current_user.id:
+        raise HTTPException(403, "Job belongs to another user")
+    return project
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """
+    Cancel a queued or running job. Its pipeline is only stopped once no
+    other job is attached to it.
+    """
+    get_owned_project(job_id, current_user)
+
+    flight = job_flights.detach(job_id)
+    if flight is None:
+        status = get_job_status(job_id)
+        if status and status.state not in batches.TERMINAL_STATES:
+            # Queues are per process; only the worker that queued the job can cancel it
+            raise HTTPException(409, "Job is queued or running on another worker")
+        raise HTTPException(409, "Job is not queued or running")
+
+    status = get_job_status(job_id) or ProcessingStatus(state="cancelled")
+    status.state = "cancelled"
+    status.queuePosition = None
+    set_job_status(job_id, status)
+
+    pipeline_cancelled = not flight.subscribers
+    if pipeline_cancelled:
+        # Drops the job from the queue, or cancels the Spleeter request or Whisper call it is awaiting
+        job_scheduler.cancel(flight.leader)
+        if flight.input_path and os.path.exists(flight.input_path):
+            os.remove(flight.input_path)
+    return {"jobId": job_id, "state": "cancelled", "pipelineCancelled": pipeline_cancelled}
+
+@app.post("/api/jobs/{job_id}/retry")
+async def retry_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """Run a failed job again, starting at its first incomplete stage."""
+    project = get_owned_project(job_id, current_user)
+    status = get_job_status(job_id)
+    if not status or status.state != "failed":
+        raise HTTPException(409, "Only failed jobs can be retried")
+
+    mode = ProcessingMode(project.get("mode", ProcessingMode.full.value))
+    tier = SeparationTier(project.get("tier", DEFAULT_SEPARATION_TIER.value))
+    priority = JobPriority(project.get("priority", JobPriority.interactive.value))
+    input_path = os.path.join(UPLOAD_DIR, f"{job_id}.mp3")
+    stages = pipeline_stages(stage_plan(mode))
+    resume_at = checkpoints.StageCheckpoints(status.stages).resume_index(stages, os.path.join(OUTPUT_DIR, job_id))
+    if resume_at == 0 and not os.path.exists(input_path):
+        raise HTTPException(409, "The upload is no longer available; upload the file again")
+
+    status.state = "uploaded"
+    status.error = None
+    status.message = None
+    set_job_status(job_id, status)
+
+    # A flight of its own, so the retry can be cancelled like any job
+    flight, _ = job_flights.join(f"retry:{job_id}", job_id)
+    flight.input_path = input_path
+    job_scheduler.submit(
+        job_id, current_user.id, priority.value,
+        lambda: process_audio(job_id, input_path, mode, tier, priority)
+    )
+    return {"jobId": job_id, "state": status.state, "resumeFrom": stages[resume_at] if resume_at < len(stages) else None}
+
+@app.get("/api/scheduler/metrics")
+async def get_scheduler_metrics():
+    """Get queue lengths, running jobs and wait-time percentiles per priority class."""
+    return {
+        **job_scheduler.snapshot(),
+        "singleFlight": job_flights.snapshot(),
+        "activeBatches": len({batch.batch_id for batch in job_batches.values()})
+    }
+
 @app.get("/api/tracks/{job_id}")
 async def get_tracks(job_id: str):
     if TEST_MODE:
@@ -589,13 +1365,240 @@ async def get_tracks(job_id: str):
         raise HTTPException(400, "Processing not completed")
 
     job_output_dir = os.path.join(OUTPUT_DIR, job_id)
-    
+    lifecycle.record_access(redis_client, job_id, STORAGE_LIFECYCLE)
+
+    # Lyrics-only and instrumental-only jobs leave out what they skipped
+    def output_url(name):
+        return f"/output/{job_id}/{name}" if os.path.exists(os.path.join(job_output_dir, name)) else None
+
+    lyrics_path = os.path.join(job_output_dir, "lyrics.json")
     return {
-        "vocal": f"/output/{job_id}/vocals.wav",
-        "instrumental": f"/output/{job_id}/accompaniment.wav",
-        "lyrics": json.load(open(os.path.join(job_output_dir, "lyrics.json")))
+        "mode": status.mode or ProcessingMode.full,
+        "tier": status.tier,
+        "vocal": output_url("vocals.wav"),
+        "instrumental": output_url("accompaniment.wav"),
+        "lyrics": json.load(open(lyrics_path)) if os.path.exists(lyrics_path) else None,
+        "peaks": {
+            stem: f"/api/peaks/{job_id}/{stem}"
+            for stem in PEAK_STEMS
+            if os.path.exists(os.path.join(job_output_dir, f"{stem}{waveform.PEAKS_EXTENSION}"))
+        },
+        "pitch": f"/api/pitch/{job_id}" if output_url(pitch.PITCH_FILENAME) else None,
+        # Separated from the decoded source on first request
+        "extraStems": {
+            stem: {"url": f"/api/stems/{job_id}/{stem}", "ready": output_url(f"{stem}.wav") is not None}
+            for stem in EXTRA_STEMS
+            if output_url(f"{stem}.wav") or output_url(ingest.CANONICAL_FILENAME)
+        }
     }
 
+@app.get("/api/stems/{job_id}/{stem}")
+async def get_extra_stem(job_id: str, stem: str, current_user: User = Depends(get_current_active_user)):
+    """
+    Get the URL of an extra stem (drums, bass, piano) of one of your jobs,
+    separating it on the first request. Concurrent requests for stems of the
+    same model share one separation.
+    """
+    if stem not in EXTRA_STEMS:
+        raise HTTPException(400, f"Unknown stem: {stem}")
+    get_owned_project(job_id, current_user)
+    status = get_job_status(job_id)
+    if not status:
+        raise HTTPException(404, "Job not found")
+    if status.state != "completed":
+        raise HTTPException(400, "Processing not completed")
+
+    job_output_dir = os.path.join(OUTPUT_DIR, job_id)
+    stem_path = os.path.join(job_output_dir, f"{stem}.wav")
+    computed = False
+    if not os.path.exists(stem_path):
+        key = (job_id, EXTRA_STEMS[stem])
+        task = extra_stem_tasks.get(key)
+        if task is None:
+            # Leased before the source is checked, so the sweeper can't evict
+            # the job's outputs from under the separation
+            lifecycle.acquire_lease(redis_client, job_id, key[1], EXTRA_STEM_LEASE_SECONDS)
+            if not os.path.exists(os.path.join(job_output_dir, ingest.CANONICAL_FILENAME)):
+                lifecycle.release_lease(redis_client, *key)
+                raise HTTPException(404, "The decoded source of this job is no longer available")
+            # A separation is as costly as a job, so it takes a job slot under the user's fair share
+            task = job_scheduler.schedule(f"{job_id}:{key[1]}", current_user.id, JobPriority.interactive.value,
+                                          lambda: separate_extra_stems(*key))
+            extra_stem_tasks[key] = task
+            task.add_done_callback(lambda _: extra_stem_tasks.pop(key, None))
+            task.add_done_callback(lambda _: lifecycle.release_lease(redis_client, *key))
+            computed = True
+        try:
+            # Shielded, so a client that gives up doesn't cancel the separation for the others
+            await asyncio.shield(task)
+        except Exception as e:
+            raise HTTPException(502, f"Separating {stem} failed: {str(e)}")
+        if not os.path.exists(stem_path):
+            raise HTTPException(502, f"Spleeter did not return {stem}")
+
+    lifecycle.record_access(redis_client, job_id, STORAGE_LIFECYCLE)
+    return {"stem": stem, "url": f"/output/{job_id}/{stem}.wav", "computed": computed}
+
+@app.get("/api/jobs/{job_id}/timeline")
+async def get_job_timeline(job_id: str):
+    """Get every traced span of a job, across the API and Spleeter, in start order."""
+    # Spans still waiting in the buffer would be missing from the timeline
+    await asyncio.get_event_loop().run_in_executor(None, trace_exporter.flush)
+    spans = [json.loads(span) for span in redis_client.lrange(tracing.TIMELINE_KEY.format(job_id=job_id), 0, -1)]
+    if not spans:
+        raise HTTPException(404, "No trace found for job")
+    return {"jobId": job_id, **tracing.timeline(spans)}
+
+@app.get("/api/lyrics/{job_id}")
+async def get_lyrics_window(job_id: str, start: float = 0.0, end: Optional[float] = None):
+    """Get the lyric lines, with word timings when available, overlapping [start, end) seconds."""
+    if end is not None and end < start:
+        raise HTTPException(400, "End must not be before start")
+
+    index = lyrics_index.load_lyrics_index(os.path.join(OUTPUT_DIR, job_id))
+    if index is None:
+        raise HTTPException(404, "Lyrics not found")
+    lifecycle.record_access(redis_client, job_id, STORAGE_LIFECYCLE)
+
+    window = index.query(start, end if end is not None else float("inf"))
+    window["end"] = end
+    return window
+
+@app.get("/api/peaks/{job_id}/{stem}")
+async def get_peaks(
+    job_id: str,
+    stem: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    resolution: int = waveform.PEAK_LEVELS[0]
+):
+    """Get min/max waveform peaks of a stem for a time range, in seconds, at roughly `resolution` samples per peak."""
+    if stem not in PEAK_STEMS:
+        raise HTTPException(400, f"Unknown stem: {stem}")
+    if resolution <= 0:
+        raise HTTPException(400, "Resolution must be positive")
+
+    peaks_path = os.path.join(OUTPUT_DIR, job_id, f"{stem}{waveform.PEAKS_EXTENSION}")
+    if not os.path.exists(peaks_path):
+        raise HTTPException(404, "Peaks not found")
+    lifecycle.record_access(redis_client, job_id, STORAGE_LIFECYCLE)
+
+    loop = asyncio.get_event_loop()
+    peaks = await loop.run_in_executor(None, waveform.read_peaks, peaks_path, start, end, resolution)
+    return {"stem": stem, **peaks}
+
+@app.get("/api/pitch/{job_id}")
+async def get_pitch(job_id: str, start: float = 0.0, end: Optional[float] = None):
+    """
+    Get the vocal pitch contour for a time range, in seconds: f0 in Hz per
+    frame (0 where nothing is sung) and a voicing confidence from 0 to 1.
+    """
+    pitch_path = os.path.join(OUTPUT_DIR, job_id, pitch.PITCH_FILENAME)
+    if not os.path.exists(pitch_path):
+        raise HTTPException(404, "Pitch contour not found")
+    lifecycle.record_access(redis_client, job_id, STORAGE_LIFECYCLE)
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, pitch.read_pitch, pitch_path, start, end)
+
+async def close_live_score(websocket: WebSocket, code: int, detail: str):
+    await websocket.send_json({"type": "error", "detail": detail})
+    await websocket.close(code=code)
+
+@app.websocket("/api/score/{job_id}")
+async def live_score(websocket: WebSocket, job_id: str, token: str = "", sample_rate: int = 44100, start: float = 0.0):
+    """
+    Score singing against one of your jobs' vocals as it happens. Browsers
+    can't set headers on a WebSocket, so the access token comes as the
+    `token` query parameter; the handshake is refused unless it belongs to
+    the job's owner. The client streams
+    mono 16-bit little-endian PCM at `sample_rate` as binary messages, the
+    first sample sung at `start` seconds into the song, and sends the text
+    message "end" when done. Each chunk is answered with the sung pitch of
+    the frames it completed, and each phrase with its score once sung.
+    """
+    global live_score_sessions
+    try:
+        get_owned_project(job_id, await get_current_user(token))
+    except HTTPException as e:
+        print(f"[WARNING] Live score for job {job_id} refused: {e.detail}")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    pitch_path = os.path.join(OUTPUT_DIR, job_id, pitch.PITCH_FILENAME)
+    if not os.path.exists(pitch_path):
+        await close_live_score(websocket, status.WS_1008_POLICY_VIOLATION, "Pitch contour not found")
+        return
+    if not 8000 <= sample_rate <= 192000 or start < 0:
+        await close_live_score(websocket, status.WS_1008_POLICY_VIOLATION, "Invalid sample rate or start")
+        return
+    if live_score_sessions >= LIVE_SCORE_MAX_SESSIONS:
+        await close_live_score(websocket, status.WS_1013_TRY_AGAIN_LATER, "Too many live sessions")
+        return
+
+    live_score_sessions += 1
+    try:
+        session = scoring.LiveScore(scoring.ReferenceMelody.load(pitch_path), sample_rate, start)
+        lifecycle.record_access(redis_client, job_id, STORAGE_LIFECYCLE)
+        await websocket.send_json({
+            "type": "ready",
+            "frameRate": session.tracker.frame_rate,
+            "phrases": session.reference.phrase_times(first=session.next_phrase)
+        })
+
+        max_chunk_bytes = 2 * int(LIVE_SCORE_MAX_CHUNK_SECONDS * sample_rate)
+        processing_seconds, max_frame_ms, over_budget, phrases_sent = 0.0, 0.0, 0, 0
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is not None:
+                if message["text"] != "end":
+                    await close_live_score(websocket, status.WS_1003_UNSUPPORTED_DATA, "Expected binary PCM or \"end\"")
+                    return
+                break
+            data = message.get("bytes") or b""
+            if len(data) > max_chunk_bytes or len(data) % 2:
+                await close_live_score(websocket, status.WS_1009_MESSAGE_TOO_BIG,
+                                       f"Chunks must be whole 16-bit samples, at most {LIVE_SCORE_MAX_CHUNK_SECONDS}s")
+                return
+
+            began = time.perf_counter()
+            result = session.push(scoring.decode_pcm16(data))
+            elapsed = time.perf_counter() - began
+            processing_seconds += elapsed
+            frames = len(result["f0"])
+            if frames:
+                frame_ms = 1000 * elapsed / frames
+                max_frame_ms = max(max_frame_ms, frame_ms)
+                over_budget += frame_ms > LIVE_SCORE_FRAME_BUDGET_MS
+                await websocket.send_json(scoring.pitch_message(result))
+            for phrase in result["phrases"]:
+                await websocket.send_json({"type": "phrase", **phrase})
+            phrases_sent += len(result["phrases"])
+
+        remaining, score = session.finish()
+        for phrase in remaining:
+            await websocket.send_json({"type": "phrase", **phrase})
+        phrases_sent += len(remaining)
+        frames = session.tracker.frames
+        if over_budget:
+            print(f"[WARNING] Live score for {job_id}: {over_budget} chunks over {LIVE_SCORE_FRAME_BUDGET_MS}ms per frame")
+        await websocket.send_json({
+            "type": "summary",
+            "score": score,
+            "phrasesScored": phrases_sent,
+            "frames": frames,
+            "meanFrameMs": round(1000 * processing_seconds / frames, 3) if frames else None,
+            "maxFrameMs": round(max_frame_ms, 3),
+            "chunksOverBudget": over_budget
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_score_sessions -= 1
+
 @app.get("/api/projects")
 async def get_user_projects(current_user: User = Depends(get_current_active_user)):
     """Get all projects for the current user."""
@@ -623,14 +1626,180 @@ async def get_user_projects(current_user: User = Depends(get_current_active_user
     
     return {"projects": projects}
 
+async def storage_sweeper():
+    """Periodically apply the storage retention policies and disk quota."""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(
+                None, lifecycle.sweep, redis_client, UPLOAD_DIR, OUTPUT_DIR, STORAGE_LIFECYCLE, storage_metrics,
+                None, PARTIAL_UPLOAD_DIR
+            )
+        except Exception as e:
+            storage_metrics.errors += 1
+            print(f"[WARNING] Storage sweep failed: {str(e)}")
+        await asyncio.sleep(STORAGE_LIFECYCLE.sweep_interval)
+
+def check_ffmpeg():
+    """Check if ffmpeg is available for audio conversion."""
+    try:
+        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+        print(f"[INFO] ffmpeg is available: {ffmpeg_version.stdout.splitlines()[0]}")
+    except Exception as e:
+        print(f"[WARNING] ffmpeg not found. Audio conversion fallback will not work: {e}")
+        print("[WARNING] Please install ffmpeg for better audio compatibility with Whisper API")
+
+@app.on_event("startup")
+async def run_startup_checks():
+    # Spawning ffmpeg used to happen at import; here it no longer delays the import
+    with startup_tracker.phase("ffmpegCheck"):
+        await asyncio.get_event_loop().run_in_executor(None, check_ffmpeg)
+
+@app.on_event("startup")
+async def start_storage_sweeper():
+    if STORAGE_LIFECYCLE.sweep_interval > 0 and not TEST_MODE:
+        app.state.storage_sweeper = asyncio.create_task(storage_sweeper())
+
+@app.on_event("shutdown")
+async def stop_storage_sweeper():
+    sweeper = getattr(app.state, "storage_sweeper", None)
+    if sweeper:
+        sweeper.cancel()
+
+@app.on_event("startup")
+async def start_spleeter_monitor():
+    if not TEST_MODE:
+        app.state.spleeter_monitor = asyncio.create_task(spleeter_pool.monitor(get_http_session()))
+
+@app.on_event("shutdown")
+async def stop_trace_exporter():
+    await asyncio.get_event_loop().run_in_executor(None, trace_exporter.close)
+
+@app.on_event("shutdown")
+async def stop_pitch_executor():
+    pitch_executor.shutdown(wait=False)
+
+@app.on_event("shutdown")
+async def stop_spleeter_monitor():
+    monitor = getattr(app.state, "spleeter_monitor", None)
+    if monitor:
+        monitor.cancel()
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+# Registered after every other startup hook, so it runs last
+@app.on_event("startup")
+async def mark_ready():
+    startup_tracker.mark_ready()
+    print(f"[INFO] Ready after {startup_tracker.ready_after:.2f}s: {startup_tracker.phases}")
+
+@app.get("/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: startup has finished and Redis is reachable."""
+    details = startup_tracker.snapshot()
+    if not startup_tracker.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", **details})
+    try:
+        redis_client.ping()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "unready", "error": str(e), **details})
+    return {"status": "ready", **details}
+
+@app.get("/api/http/metrics")
+async def get_http_metrics():
+    """Get latency and connection reuse counters for inter-service HTTP calls."""
+    return http_metrics.snapshot()
+
+@app.get("/api/spleeter/backends")
+async def get_spleeter_backends():
+    """Get the health and load of every Spleeter backend in the pool."""
+    return {"backends": spleeter_pool.status()}
+
+@app.get("/api/spleeter/tiers")
+async def get_separation_tiers():
+    """Get the end-to-end separation latency of each tier as seen by this server."""
+    return {
+        "default": DEFAULT_SEPARATION_TIER,
+        "tiers": {tier.value: separation_metrics[tier.value].snapshot() for tier in SeparationTier},
+        # Separations of extra stems, by multi-stem model
+        "extraStems": {model: separation_metrics[model].snapshot() for model in sorted(set(EXTRA_STEMS.values()))}
+    }
+
+@app.get("/api/storage/metrics")
+async def get_storage_metrics():
+    """Get the storage sweeper counters and current disk usage."""
+    return {
+        "policies": {
+            "uploadRetentionSeconds": STORAGE_LIFECYCLE.upload_ttl,
+            "intermediateRetentionSeconds": STORAGE_LIFECYCLE.intermediate_ttl,
+            "outputRetentionSeconds": STORAGE_LIFECYCLE.output_ttl,
+            "diskQuotaBytes": STORAGE_LIFECYCLE.disk_quota_bytes,
+        },
+        **storage_metrics.snapshot()
+    }
+
+# On-demand sampling profiler; the endpoint only exists when a token is configured
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+sampling_profiler = profiler.SamplingProfiler(
+    interval=float(os.getenv("PROFILER_INTERVAL_MS", "10")) / 1000,
+    max_seconds=float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+)
+
+@app.post("/api/debug/profile", include_in_schema=False)
+async def profile_worker(
+    seconds: Optional[float] = None,
+    jobs: Optional[int] = None,
+    x_debug_token: Optional[str] = Header(None)
+):
+    """
+    Profile this worker for `seconds`, or while the next `jobs` jobs run, and
+    return collapsed stacks for flamegraph.pl or speedscope.
+    """
+    if not PROFILER_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if not x_debug_token or not hmac.compare_digest(x_debug_token, PROFILER_TOKEN):
+        raise HTTPException(401, "Invalid debug token")
+    if (seconds is None) == (jobs is None):
+        raise HTTPException(400, "Pass either seconds or jobs")
+    if (seconds is not None and seconds <= 0) or (jobs is not None and jobs <= 0):
+        raise HTTPException(400, "seconds and jobs must be positive")
+
+    loop = asyncio.get_event_loop()
+    try:
+        if seconds is not None:
+            result = await loop.run_in_executor(None, sampling_profiler.profile_for, seconds)
+        else:
+            result = await loop.run_in_executor(None, sampling_profiler.profile_jobs, jobs)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(409, str(e))
+
+    collapsed = result.pop("collapsed")
+    return PlainTextResponse(
+        collapsed + "\n" if collapsed else "",
+        headers={f"X-Profile-{key[0].upper()}{key[1:]}": str(value) for key, value in result.items()}
+    )
+
+# Routes don't change after import, so the schema is built once
+_openapi_schema = None
+
 @app.get("/api/openapi.json", include_in_schema=False)
 async def get_openapi_schema():
-    return get_openapi(
-        title="SingWithMe API",
-        version="1.0.0",
-        description="API for audio processing, vocal separation, and lyrics transcription",
-        routes=app.routes,
-    )
+    global _openapi_schema
+    if _openapi_schema is None:
+        _openapi_schema = get_openapi(
+            title="SingWithMe API",
+            version="1.0.0",
+            description="API for audio processing, vocal separation, and lyrics transcription",
+            routes=app.routes,
+        )
+    return _openapi_schema
+
+startup_tracker.record("import", time.perf_counter() - _import_started)
 
 if __name__ == "__main__":
     import uvicorn
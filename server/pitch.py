@@ -0,0 +1,239 @@
+"""
+Vocal pitch contour for karaoke scoring.
+
+The separated vocals are folded to mono, low-passed and decimated to about
+11 kHz, then cut into overlapping frames. A YIN estimate is computed for a
+whole block of frames at once:
+- the autocorrelation of every frame comes from one batched real FFT;
+- the difference function and its cumulative-mean normalization are built
+  from the autocorrelation and prefix sums of energy;
+- the first dip under the threshold is refined by parabolic interpolation.
+There are no per-frame Python loops. The blocks bound memory use on long
+tracks.
+
+The contour (f0 in Hz, 0 when unvoiced, and a voicing confidence per frame)
+is stored as a small binary file that can be memory-mapped, so a time window
+is read without loading the rest.
+"""
+
+import os
+import struct
+from typing import Optional, Tuple
+
+import numpy as np
+
+import waveform
+
+PITCH_MAGIC = b"SWMPITCH"
+PITCH_VERSION = 1
+PITCH_FILENAME = "vocals.pitch"
+
+ANALYSIS_RATE = 11025
+FRAME_LENGTH = 512      # ~46 ms at the analysis rate, two periods of the lowest pitch
+HOP_LENGTH = 128        # ~86 frames per second
+MIN_FREQUENCY = 70.0
+MAX_FREQUENCY = 1100.0
+# YIN absolute threshold on the normalized difference
+THRESHOLD = 0.15
+# Frames quieter than this (dBFS) are unvoiced whatever their periodicity
+SILENCE_DB = -50.0
+# Frames analysed per vectorized block
+BLOCK_FRAMES = 2048
+
+# magic, version, frame rate, frame count
+_HEADER = struct.Struct("<8sHdQ")
+_LOWPASS_TAPS = 63
+
+
+def _lowpass_taps(factor: int) -> np.ndarray:
+    """Windowed-sinc low-pass at the Nyquist frequency of the decimated rate."""
+    n = np.arange(_LOWPASS_TAPS) - (_LOWPASS_TAPS - 1) / 2
+    taps = np.sinc(n / factor) * np.hamming(_LOWPASS_TAPS)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+def _decimate(mono: np.ndarray, factor: int) -> np.ndarray:
+    """Low-pass, then keep every ``factor``-th sample."""
+    if factor == 1:
+        return mono
+    return np.convolve(mono, _lowpass_taps(factor), mode="same")[::factor]
+
+
+def _lag_range(sample_rate: float) -> Tuple[int, int]:
+    """Shortest and longest period searched, in samples."""
+    return max(2, int(sample_rate / MAX_FREQUENCY)), min(FRAME_LENGTH - 3, int(np.ceil(sample_rate / MIN_FREQUENCY)))
+
+
+def load_analysis_signal(wav_path: str) -> Tuple[np.ndarray, float]:
+    """Mono float32 samples of a PCM WAV at roughly ``ANALYSIS_RATE``, and their exact rate."""
+    layout = waveform.read_pcm_layout(wav_path)
+    samples = np.memmap(wav_path, dtype=layout.dtype, mode="r", offset=layout.data_offset,
+                        shape=(layout.frames, layout.channels))
+    mono = waveform.to_float(samples).mean(axis=1)
+    del samples
+    factor = max(1, int(round(layout.sample_rate / ANALYSIS_RATE)))
+    return _decimate(mono, factor), layout.sample_rate / factor
+
+
+def _yin_block(frames: np.ndarray, sample_rate: float, tau_min: int, tau_max: int) -> Tuple[np.ndarray, np.ndarray]:
+    """f0 (Hz, 0 if unvoiced) and confidence for each row of ``frames``."""
+    n_frames, width = frames.shape
+    taus = np.arange(tau_max + 2)
+
+    # Autocorrelation r(tau) = sum_j x[j] x[j + tau], all frames in one FFT
+    fft_size = 1 << int(np.ceil(np.log2(2 * width)))
+    spectrum = np.fft.rfft(frames, fft_size, axis=1)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), fft_size, axis=1)[:, :tau_max + 2]
+
+    # d(tau) = sum_j (x[j] - x[j + tau])^2 over the overlap, from energy prefix sums
+    energy = np.concatenate((np.zeros((n_frames, 1)), np.cumsum(np.square(frames, dtype=np.float64), axis=1)), axis=1)
+    difference = energy[:, width - taus] + energy[:, [width]] - energy[:, taus] - 2.0 * autocorrelation
+    difference[:, 0] = 0.0
+    np.maximum(difference, 0.0, out=difference)
+
+    # Cumulative mean normalized difference
+    normalized = np.ones_like(difference)
+    running = np.cumsum(difference[:, 1:], axis=1)
+    normalized[:, 1:] = difference[:, 1:] * taus[1:] / np.maximum(running, 1e-12)
+
+    # First dip under the threshold, followed down to its local minimum
+    search = normalized[:, tau_min:tau_max + 1]
+    below = search < THRESHOLD
+    found = below.any(axis=1)
+    after_first = np.arange(search.shape[1]) >= np.argmax(below, axis=1)[:, None]
+    left_dip = np.cumsum(~below & after_first, axis=1) > 0
+    dip = below & after_first & ~left_dip
+    best = np.where(found, np.argmin(np.where(dip, search, np.inf), axis=1), np.argmin(search, axis=1))
+    tau = best + tau_min
+
+    # Parabolic interpolation around the chosen lag
+    rows = np.arange(n_frames)
+    left, centre, right = normalized[rows, tau - 1], normalized[rows, tau], normalized[rows, tau + 1]
+    curvature = left - 2.0 * centre + right
+    shift = np.where(np.abs(curvature) > 1e-12, 0.5 * (left - right) / np.where(curvature == 0, 1, curvature), 0.0)
+    refined = tau + np.clip(shift, -1.0, 1.0)
+
+    confidence = np.clip(1.0 - centre, 0.0, 1.0)
+    level_db = 10.0 * np.log10(energy[:, width] / width + 1e-12)
+    voiced = found & (level_db > SILENCE_DB)
+    f0 = np.where(voiced, sample_rate / refined, 0.0)
+    return f0.astype(np.float32), np.where(voiced, confidence, 0.0).astype(np.float32)
+
+
+def pitch_contour(signal: np.ndarray, sample_rate: float) -> Tuple[np.ndarray, np.ndarray, float]:
+    """f0 and confidence per frame of a mono signal, and the frame rate."""
+    tau_min, tau_max = _lag_range(sample_rate)
+    # Frames are centred on their time stamps
+    padded = np.pad(signal.astype(np.float32, copy=False), (FRAME_LENGTH // 2, FRAME_LENGTH // 2))
+    frames = np.lib.stride_tricks.sliding_window_view(padded, FRAME_LENGTH)[::HOP_LENGTH]
+
+    f0 = np.empty(frames.shape[0], dtype=np.float32)
+    confidence = np.empty(frames.shape[0], dtype=np.float32)
+    for first in range(0, frames.shape[0], BLOCK_FRAMES):
+        block = frames[first:first + BLOCK_FRAMES]
+        f0[first:first + block.shape[0]], confidence[first:first + block.shape[0]] = \
+            _yin_block(block, sample_rate, tau_min, tau_max)
+    return f0, confidence, sample_rate / HOP_LENGTH
+
+
+class PitchTracker:
+    """
+    Incremental pitch tracking of a live stream. It runs the same analysis as
+    ``pitch_contour``, frame for frame. Between chunks it only keeps the
+    low-pass history and the samples of frames not yet complete, so memory
+    stays constant however long the stream runs.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.factor = max(1, int(round(sample_rate / ANALYSIS_RATE)))
+        self.sample_rate = sample_rate / self.factor
+        self.frame_rate = self.sample_rate / HOP_LENGTH
+        self.tau_min, self.tau_max = _lag_range(self.sample_rate)
+        self.frames = 0
+        self._taps = _lowpass_taps(self.factor)
+        self._history = np.zeros(_LOWPASS_TAPS - 1, dtype=np.float32)
+        # Filter outputs to drop so they line up with the centred filter of _decimate
+        self._skip = (_LOWPASS_TAPS - 1) // 2 if self.factor > 1 else 0
+        # Offset of the next decimated sample in the next filtered chunk
+        self._phase = 0
+        # Analysis samples of frames not yet complete, starting with the centring pad
+        self._pending = np.zeros(FRAME_LENGTH // 2, dtype=np.float32)
+
+    def _downsample(self, samples: np.ndarray) -> np.ndarray:
+        if self.factor == 1:
+            return samples
+        buffer = np.concatenate((self._history, samples))
+        self._history = buffer[-(_LOWPASS_TAPS - 1):]
+        filtered = np.convolve(buffer, self._taps, mode="valid")
+        if self._skip:
+            dropped = min(self._skip, filtered.shape[0])
+            filtered = filtered[dropped:]
+            self._skip -= dropped
+        decimated = filtered[self._phase::self.factor]
+        self._phase = (self._phase - filtered.shape[0]) % self.factor
+        return decimated
+
+    def push(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Analyse a chunk of mono float samples; f0 and confidence of the frames it completed."""
+        pending = np.concatenate((self._pending, self._downsample(samples.astype(np.float32, copy=False))))
+        count = (pending.shape[0] - FRAME_LENGTH) // HOP_LENGTH + 1 if pending.shape[0] >= FRAME_LENGTH else 0
+        if count == 0:
+            self._pending = pending
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+        frames = np.lib.stride_tricks.sliding_window_view(pending, FRAME_LENGTH)[::HOP_LENGTH][:count]
+        f0, confidence = _yin_block(frames, self.sample_rate, self.tau_min, self.tau_max)
+        self._pending = pending[count * HOP_LENGTH:].copy()
+        self.frames += count
+        return f0, confidence
+
+
+def write_pitch_file(wav_path: str, pitch_path: str) -> dict:
+    """
+    Extract the pitch contour of ``wav_path`` and store it at ``pitch_path``.
+
+    Blocking and CPU-bound; run it in a process pool.
+    """
+    signal, sample_rate = load_analysis_signal(wav_path)
+    f0, confidence, frame_rate = pitch_contour(signal, sample_rate)
+
+    tmp_path = f"{pitch_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(PITCH_MAGIC, PITCH_VERSION, frame_rate, f0.shape[0]))
+        f.write(f0.astype("<f4", copy=False).tobytes())
+        f.write(np.round(confidence * 255).astype(np.uint8).tobytes())
+    os.replace(tmp_path, pitch_path)
+    return {"frames": int(f0.shape[0]), "frameRate": frame_rate, "voicedFrames": int(np.count_nonzero(f0))}
+
+
+def open_pitch(pitch_path: str) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Memory-mapped f0 and confidence (0-255) of a pitch file, and its frame rate."""
+    with open(pitch_path, "rb") as f:
+        magic, version, frame_rate, count = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != PITCH_MAGIC or version != PITCH_VERSION:
+        raise ValueError(f"Unrecognised pitch file: {pitch_path}")
+    f0 = np.memmap(pitch_path, dtype="<f4", mode="r", offset=_HEADER.size, shape=(count,))
+    confidence = np.memmap(pitch_path, dtype=np.uint8, mode="r", offset=_HEADER.size + 4 * count, shape=(count,))
+    return f0, confidence, frame_rate
+
+
+def read_pitch(pitch_path: str, start: float = 0.0, end: Optional[float] = None) -> dict:
+    """Read the contour frames whose time stamps fall in ``[start, end)`` seconds."""
+    f0, confidence, frame_rate = open_pitch(pitch_path)
+    count = f0.shape[0]
+    duration = count / frame_rate
+    start = min(max(start, 0.0), duration)
+    end = duration if end is None else min(max(end, start), duration)
+    first = int(np.ceil(start * frame_rate))
+    last = max(first, min(count, int(np.ceil(end * frame_rate))))
+
+    window_f0 = np.array(f0[first:last])
+    window_confidence = np.array(confidence[first:last])
+    del f0, confidence
+
+    return {
+        "frameRate": frame_rate,
+        "duration": duration,
+        "start": first / frame_rate,
+        "f0": np.round(window_f0, 2).tolist(),
+        "confidence": np.round(window_confidence / 255.0, 3).tolist(),
+    }
@@ -0,0 +1,153 @@
+"""
+Low-overhead sampling profiler for live workers.
+
+A background thread snapshots the stack of every other thread with
+``sys._current_frames()`` at a fixed interval and counts identical stacks.
+The result is in the collapsed-stack format read by flamegraph.pl and
+speedscope (``frame;frame;frame count`` per line, root first).
+
+Overhead is bounded: the interval has a floor, a profile has a maximum
+duration and sample count, only one profile runs at a time, and the time
+spent sampling is reported with the result.
+
+server/profiler.py and spleeter/app/profiler.py are deliberately identical,
+because each service's image is built from its own directory. Change both
+together; the API's tests/test_profiler.py fails when they differ.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+MIN_INTERVAL = 0.005
+MAX_DEPTH = 128
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this process."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_seconds: float = 60.0, max_samples: int = 100000):
+        self.interval = max(MIN_INTERVAL, interval)
+        self.max_seconds = max_seconds
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._running = False
+        # Job mode: sample only while jobs run, until the armed number finished
+        self._jobs_remaining = 0
+        self._jobs_active = 0
+        self._jobs_done = threading.Event()
+        self._sampling_enabled = threading.Event()
+        self._counts = collections.Counter()
+        self._generation = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _claim(self):
+        with self._lock:
+            if self._running:
+                raise ProfilerBusy("A profile is already running")
+            self._running = True
+            self._generation += 1
+            self._counts = collections.Counter()
+
+    def _sample(self, own_ident: int):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self._counts[";".join(reversed(stack))] += 1
+
+    def _run(self, seconds: float, stop: Optional[threading.Event] = None) -> dict:
+        own_ident = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + min(seconds, self.max_seconds)
+        samples = 0
+        sampling_seconds = 0.0
+        while time.perf_counter() < deadline and samples < self.max_samples:
+            if stop is not None and stop.is_set():
+                break
+            if self._sampling_enabled.is_set():
+                sample_start = time.perf_counter()
+                self._sample(own_ident)
+                sampling_seconds += time.perf_counter() - sample_start
+                samples += 1
+            time.sleep(self.interval)
+        elapsed = time.perf_counter() - started
+        return {
+            "samples": samples,
+            "seconds": round(elapsed, 3),
+            "intervalSeconds": self.interval,
+            # Fraction of one core spent taking samples
+            "overhead": round(sampling_seconds / elapsed, 4) if elapsed else 0.0,
+            "collapsed": "\n".join(f"{stack} {count}" for stack, count in self._counts.most_common()),
+        }
+
+    def profile_for(self, seconds: float) -> dict:
+        """Sample every thread for ``seconds`` (capped at ``max_seconds``). Blocking."""
+        self._claim()
+        try:
+            self._sampling_enabled.set()
+            return self._run(seconds)
+        finally:
+            self._sampling_enabled.clear()
+            self._running = False
+
+    def profile_jobs(self, jobs: int, timeout: Optional[float] = None) -> dict:
+        """
+        Sample only while jobs are running, until the next ``jobs`` jobs have
+        finished or ``timeout`` (capped at ``max_seconds``) passes. Blocking.
+        """
+        self._claim()
+        try:
+            with self._lock:
+                self._jobs_remaining = jobs
+                self._jobs_active = 0
+                self._jobs_done.clear()
+            result = self._run(timeout or self.max_seconds, stop=self._jobs_done)
+            result["jobs"] = jobs - self._jobs_remaining
+            return result
+        finally:
+            with self._lock:
+                self._jobs_remaining = 0
+                self._jobs_active = 0
+                self._sampling_enabled.clear()
+            self._running = False
+
+    def job_started(self) -> Optional[int]:
+        """Mark a job as started; returns a token for ``job_finished`` if it is being profiled."""
+        with self._lock:
+            if self._jobs_remaining > self._jobs_active:
+                self._jobs_active += 1
+                self._sampling_enabled.set()
+                return self._generation
+        return None
+
+    def job_finished(self, token: Optional[int]):
+        """Call with the token ``job_started`` returned."""
+        with self._lock:
+            # Ignore jobs that started under an earlier profile
+            if token is None or token != self._generation or not self._running:
+                return
+            self._jobs_active = max(0, self._jobs_active - 1)
+            self._jobs_remaining = max(0, self._jobs_remaining - 1)
+            if self._jobs_active == 0:
+                self._sampling_enabled.clear()
+            if self._jobs_remaining == 0:
+                self._jobs_done.set()
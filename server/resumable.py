@@ -0,0 +1,57 @@
+"""
+Bookkeeping for resumable chunked uploads.
+
+An upload session fixes the file size and chunk size up front. The partial
+file is preallocated to its final size, so each chunk is written straight to
+its own offset: chunks can arrive in any order, in parallel, and a retried
+chunk simply overwrites itself. Received chunk indices are kept in a Redis
+set next to the session record, and both expire together when the client
+stops making progress.
+"""
+
+import os
+from typing import Iterable, List
+
+SESSION_KEY = "upload:{upload_id}"
+CHUNKS_KEY = "upload:{upload_id}:chunks"
+PARTIAL_SUFFIX = ".part"
+
+
+def session_key(upload_id: str) -> str:
+    return SESSION_KEY.format(upload_id=upload_id)
+
+
+def chunks_key(upload_id: str) -> str:
+    return CHUNKS_KEY.format(upload_id=upload_id)
+
+
+def partial_path(partial_dir: str, upload_id: str) -> str:
+    return os.path.join(partial_dir, f"{upload_id}{PARTIAL_SUFFIX}")
+
+
+def total_chunks(size: int, chunk_size: int) -> int:
+    return max(1, -(-size // chunk_size))
+
+
+def chunk_length(size: int, chunk_size: int, index: int) -> int:
+    """Exact byte length chunk ``index`` must have; only the last one may be short."""
+    return min(chunk_size, size - index * chunk_size)
+
+
+def missing_chunks(received: Iterable[int], count: int) -> List[int]:
+    received = set(received)
+    return [index for index in range(count) if index not in received]
+
+
+def contiguous_offset(received: Iterable[int], size: int, chunk_size: int) -> int:
+    """Bytes received without gaps from the start of the file."""
+    received = set(received)
+    index = 0
+    while index in received:
+        index += 1
+    return min(size, index * chunk_size)
+
+
+def preallocate(path: str, size: int):
+    with open(path, "wb") as f:
+        f.truncate(size)
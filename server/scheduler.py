@@ -0,0 +1,252 @@
+"""
+Fair-share scheduler for processing jobs.
+
+Jobs wait in per-user FIFO queues inside a priority class (``interactive``
+or ``batch``). Whenever a slot frees up, the next job is picked by stride
+scheduling in two levels:
+
+- between classes, in proportion to the class weights, so interactive jobs
+  get most slots while a bulk import still makes progress;
+- between users within a class, in equal shares, so one user's album
+  upload cannot starve somebody else's single song.
+
+Each pick advances the chosen class's and user's "pass" by 1/weight, and
+the lowest pass goes next. A class or user that has been idle re-enters at
+the current pass of its peers, so idleness doesn't bank credit. Users are
+capped at ``max_per_user`` running jobs, and the whole process at
+``max_concurrent``.
+"""
+
+import asyncio
+import collections
+import contextvars
+import time
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+# Wait-time samples kept per class for percentiles
+WAIT_WINDOW = 1024
+
+
+class QueuedJob:
+    def __init__(self, job_id: str, user_id: str, priority: str, run: Callable[[], Awaitable]):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.priority = priority
+        self.run = run
+        self.enqueued_at = time.monotonic()
+        # The job runs in its submitter's context (e.g. its trace), not in
+        # the context of whichever job happened to free the slot
+        self.context = contextvars.copy_context()
+        # Resolved with the outcome of run(), for jobs queued with ``schedule``
+        self.result: Optional[asyncio.Future] = None
+
+
+class ClassMetrics:
+    def __init__(self):
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.waits: Deque[float] = collections.deque(maxlen=WAIT_WINDOW)
+
+    def snapshot(self, queued: int, running: int) -> dict:
+        ordered = sorted(self.waits)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3) if ordered else None
+
+        return {
+            "queued": queued,
+            "running": running,
+            "submitted": self.submitted,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "waitP50Seconds": percentile(0.5),
+            "waitP95Seconds": percentile(0.95),
+            "waitMaxSeconds": round(ordered[-1], 3) if ordered else None,
+        }
+
+
+class JobScheduler:
+    def __init__(self, max_concurrent: int, max_per_user: int, class_weights: Dict[str, float]):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.class_weights = dict(class_weights)
+        self.queues: Dict[str, Dict[str, Deque[QueuedJob]]] = {c: collections.OrderedDict() for c in class_weights}
+        self.class_pass = {c: 0.0 for c in class_weights}
+        self.user_pass: Dict[Tuple[str, str], float] = {}
+        self.running: Dict[str, QueuedJob] = {}
+        self.running_per_user: Dict[str, int] = collections.Counter()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.metrics = {c: ClassMetrics() for c in class_weights}
+
+    # Selection
+
+    def _pick(self, running_per_user=None) -> Optional[QueuedJob]:
+        running_per_user = running_per_user if running_per_user is not None else self.running_per_user
+        candidates = []
+        for priority in self.class_weights:
+            users = [user for user, queue in self.queues[priority].items()
+                     if queue and running_per_user[user] < self.max_per_user]
+            if users:
+                user = min(users, key=lambda u: self.user_pass[(priority, u)])
+                candidates.append((self.class_pass[priority], priority, user))
+        if not candidates:
+            return None
+        _, priority, user = min(candidates)
+        return self.queues[priority][user][0]
+
+    def _pop(self, job: QueuedJob):
+        """Take the picked job off its queue and charge its class and user."""
+        self.class_pass[job.priority] += 1.0 / self.class_weights[job.priority]
+        self.user_pass[(job.priority, job.user_id)] += 1.0
+        queue = self.queues[job.priority][job.user_id]
+        queue.popleft()
+        if not queue:
+            del self.queues[job.priority][job.user_id]
+            # An idle user re-enters at its peers' pass anyway
+            del self.user_pass[(job.priority, job.user_id)]
+
+    def _activate(self, priority: str, user_id: str):
+        """Bring an idle class or user level with its active peers."""
+        active_classes = [c for c in self.class_weights if c != priority and any(self.queues[c].values())]
+        if not any(self.queues[priority].values()) and active_classes:
+            floor = min(self.class_pass[c] for c in active_classes)
+            self.class_pass[priority] = max(self.class_pass[priority], floor)
+
+        key = (priority, user_id)
+        active_users = [u for u, queue in self.queues[priority].items() if queue and u != user_id]
+        floor = min((self.user_pass[(priority, u)] for u in active_users), default=self.user_pass.get(key, 0.0))
+        if not self.queues[priority].get(user_id):
+            self.user_pass[key] = max(self.user_pass.get(key, 0.0), floor)
+
+    # Submission and dispatch
+
+    def submit(self, job_id: str, user_id: str, priority: str, run: Callable[[], Awaitable]):
+        """Queue ``run()`` as a job; it starts as soon as the fair-share policy allows."""
+        self._enqueue(QueuedJob(job_id, user_id, priority, run))
+
+    def schedule(self, job_id: str, user_id: str, priority: str, run: Callable[[], Awaitable]) -> asyncio.Future:
+        """Like ``submit``, for a caller that waits on it: returns a future of ``run()``'s result."""
+        job = QueuedJob(job_id, user_id, priority, run)
+        job.result = asyncio.get_event_loop().create_future()
+        # Retrieved even when every waiter has gone, so a failure isn't reported as never retrieved
+        job.result.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._enqueue(job)
+        return job.result
+
+    def _enqueue(self, job: QueuedJob):
+        if job.priority not in self.class_weights:
+            raise ValueError(f"Unknown priority class: {job.priority}")
+        self._activate(job.priority, job.user_id)
+        self.queues[job.priority].setdefault(job.user_id, collections.deque()).append(job)
+        self.metrics[job.priority].submitted += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while len(self.running) < self.max_concurrent:
+            job = self._pick()
+            if job is None:
+                return
+            self._pop(job)
+            self.running[job.job_id] = job
+            self.running_per_user[job.user_id] += 1
+            metrics = self.metrics[job.priority]
+            metrics.started += 1
+            metrics.waits.append(time.monotonic() - job.enqueued_at)
+            task = job.context.run(asyncio.create_task, job.run())
+            # A callback rather than a finally block, so that even a task
+            # cancelled before its first step releases its slot
+            task.add_done_callback(lambda task, job=job: self._finished(job, task))
+            self.tasks[job.job_id] = task
+
+    def _finished(self, job: QueuedJob, task: asyncio.Task):
+        if job.result is not None and not job.result.done():
+            if task.cancelled():
+                job.result.cancel()
+            elif task.exception() is not None:
+                job.result.set_exception(task.exception())
+            else:
+                job.result.set_result(task.result())
+        metrics = self.metrics[job.priority]
+        if task.cancelled():
+            metrics.cancelled += 1
+        elif task.exception() is not None:
+            # The job records its own failure; the scheduler only counts it
+            metrics.failed += 1
+        else:
+            metrics.completed += 1
+        del self.running[job.job_id]
+        self.tasks.pop(job.job_id, None)
+        self.running_per_user[job.user_id] -= 1
+        if not self.running_per_user[job.user_id]:
+            del self.running_per_user[job.user_id]
+        self._dispatch()
+
+    def cancel(self, job_id: str) -> bool:
+        """Remove a queued job, or cancel its task if it is running. False if unknown."""
+        for priority, users in self.queues.items():
+            for user_id, queue in users.items():
+                for job in queue:
+                    if job.job_id == job_id:
+                        queue.remove(job)
+                        if not queue:
+                            del users[user_id]
+                            self.user_pass.pop((priority, user_id), None)
+                        self.metrics[priority].cancelled += 1
+                        if job.result is not None:
+                            job.result.cancel()
+                        return True
+        task = self.tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        return False
+
+    # Introspection
+
+    def position(self, job_id: str) -> Optional[int]:
+        """
+        How many queued jobs will start before ``job_id``, by replaying the
+        policy on a copy of the queues (ignoring when running jobs finish).
+        """
+        if not any(job.job_id == job_id for users in self.queues.values() for q in users.values() for job in q):
+            return None
+        saved = (self.queues, self.class_pass, self.user_pass)
+        self.queues = {c: collections.OrderedDict((u, collections.deque(q)) for u, q in users.items())
+                       for c, users in saved[0].items()}
+        self.class_pass, self.user_pass = dict(saved[1]), dict(saved[2])
+        try:
+            # An estimate: per-user limits are ignored, since we can't know when running jobs finish
+            ahead = 0
+            while True:
+                job = self._pick(running_per_user=collections.Counter())
+                if job is None or job.job_id == job_id:
+                    return ahead
+                self._pop(job)
+                ahead += 1
+        finally:
+            self.queues, self.class_pass, self.user_pass = saved
+
+    def queued(self, priority: str) -> int:
+        return sum(len(q) for q in self.queues[priority].values())
+
+    def snapshot(self) -> dict:
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "maxPerUser": self.max_per_user,
+            "running": len(self.running),
+            "classes": {
+                priority: {
+                    "weight": self.class_weights[priority],
+                    **self.metrics[priority].snapshot(
+                        self.queued(priority),
+                        sum(1 for job in self.running.values() if job.priority == priority)
+                    ),
+                }
+                for priority in self.class_weights
+            },
+        }
@@ -0,0 +1,189 @@
+"""
+Live singing score.
+
+The singer's microphone is pitch-tracked as it streams in and compared with
+the reference melody, which is the pitch contour of the separated vocals. A
+sung frame is on pitch when it is within TOLERANCE_CENTS of the reference.
+Octave errors are forgiven. The match may come from anywhere within
+LAG_SECONDS of the frame's time, which absorbs the singer's timing and the
+audio round trip. Phrases are the runs of the reference melody between rests.
+Each phrase is scored once the stream has passed its end.
+
+A session holds the tracker's buffers, the phrase bounds and three counters
+per phrase. The reference is read from the memory-mapped pitch file, a few
+frames at a time, so memory per session doesn't grow with the stream.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import pitch
+import waveform
+
+TOLERANCE_CENTS = 50.0
+LAG_SECONDS = 0.15
+# Reference frames less confident than this are neither scored nor matched
+MIN_CONFIDENCE = 0.5
+# Rests shorter than this don't end a phrase
+PHRASE_GAP_SECONDS = 0.4
+MIN_PHRASE_SECONDS = 0.3
+
+
+def find_phrases(f0: np.ndarray, confidence: np.ndarray, frame_rate: float) -> np.ndarray:
+    """Phrases of a reference contour as an ``(n, 2)`` array of ``[first, end)`` frame indices."""
+    voiced = np.concatenate(([False], (f0 > 0) & (confidence >= MIN_CONFIDENCE * 255), [False]))
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8)))
+    if edges.size == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    starts, ends = edges[0::2], edges[1::2]
+
+    new_phrase = np.concatenate(([True], starts[1:] - ends[:-1] >= PHRASE_GAP_SECONDS * frame_rate))
+    first = np.flatnonzero(new_phrase)
+    starts, ends = starts[first], np.maximum.reduceat(ends, first)
+    keep = ends - starts >= MIN_PHRASE_SECONDS * frame_rate
+    return np.column_stack((starts[keep], ends[keep])).astype(np.int64)
+
+
+def decode_pcm16(data: bytes) -> np.ndarray:
+    """Float samples of mono little-endian 16-bit PCM."""
+    return waveform.to_float(np.frombuffer(data, dtype="<i2"))
+
+
+def pitch_message(result: dict) -> dict:
+    """
+    The sung frames of a ``LiveScore.push`` result, JSON-ready: f0 in Hz and
+    cents off the nearest reference note (None where nothing matched).
+    """
+    cents = result["cents"]
+    return {
+        "type": "pitch",
+        "time": round(result["time"], 3),
+        "f0": np.round(result["f0"], 1).tolist(),
+        "cents": [] if cents is None else [None if np.isinf(c) else round(c, 1) for c in cents.tolist()],
+    }
+
+
+class ReferenceMelody:
+    def __init__(self, f0: np.ndarray, confidence: np.ndarray, frame_rate: float):
+        self.f0 = f0
+        self.confidence = confidence
+        self.frame_rate = frame_rate
+        self.phrases = find_phrases(f0, confidence, frame_rate)
+
+    @classmethod
+    def load(cls, pitch_path: str) -> "ReferenceMelody":
+        return cls(*pitch.open_pitch(pitch_path))
+
+    @property
+    def duration(self) -> float:
+        return self.f0.shape[0] / self.frame_rate
+
+    def phrase_times(self, first: int = 0, last: Optional[int] = None) -> List[dict]:
+        """Start and end, in seconds, of the phrases with indices in ``[first, last)``."""
+        return [
+            {"index": index, "start": round(start / self.frame_rate, 3), "end": round(end / self.frame_rate, 3)}
+            for index, (start, end) in enumerate(self.phrases[first:last].tolist(), start=first)
+        ]
+
+
+class LiveScore:
+    """One singer's session: feed microphone chunks, collect finished phrases."""
+
+    def __init__(self, reference: ReferenceMelody, sample_rate: int, start: float = 0.0):
+        self.reference = reference
+        self.tracker = pitch.PitchTracker(sample_rate)
+        # Song time of the first microphone sample
+        self.start = start
+        self.lag_frames = int(round(LAG_SECONDS * reference.frame_rate))
+        phrase_count = reference.phrases.shape[0]
+        self.hits = np.zeros(phrase_count, dtype=np.int64)
+        self.scored = np.zeros(phrase_count, dtype=np.int64)
+        self.cents_error = np.zeros(phrase_count, dtype=np.float64)
+        # Phrases before this one have been reported
+        self.next_phrase = int(np.searchsorted(reference.phrases[:, 1], start * reference.frame_rate, side="right"))
+
+    @property
+    def position(self) -> float:
+        """Song time the stream has been analysed up to."""
+        return self.start + self.tracker.frames / self.tracker.frame_rate
+
+    def _match(self, times: np.ndarray, f0: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Reference frame of each sung frame, whether that frame is scored, and the best cents error near it."""
+        reference = self.reference
+        centre = np.rint(times * reference.frame_rate).astype(np.int64)
+        first = max(int(centre[0]) - self.lag_frames, 0)
+        last = min(int(centre[-1]) + self.lag_frames + 1, reference.f0.shape[0])
+        if last <= first:
+            return centre, np.zeros(centre.shape[0], dtype=bool), np.full(centre.shape[0], np.inf)
+        ref_f0 = np.array(reference.f0[first:last], dtype=np.float64)
+        ref_f0[np.asarray(reference.confidence[first:last]) < MIN_CONFIDENCE * 255] = 0.0
+
+        # Every reference frame within the lag of each sung frame, out-of-range ones unvoiced
+        window = centre[:, None] + np.arange(-self.lag_frames, self.lag_frames + 1) - first
+        inside = (window >= 0) & (window < ref_f0.shape[0])
+        candidates = np.where(inside, ref_f0[np.clip(window, 0, ref_f0.shape[0] - 1)], 0.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cents = 1200.0 * np.log2(f0[:, None] / candidates)
+            cents = np.abs((cents + 600.0) % 1200.0 - 600.0)
+        cents[~((candidates > 0) & (f0[:, None] > 0))] = np.inf
+        scored = candidates[:, self.lag_frames] > 0
+        return centre, scored, cents.min(axis=1)
+
+    def push(self, samples: np.ndarray) -> dict:
+        """
+        Analyse a chunk of mono float samples. Returns the sung pitch of the
+        frames it completed and the phrases that ended before them.
+        """
+        first_frame = self.tracker.frames
+        f0, _ = self.tracker.push(samples)
+        result = {"time": self.start + first_frame / self.tracker.frame_rate, "f0": f0, "cents": None, "phrases": []}
+        if f0.shape[0]:
+            times = self.start + (first_frame + np.arange(f0.shape[0])) / self.tracker.frame_rate
+            centre, scored, cents = self._match(times, f0.astype(np.float64))
+            result["cents"] = cents
+            self._count(centre, scored, cents)
+        # A phrase is final once no later frame can match its last reference frame
+        result["phrases"] = self._finished(self.position * self.reference.frame_rate - self.lag_frames)
+        return result
+
+    def _count(self, centre: np.ndarray, scored: np.ndarray, cents: np.ndarray):
+        phrases = self.reference.phrases
+        if phrases.shape[0] == 0:
+            return
+        phrase = np.searchsorted(phrases[:, 0], centre, side="right") - 1
+        counted = scored & (phrase >= 0) & (centre < phrases[np.maximum(phrase, 0), 1])
+        phrase = phrase[counted]
+        hit = cents[counted] <= TOLERANCE_CENTS
+        np.add.at(self.scored, phrase, 1)
+        np.add.at(self.hits, phrase, hit)
+        np.add.at(self.cents_error, phrase[hit], cents[counted][hit])
+
+    def _finished(self, frame: float) -> List[dict]:
+        finished = []
+        phrases = self.reference.phrases
+        while self.next_phrase < phrases.shape[0] and phrases[self.next_phrase, 1] <= frame:
+            finished.append(self.phrase_score(self.next_phrase))
+            self.next_phrase += 1
+        return finished
+
+    def phrase_score(self, index: int) -> dict:
+        scored, hits = int(self.scored[index]), int(self.hits[index])
+        return {
+            **self.reference.phrase_times(index, index + 1)[0],
+            "score": round(100.0 * hits / scored, 1) if scored else None,
+            "meanCentsError": round(self.cents_error[index] / hits, 1) if hits else None,
+        }
+
+    def finish(self) -> Tuple[List[dict], Optional[float]]:
+        """
+        Report the phrase the stream stopped in, if any of it was sung, and
+        the overall score over every frame scored in the session.
+        """
+        remaining = []
+        if self.next_phrase < self.reference.phrases.shape[0] and self.scored[self.next_phrase]:
+            remaining.append(self.phrase_score(self.next_phrase))
+            self.next_phrase += 1
+        total = int(self.scored.sum())
+        return remaining, round(100.0 * int(self.hits.sum()) / total, 1) if total else None
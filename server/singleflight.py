@@ -0,0 +1,125 @@
+"""
+Single-flight coalescing of processing jobs.
+
+A job whose upload has the same content key (the audio bytes plus the
+processing options) as a pipeline that is still queued or running attaches
+to that pipeline instead of starting its own. The pipeline runs under the
+first job's ID and every attached job receives its status updates and, at
+the end, hard links to its outputs.
+
+Jobs can detach again; the pipeline keeps running while at least one job is
+still attached and is cancelled when the last one leaves.
+"""
+
+import hashlib
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_key(path: str, *options) -> str:
+    """SHA-256 of the file at ``path`` and the processing options that affect its outputs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    for option in options:
+        digest.update(b"\0" + str(option).encode())
+    return digest.hexdigest()
+
+
+def share_outputs(source_dir: str, target_dirs: List[str]):
+    """Give each target directory the files of ``source_dir``, as hard links where possible."""
+    names = [name for name in os.listdir(source_dir) if os.path.isfile(os.path.join(source_dir, name))]
+    for target_dir in target_dirs:
+        os.makedirs(target_dir, exist_ok=True)
+        for name in names:
+            source, target = os.path.join(source_dir, name), os.path.join(target_dir, name)
+            if os.path.exists(target):
+                os.remove(target)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+
+
+class Flight:
+    """One pipeline and the jobs waiting on its result."""
+
+    def __init__(self, key: str, leader: str, input_path: Optional[str] = None):
+        self.key = key
+        # The job ID the pipeline runs under, even if that job detaches later
+        self.leader = leader
+        self.input_path = input_path
+        self.subscribers: List[str] = [leader]
+        # Fields of the latest status update, for jobs that attach midway
+        self.last_update: dict = {}
+        self.closed = False
+
+
+class SingleFlight:
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.leaders: Dict[str, Flight] = {}
+        self.jobs: Dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def join(self, key: str, job_id: str) -> Tuple[Flight, bool]:
+        """Attach ``job_id`` to the flight for ``key``, starting one if needed. True if it is new."""
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight(key, job_id)
+            self.flights[key] = flight
+            self.leaders[job_id] = flight
+            self.started += 1
+        else:
+            flight.subscribers.append(job_id)
+            self.coalesced += 1
+        self.jobs[job_id] = flight
+        return flight, flight.leader == job_id
+
+    def led_by(self, job_id: str) -> Optional[Flight]:
+        """The open flight whose pipeline runs under ``job_id``."""
+        return self.leaders.get(job_id)
+
+    def detach(self, job_id: str) -> Optional[Flight]:
+        """
+        Unsubscribe a job. Returns its flight, or None if the job is not in
+        one. A flight left without subscribers is closed, and its pipeline
+        should be cancelled.
+        """
+        flight = self.jobs.pop(job_id, None)
+        if flight is None:
+            return None
+        flight.subscribers.remove(job_id)
+        if not flight.subscribers:
+            self._close(flight)
+            self.cancelled += 1
+        return flight
+
+    def finish(self, job_id: str) -> Optional[Flight]:
+        """Close the flight led by ``job_id`` to new subscribers and return it."""
+        flight = self.leaders.get(job_id)
+        if flight is not None:
+            self._close(flight)
+        return flight
+
+    def _close(self, flight: Flight):
+        flight.closed = True
+        self.flights.pop(flight.key, None)
+        self.leaders.pop(flight.leader, None)
+        for job_id in flight.subscribers:
+            self.jobs.pop(job_id, None)
+
+    def snapshot(self) -> dict:
+        return {
+            "inFlight": len(self.flights),
+            "attachedJobs": len(self.jobs),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,178 @@
+"""
+Load-balanced pool of Spleeter backends.
+
+Jobs are routed to the healthy backend with the fewest requests in flight,
+counting both the requests this process has outstanding and the queue depth
+the backend last reported on ``/health``. Backends that fail health checks
+or refuse/drop a job are taken out of rotation until a health check passes
+again, and a failed job is retried on another backend. A backend whose
+models are still warming up counts as unhealthy. A backend that turns a job
+away because it is at its own concurrency limit is busy, not broken: the
+job moves on to another backend, and the busy one stays in rotation.
+
+Related jobs, such as the tracks of one album, can share an affinity key.
+They then go to the backend chosen for the last of them, while it is no
+busier than the others, so they reuse its warm model and its kept-alive
+connections.
+"""
+
+import asyncio
+import collections
+import itertools
+import time
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+import aiohttp
+
+T = TypeVar("T")
+
+# Affinity keys remembered, least recently used dropped first
+AFFINITY_SIZE = 256
+# In-flight requests a preferred backend may have beyond the least-loaded one
+AFFINITY_SLACK = 1
+
+
+class BackendUnavailable(Exception):
+    """The backend could not take or finish the request; another one may."""
+
+
+class BackendBusy(BackendUnavailable):
+    """The backend is healthy but has no free slot for the request right now."""
+
+
+class SpleeterBackend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.reported_active = 0
+        self.failures = 0
+        self.busy_rejections = 0
+        self.completed = 0
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def load(self) -> int:
+        return self.outstanding + self.reported_active
+
+    def mark_failed(self, error: str):
+        self.healthy = False
+        self.failures += 1
+        self.last_error = error
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "reportedActive": self.reported_active,
+            "completed": self.completed,
+            "failures": self.failures,
+            "busyRejections": self.busy_rejections,
+            "lastChecked": self.last_checked,
+            "lastError": self.last_error,
+        }
+
+
+class SpleeterPool:
+    def __init__(self, urls: List[str], max_attempts: int = 3, health_interval: float = 10.0,
+                 health_timeout: float = 3.0):
+        if not urls:
+            raise ValueError("At least one Spleeter backend URL is required")
+        self.backends = [SpleeterBackend(url) for url in urls]
+        self.max_attempts = max_attempts
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._tiebreak = itertools.count()
+        self.affinity: "collections.OrderedDict[str, SpleeterBackend]" = collections.OrderedDict()
+
+    def choose(self, exclude=(), affinity: Optional[str] = None) -> Optional[SpleeterBackend]:
+        """
+        The least-loaded healthy backend not in ``exclude``, rotating between
+        equals, or the backend remembered for ``affinity`` if it is nearly as idle.
+        """
+        candidates = [b for b in self.backends if b.healthy and b not in exclude]
+        if not candidates:
+            # Everything looks down; still try the ones we haven't tried yet
+            candidates = [b for b in self.backends if b not in exclude]
+        if not candidates:
+            return None
+        lowest = min(b.load for b in candidates)
+        preferred = self.affinity.get(affinity) if affinity else None
+        if preferred in candidates and preferred.load <= lowest + AFFINITY_SLACK:
+            return preferred
+        least_loaded = [b for b in candidates if b.load == lowest]
+        return least_loaded[next(self._tiebreak) % len(least_loaded)]
+
+    def remember(self, affinity: str, backend: SpleeterBackend):
+        self.affinity[affinity] = backend
+        self.affinity.move_to_end(affinity)
+        while len(self.affinity) > AFFINITY_SIZE:
+            self.affinity.popitem(last=False)
+
+    async def run(self, request: Callable[[str], Awaitable[T]], affinity: Optional[str] = None) -> T:
+        """
+        Call ``request(base_url)`` on the best backend, failing over to the
+        next one when it raises ``BackendUnavailable`` or a connection error.
+        Only the latter take the backend out of rotation; ``BackendBusy`` doesn't.
+        """
+        tried = []
+        last_error = None
+        for _ in range(min(self.max_attempts, len(self.backends))):
+            backend = self.choose(exclude=tried, affinity=affinity)
+            if backend is None:
+                break
+            tried.append(backend)
+            if affinity:
+                # Remembered as soon as chosen, so jobs of the group running alongside this one follow it
+                self.remember(affinity, backend)
+            backend.outstanding += 1
+            try:
+                result = await request(backend.url)
+                backend.completed += 1
+                return result
+            except BackendBusy as e:
+                last_error = e
+                backend.busy_rejections += 1
+                print(f"[INFO] Spleeter backend {backend.url} is busy, trying another: {str(e)}")
+            except (BackendUnavailable, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as e:
+                last_error = e
+                backend.mark_failed(f"{type(e).__name__}: {str(e)}")
+                print(f"[WARNING] Spleeter backend {backend.url} failed, trying another: {backend.last_error}")
+            finally:
+                backend.outstanding -= 1
+        # Still BackendUnavailable, so the caller can treat the outage as transient and retry later
+        raise BackendUnavailable(f"All Spleeter backends failed: {str(last_error)}") from last_error
+
+    async def check(self, session: aiohttp.ClientSession, backend: SpleeterBackend):
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.health_timeout)
+            async with session.get(f"{backend.url}/health", timeout=timeout) as response:
+                if response.status != 200:
+                    raise BackendUnavailable(f"health check returned {response.status}")
+                data = await response.json()
+            # Don't route jobs to a backend whose models are still warming up
+            if data.get("ready") is False:
+                raise BackendUnavailable("models are still loading")
+            separate = (data.get("limits") or {}).get("separate") or {}
+            backend.reported_active = separate.get("active", 0)
+            if not backend.healthy:
+                print(f"[INFO] Spleeter backend {backend.url} is healthy again")
+            backend.healthy = True
+        except Exception as e:
+            if backend.healthy:
+                print(f"[WARNING] Spleeter backend {backend.url} failed health check: {str(e)}")
+            backend.healthy = False
+            backend.last_error = f"{type(e).__name__}: {str(e)}"
+        backend.last_checked = time.time()
+
+    async def monitor(self, session: aiohttp.ClientSession):
+        """Poll every backend's /health forever."""
+        while True:
+            await asyncio.gather(*(self.check(session, b) for b in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    def status(self) -> List[dict]:
+        return [backend.status() for backend in self.backends]
@@ -0,0 +1,45 @@
+"""
+Startup phase timing and readiness for the API process.
+
+Module import and each startup hook are timed as named phases. The process
+reports ready only after every startup hook has run, so a new replica gets
+no traffic until its checks are done. Liveness is separate from readiness:
+a process that is still warming up is alive but not ready.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StartupTracker:
+    def __init__(self, started: Optional[float] = None):
+        # perf_counter value at which timing began (normally the top of main.py)
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready_after: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = round(seconds, 4)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark_ready(self):
+        self.ready_after = round(time.perf_counter() - self.started, 4)
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "readyAfterSeconds": self.ready_after,
+            "phases": dict(self.phases),
+        }
@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batches import Batch, prune
+
+
+def album():
+    return Batch("b1", "u1", {"j1": "01.mp3", "j2": "02.mp3", "j3": "03.mp3", "j4": "04.mp3"})
+
+
+def test_progress_is_the_mean_over_children():
+    batch = album()
+    assert batch.status()["state"] == "uploaded"
+    assert batch.status()["progress"] == 0.0
+
+    batch.update("j1", "processing", 0.5)
+    batch.update("j2", "completed", None)
+    status = batch.status()
+    assert status["state"] == "processing"
+    assert status["progress"] == (0.5 + 1.0) / 4
+    assert status["counts"] == {"processing": 1, "completed": 1, "uploaded": 2}
+    assert [job["filename"] for job in status["jobs"]] == ["01.mp3", "02.mp3", "03.mp3", "04.mp3"]
+
+
+def test_progress_without_a_value_is_kept():
+    batch = album()
+    batch.update("j1", "processing", 0.5)
+    assert batch.update("j1", "processing", None) is False
+    assert batch.status()["jobs"][0]["progress"] == 0.5
+    assert batch.update("unknown", "completed", 1.0) is False
+
+
+def test_finished_batch_states():
+    batch = album()
+    for job_id in ("j1", "j2", "j3"):
+        batch.update(job_id, "completed", 1.0)
+    assert not batch.done and batch.finished_at is None
+    batch.update("j4", "failed", 0.3)
+    assert batch.done and batch.finished_at is not None
+    # Failed tracks count as done for progress, and the batch as partially done
+    assert batch.status()["progress"] == 1.0
+    assert batch.state() == "partial"
+
+    failed = Batch("b2", "u1", {"j1": "a.mp3", "j2": "b.wav"})
+    failed.update("j1", "failed", 0.1)
+    failed.update("j2", "cancelled", 0.0)
+    assert failed.state() == "failed"
+
+    completed = Batch("b3", "u1", {"j1": "a.mp3"})
+    completed.update("j1", "completed", None)
+    assert completed.state() == "completed"
+
+
+def test_expired_batches_are_pruned():
+    saved = {}
+
+    class Store:
+        def set(self, key, value, ex=None):
+            saved[key] = (value, ex)
+
+    kept, lost = album(), Batch("b2", "u1", {"j5": "05.mp3"})
+    kept.save(Store(), ttl=None)
+    lost.save(Store(), ttl=60)
+    assert saved["batch:b2"][1] == 60
+    job_batches = {job_id: batch for batch in (kept, lost) for job_id in batch.children}
+
+    assert prune(job_batches, now=lost.expires_at - 1) == 0
+    assert prune(job_batches, now=lost.expires_at) == 1
+    assert sorted(job_batches) == ["j1", "j2", "j3", "j4"]
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoints import StageCheckpoints
+
+PIPELINE = ["ingest", "separate", "peaks", "transcribe"]
+
+
+def test_resume_after_completed_stages(tmp_path):
+    for name in ("source.wav", "vocals.wav"):
+        (tmp_path / name).write_bytes(b"data")
+    record = StageCheckpoints()
+    record.complete("ingest", ["source.wav"])
+    record.complete("separate", ["vocals.wav"])
+    record.fail("peaks", "disk full")
+    assert record.resume_index(PIPELINE, str(tmp_path)) == 2
+
+    record.complete("peaks", [])
+    record.complete("transcribe", [])
+    assert record.resume_index(PIPELINE, str(tmp_path)) == len(PIPELINE)
+
+
+def test_checkpoint_with_missing_artifact_is_incomplete(tmp_path):
+    (tmp_path / "source.wav").write_bytes(b"data")
+    record = StageCheckpoints()
+    record.complete("ingest", ["source.wav"])
+    record.complete("separate", ["vocals.wav"])
+    assert record.resume_index(PIPELINE, str(tmp_path)) == 1
+
+
+def test_retries_survive_a_round_trip():
+    record = StageCheckpoints()
+    record.start("transcribe")
+    assert record.retried("transcribe") == 1
+    record.fail("transcribe", "timeout")
+
+    restored = StageCheckpoints(record.to_dict())
+    assert restored.retried("transcribe") == 2
+    restored.complete("transcribe", ["lyrics.json"])
+    assert "error" not in restored.to_dict()["transcribe"]
+    # The original record is not shared with the copy
+    assert record.to_dict()["transcribe"]["state"] == "failed"
@@ -0,0 +1,48 @@
+import json
+import os
+import shutil
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+# Add the parent directory to the Python path so we can import ingest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+
+
+def write_wav(path, samples, sample_rate):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+
+
+def test_load_pcm_memory_maps_frames(tmp_path):
+    samples = np.arange(2000, dtype=np.int16).reshape(-1, 2)
+    path = tmp_path / "source.wav"
+    write_wav(path, samples, 44100)
+
+    pcm = ingest.load_pcm(str(path))
+    assert isinstance(pcm, np.memmap)
+    assert pcm.shape == (1000, 2)
+    np.testing.assert_array_equal(pcm[10:20], samples[10:20])
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_decode_to_canonical(tmp_path):
+    t = np.arange(22050) / 22050
+    mono = (0.5 * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+    upload = tmp_path / "upload.mp3"
+    write_wav(upload, mono.reshape(-1, 1), 22050)
+
+    metadata = ingest.decode_to_canonical(str(upload), str(tmp_path))
+
+    assert metadata["sampleRate"] == ingest.CANONICAL_SAMPLE_RATE
+    assert metadata["channels"] == ingest.CANONICAL_CHANNELS
+    assert metadata["duration"] == pytest.approx(1.0, abs=0.01)
+    assert ingest.read_metadata(str(tmp_path)) == json.loads(json.dumps(metadata))
+    assert ingest.load_pcm(str(tmp_path / ingest.CANONICAL_FILENAME)).shape[1] == 2
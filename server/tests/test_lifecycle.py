@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+# Add the parent directory to the Python path so we can import lifecycle
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lifecycle
+
+DAY = 86400
+
+
+def make_config(**overrides):
+    values = dict(upload_ttl=DAY, intermediate_ttl=3600, output_ttl=30 * DAY,
+                  disk_quota_bytes=0, sweep_interval=600)
+    values.update(overrides)
+    return lifecycle.LifecycleConfig(**values)
+
+
+def write_file(path, size, age):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def storage(tmp_path):
+    uploads, outputs = tmp_path / "uploads", tmp_path / "outputs"
+    uploads.mkdir()
+    outputs.mkdir()
+    return str(uploads), str(outputs)
+
+
+@pytest.fixture
+def redis_mock():
+    mock = MagicMock()
+    mock.get.return_value = None
+    mock.zscore.return_value = None
+    mock.exists.return_value = 0
+    return mock
+
+
+def test_sweep_applies_retention_policies(storage, redis_mock):
+    uploads, outputs = storage
+    write_file(os.path.join(uploads, "old.mp3"), 10, 2 * DAY)
+    write_file(os.path.join(uploads, "new.mp3"), 10, 60)
+    write_file(os.path.join(outputs, "job-a", "vocals.wav"), 100, DAY)
+    write_file(os.path.join(outputs, "job-a", "vocals_converted.mp3"), 50, 2 * 3600)
+    write_file(os.path.join(outputs, "job-b", "vocals.wav"), 100, 40 * DAY)
+    os.utime(os.path.join(outputs, "job-b"), (time.time() - 40 * DAY,) * 2)
+
+    metrics = lifecycle.SweeperMetrics()
+    lifecycle.sweep(redis_mock, uploads, outputs, make_config(), metrics)
+
+    assert os.listdir(uploads) == ["new.mp3"]
+    assert os.listdir(os.path.join(outputs, "job-a")) == ["vocals.wav"]
+    assert not os.path.exists(os.path.join(outputs, "job-b"))
+    redis_mock.delete.assert_called_once_with("job:job-b", "project:job-b")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["filesRemoved"] == {"upload": 1, "partial": 0, "intermediate": 1, "output": 1}
+    assert snapshot["bytesFreed"]["intermediate"] == 50
+    assert snapshot["outputBytes"] == 100
+
+
+def test_sweep_evicts_least_recently_accessed_over_quota(storage, redis_mock):
+    uploads, outputs = storage
+    for job_id in ("job-1", "job-2", "job-3"):
+        write_file(os.path.join(outputs, job_id, "vocals.wav"), 1000, 60)
+    access = {"job-1": time.time() - 10, "job-2": time.time() - 500, "job-3": time.time()}
+    redis_mock.zscore.side_effect = lambda key, job_id: access[job_id]
+
+    metrics = lifecycle.SweeperMetrics()
+    lifecycle.sweep(redis_mock, uploads, outputs, make_config(disk_quota_bytes=2500), metrics)
+
+    assert sorted(os.listdir(outputs)) == ["job-1", "job-3"]
+    assert metrics.snapshot()["quotaEvictions"] == 1
+
+
+def test_sweep_skips_active_jobs(storage, redis_mock):
+    uploads, outputs = storage
+    write_file(os.path.join(uploads, "job-x.mp3"), 10, 2 * DAY)
+    write_file(os.path.join(outputs, "job-x", "vocals_converted.mp3"), 10, 2 * DAY)
+    redis_mock.get.return_value = json.dumps({"state": "processing"})
+
+    lifecycle.sweep(redis_mock, uploads, outputs, make_config(), lifecycle.SweeperMetrics())
+
+    assert os.listdir(uploads) == ["job-x.mp3"]
+    assert os.listdir(os.path.join(outputs, "job-x")) == ["vocals_converted.mp3"]
+
+
+def test_sweep_skips_leased_jobs(storage, redis_mock):
+    uploads, outputs = storage
+    for job_id in ("job-leased", "job-free"):
+        write_file(os.path.join(outputs, job_id, "vocals.wav"), 100, 40 * DAY)
+        os.utime(os.path.join(outputs, job_id), (time.time() - 40 * DAY,) * 2)
+    # e.g. extra stems being separated for a finished job
+    redis_mock.exists.side_effect = lambda key: key == lifecycle.LEASE_KEY.format(job_id="job-leased")
+
+    lifecycle.sweep(redis_mock, uploads, outputs, make_config(), lifecycle.SweeperMetrics())
+
+    assert os.listdir(outputs) == ["job-leased"]
+
+
+def test_lease_is_released_by_its_holder(redis_mock):
+    lifecycle.acquire_lease(redis_mock, "job-1", "4stems", ttl=600)
+    pipe = redis_mock.pipeline.return_value
+    pipe.sadd.assert_called_once_with("lifecycle:lease:job-1", "4stems")
+    pipe.expire.assert_called_once_with("lifecycle:lease:job-1", 600)
+
+    lifecycle.release_lease(redis_mock, "job-1", "4stems")
+    redis_mock.srem.assert_called_once_with("lifecycle:lease:job-1", "4stems")
+
+
+def test_sweep_removes_abandoned_partial_uploads(storage, redis_mock):
+    uploads, outputs = storage
+    partial = os.path.join(uploads, "partial")
+    write_file(os.path.join(partial, "live.part"), 10, 2 * DAY)
+    write_file(os.path.join(partial, "abandoned.part"), 10, 2 * DAY)
+    write_file(os.path.join(partial, "recent.part"), 10, 60)
+    redis_mock.exists.side_effect = lambda key: key == "upload:live"
+
+    metrics = lifecycle.SweeperMetrics()
+    lifecycle.sweep(redis_mock, uploads, outputs, make_config(), metrics, partial_dir=partial)
+
+    assert sorted(os.listdir(partial)) == ["live.part", "recent.part"]
+    assert metrics.files_removed["partial"] == 1
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the Python path so we can import lyrics_index
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lyrics_index
+from lyrics_index import LyricsIndex
+
+
+@pytest.fixture
+def whisper_response():
+    return {
+        "segments": [
+            {"start": 0.0, "end": 4.0, "text": " Hello darkness"},
+            {"start": 4.0, "end": 9.0, "text": " my old friend"},
+            {"start": 20.0, "end": 25.0, "text": " I've come to talk"},
+        ],
+        "words": [
+            {"word": "Hello", "start": 0.5, "end": 1.5},
+            {"word": "darkness", "start": 1.5, "end": 3.8},
+            {"word": "my", "start": 4.1, "end": 4.6},
+            {"word": "old", "start": 4.6, "end": 5.5},
+            {"word": "friend", "start": 5.5, "end": 8.0},
+            {"word": "I've", "start": 20.2, "end": 21.0},
+            {"word": "come", "start": 21.0, "end": 22.0},
+            {"word": "to", "start": 22.0, "end": 22.5},
+            {"word": "talk", "start": 22.5, "end": 24.0},
+        ],
+    }
+
+
+def test_build_lyrics_attaches_words(whisper_response):
+    lyrics = lyrics_index.build_lyrics(whisper_response["segments"], whisper_response["words"])
+    assert [line["text"] for line in lyrics] == [" Hello darkness", " my old friend", " I've come to talk"]
+    assert [w["text"] for w in lyrics[1]["words"]] == ["my", "old", "friend"]
+    assert lyrics[0]["words"][0] == {"startTime": 0.5, "endTime": 1.5, "text": "Hello"}
+
+
+def test_build_lyrics_without_words(whisper_response):
+    lyrics = lyrics_index.build_lyrics(whisper_response["segments"])
+    assert all("words" not in line for line in lyrics)
+    assert lyrics[2] == {"startTime": 20.0, "endTime": 25.0, "text": " I've come to talk"}
+
+
+def test_query_window(whisper_response):
+    index = LyricsIndex.from_lyrics(
+        lyrics_index.build_lyrics(whisper_response["segments"], whisper_response["words"])
+    )
+
+    window = index.query(4.5, 5.0)
+    assert [line["index"] for line in window["lines"]] == [1]
+    assert [w["text"] for w in window["lines"][0]["words"]] == ["my", "old"]
+
+    # End is exclusive and the gap between lines returns nothing
+    assert index.query(10.0, 20.0)["lines"] == []
+    assert [line["index"] for line in index.query(3.9, 20.1)["lines"]] == [0, 1, 2]
+
+
+def test_save_load_roundtrip(whisper_response, tmp_path):
+    lyrics = lyrics_index.build_lyrics(whisper_response["segments"], whisper_response["words"])
+    LyricsIndex.from_lyrics(lyrics).save(str(tmp_path / lyrics_index.LYRICS_INDEX_FILENAME))
+
+    index = lyrics_index.load_lyrics_index(str(tmp_path))
+    assert index.query(21.5, 22.2)["lines"][0]["words"] == [
+        {"startTime": 21.0, "endTime": 22.0, "text": "come"},
+        {"startTime": 22.0, "endTime": 22.5, "text": "to"},
+    ]
+    assert lyrics_index.load_lyrics_index(str(tmp_path / "missing")) is None
@@ -87,4 +87,423 @@ def test_get_job_status(mock_redis):
     data = response.json()
     assert data['state'] == "processing"
     assert data['progress'] == 0.5
-    assert data['error'] is None 
\ No newline at end of file
+    assert data['error'] is None 
+
+
+def test_stage_plan_skips_unneeded_stages():
+    from main import ProcessingMode, stage_plan
+    assert stage_plan(ProcessingMode.full) == {"separate": True, "transcribe": True, "transcribeVocals": True}
+    assert stage_plan(ProcessingMode.instrumental) == {"separate": True, "transcribe": False, "transcribeVocals": False}
+    with patch('main.LYRICS_MODE_SOURCE', "mix"):
+        assert stage_plan(ProcessingMode.lyrics) == {"separate": False, "transcribe": True, "transcribeVocals": False}
+    with patch('main.LYRICS_MODE_SOURCE', "vocals"):
+        assert stage_plan(ProcessingMode.lyrics) == {"separate": True, "transcribe": True, "transcribeVocals": True}
+
+
+def test_separation_tiers_report_latency():
+    from main import separation_metrics
+    separation_metrics["quality"].record(12.0)
+    response = client.get("/api/spleeter/tiers")
+    assert response.status_code == 200
+    tiers = response.json()["tiers"]
+    assert set(tiers) == {"fast", "quality"}
+    assert tiers["quality"]["requests"] >= 1
+
+
+def test_liveness_and_readiness(mock_redis):
+    import startup
+    assert client.get("/live").status_code == 200
+
+    tracker = startup.StartupTracker()
+    with patch('main.startup_tracker', tracker):
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+
+        with tracker.phase("ffmpegCheck"):
+            pass
+        tracker.mark_ready()
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert "ffmpegCheck" in response.json()["phases"]
+
+        mock_redis.ping.side_effect = Exception("Connection refused")
+        assert client.get("/ready").status_code == 503
+
+
+def test_profiler_endpoint_is_disabled_by_default():
+    assert client.post("/api/debug/profile?seconds=1").status_code == 404
+    with patch('main.PROFILER_TOKEN', "secret"):
+        assert client.post("/api/debug/profile?seconds=1", headers={"X-Debug-Token": "wrong"}).status_code == 401
+        response = client.post("/api/debug/profile?seconds=0.05", headers={"X-Debug-Token": "secret"})
+        assert response.status_code == 200
+        assert int(response.headers["X-Profile-Samples"]) > 0
+
+
+def test_retry_resumes_at_first_incomplete_stage(tmp_path):
+    import asyncio
+    import openai
+    import main
+    import tracing
+    from main import ProcessingMode, ProcessingStatus
+
+    statuses = {}
+    calls = {"separate": 0, "transcribe": 0}
+    failures = [openai.error.RateLimitError("slow down"), Exception("No segments found in transcription response")]
+
+    def touch(*names):
+        for name in names:
+            with open(tmp_path / "job-1" / name, "wb") as f:
+                f.write(b"data")
+
+    async def separate(job_id, source_path, job_output_dir, tier):
+        calls["separate"] += 1
+        touch("vocals.wav", "accompaniment.wav")
+        return {"vocals": str(tmp_path / "job-1" / "vocals.wav")}
+
+    async def transcribe(audio_path, job_output_dir, compact=False):
+        calls["transcribe"] += 1
+        if failures:
+            raise failures.pop(0)
+        touch("lyrics.json", "lyrics_index.npz")
+
+    with patch('main.OUTPUT_DIR', str(tmp_path)), \
+            patch('main.STAGE_RETRY_BACKOFF_SECONDS', 0), \
+            patch('main.tracer', tracing.Tracer("api")), \
+            patch('main.get_job_status', lambda job_id: statuses.get(job_id)), \
+            patch('main.set_job_status', lambda job_id, status: statuses.__setitem__(job_id, status)), \
+            patch('main.ingest.decode_to_canonical',
+                  lambda input_path, output_dir: touch("source.wav") or {"decodeSeconds": 0.0, "duration": 1.0}), \
+            patch('main.separate_stems', separate), \
+            patch('main.generate_waveform_peaks', AsyncMock()), \
+            patch('main.extract_pitch_contour', AsyncMock()), \
+            patch('main.transcribe_lyrics', transcribe):
+        statuses["job-1"] = ProcessingStatus(state="uploaded")
+        with pytest.raises(Exception):
+            asyncio.run(main.process_audio("job-1", str(tmp_path / "job-1.mp3"), ProcessingMode.full))
+        failed = statuses["job-1"]
+        assert failed.state == "failed"
+        # The rate limit was retried in place, the bad response was not
+        assert calls == {"separate": 1, "transcribe": 2}
+        assert failed.stages["separate"]["state"] == "completed"
+        assert failed.stages["transcribe"] == {
+            "state": "failed", "retries": 1, "error": "No segments found in transcription response"
+        }
+
+        asyncio.run(main.process_audio("job-1", str(tmp_path / "job-1.mp3"), ProcessingMode.full))
+        assert statuses["job-1"].state == "completed"
+        assert calls == {"separate": 1, "transcribe": 3}
+        assert statuses["job-1"].stages["transcribe"]["artifacts"] == ["lyrics.json", "lyrics_index.npz"]
+
+
+def test_extra_stems_are_separated_once_for_concurrent_requests(tmp_path, mock_redis):
+    import asyncio
+    import main
+    import tracing
+    from datetime import datetime
+    from fastapi import HTTPException
+    from main import ProcessingStatus, User
+
+    owner = User(id="u1", email="u1@example.com", username="u1", created_at=datetime.utcnow())
+    other = User(id="u2", email="u2@example.com", username="u2", created_at=datetime.utcnow())
+    mock_redis.get.return_value = json.dumps({"jobId": "job-1", "userId": "u1"})
+
+    job_dir = tmp_path / "job-1"
+    job_dir.mkdir()
+    (job_dir / "source.wav").write_bytes(b"pcm")
+    requests = []
+
+    async def separate(source_path, output_dir, params):
+        requests.append(params)
+        await asyncio.sleep(0.01)
+        stems = {}
+        for name in params["only"].split(","):
+            stems[name] = os.path.join(output_dir, f"{name}.wav")
+            with open(stems[name], "wb") as f:
+                f.write(b"stem")
+        return {}, stems
+
+    async def scenario():
+        return await asyncio.gather(
+            main.get_extra_stem("job-1", "drums", owner),
+            main.get_extra_stem("job-1", "bass", owner),
+            main.get_extra_stem("job-1", "drums", owner),
+        )
+
+    with patch('main.OUTPUT_DIR', str(tmp_path)), \
+            patch('main.get_job_status', lambda job_id: ProcessingStatus(state="completed")), \
+            patch('main.request_separation', separate), \
+            patch('main.tracer', tracing.Tracer("api")):
+        # Only the owner may have a job's stems separated
+        with pytest.raises(HTTPException) as denied:
+            asyncio.run(main.get_extra_stem("job-1", "drums", other))
+        assert denied.value.status_code == 403
+        assert requests == []
+
+        results = asyncio.run(scenario())
+        # Drums and bass both come from the 4stems model, so one request serves all three
+        assert requests == [{"stems": "4stems", "only": "drums,bass"}]
+        assert [r["computed"] for r in results] == [True, False, False]
+        assert results[1]["url"] == "/output/job-1/bass.wav"
+        assert sorted(os.listdir(job_dir)) == ["bass.wav", "drums.wav", "source.wav"]
+        # The job's outputs were leased from the storage sweeper for the separation
+        mock_redis.pipeline.return_value.sadd.assert_called_once_with("lifecycle:lease:job-1", "4stems")
+        mock_redis.srem.assert_called_once_with("lifecycle:lease:job-1", "4stems")
+
+        # Cached from now on
+        assert asyncio.run(main.get_extra_stem("job-1", "drums", owner))["computed"] is False
+        assert len(requests) == 1
+
+
+def test_lyrics_from_compacted_vocals_are_in_song_time(tmp_path):
+    import asyncio
+    import main
+    import tracing
+    from test_voicing import vocals_with_gaps
+
+    vocals = vocals_with_gaps(tmp_path)
+    sent = []
+
+    async def whisper(path):
+        sent.append(os.path.basename(path))
+        # The first sung region starts the compacted audio
+        return {
+            "segments": [{"start": 0.25, "end": 2.25, "text": "first"}, {"start": 3.25, "end": 4.25, "text": "second"}],
+            "words": [{"start": 3.3, "end": 3.6, "word": "second"}],
+        }
+
+    with patch('main.transcribe_audio', whisper), patch('main.tracer', tracing.Tracer("api")):
+        asyncio.run(main.transcribe_lyrics(str(vocals), str(tmp_path), compact=True))
+
+    assert sent[0].startswith("vocals_voiced")
+    with open(tmp_path / "lyrics.json") as f:
+        lyrics = json.load(f)
+    assert [(line["startTime"], line["endTime"]) for line in lyrics] == [(5.0, 7.0), (12.0, 13.0)]
+    assert lyrics[1]["words"][0]["startTime"] == 12.05
+    assert os.path.exists(tmp_path / "voiced_regions.json")
+    assert not os.path.exists(tmp_path / "vocals_voiced.wav")
+
+
+def test_live_score_over_websocket(tmp_path, mock_redis):
+    import wave
+    from datetime import datetime
+    from starlette.websockets import WebSocketDisconnect
+    import main
+    import pitch
+    from main import User
+    from test_scoring import melody, SAMPLE_RATE
+
+    users = {name: User(id=name, email=f"{name}@example.com", username=name, created_at=datetime.utcnow())
+             for name in ("u1", "u2")}
+    mock_redis.get.return_value = json.dumps({"jobId": "job-1", "userId": "u1"})
+    token = main.create_access_token({"sub": "u1"})
+
+    job_dir = tmp_path / "job-1"
+    job_dir.mkdir()
+    with wave.open(str(job_dir / "vocals.wav"), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes((melody(6) * 32767).astype('<i2').tobytes())
+    pitch.write_pitch_file(str(job_dir / "vocals.wav"), str(job_dir / pitch.PITCH_FILENAME))
+    pcm = (melody(6) * 32767).astype('<i2').tobytes()
+
+    with patch('main.OUTPUT_DIR', str(tmp_path)), patch('main.get_user', users.get):
+        # Only the owner, with a valid token, gets a session
+        for query in ("", f"&token={main.create_access_token({'sub': 'u2'})}", "&token=garbage"):
+            with pytest.raises(WebSocketDisconnect) as refused:
+                with client.websocket_connect(f"/api/score/job-1?sample_rate=44100{query}"):
+                    pass
+            assert refused.value.code == 1008
+
+        with client.websocket_connect(f"/api/score/job-1?sample_rate=44100&token={token}") as ws:
+            ready = ws.receive_json()
+            assert ready["type"] == "ready"
+            assert [phrase["index"] for phrase in ready["phrases"]] == [0, 1]
+
+            chunk = 2 * SAMPLE_RATE // 10
+            for position in range(0, len(pcm), chunk):
+                ws.send_bytes(pcm[position:position + chunk])
+            ws.send_text("end")
+            messages = []
+            while not messages or messages[-1]["type"] != "summary":
+                messages.append(ws.receive_json())
+
+        phrases = [m for m in messages if m["type"] == "phrase"]
+        assert [phrase["index"] for phrase in phrases] == [0, 1]
+        assert all(phrase["score"] > 95 for phrase in phrases)
+        summary = messages[-1]
+        assert summary["score"] > 95 and summary["phrasesScored"] == 2
+        assert summary["frames"] == sum(len(m["f0"]) for m in messages if m["type"] == "pitch")
+
+        # Oversized chunks close the session
+        with client.websocket_connect(f"/api/score/job-1?sample_rate=44100&token={token}") as ws:
+            ws.receive_json()
+            ws.send_bytes(bytes(2 * SAMPLE_RATE))
+            assert ws.receive_json()["type"] == "error"
+
+        with client.websocket_connect(f"/api/score/job-2?token={token}") as ws:
+            assert ws.receive_json() == {"type": "error", "detail": "Pitch contour not found"}
+
+    assert main.live_score_sessions == 0
+
+
+def test_batch_upload_queues_children_together_and_aggregates_progress(tmp_path, mock_redis):
+    import main
+    import tracing
+    from datetime import datetime
+    from main import ProcessingStatus, User
+
+    user = User(id="u1", email="u1@example.com", username="u1", created_at=datetime.utcnow())
+    other = User(id="u2", email="u2@example.com", username="u2", created_at=datetime.utcnow())
+    app.dependency_overrides[main.get_current_active_user] = lambda: user
+    saved = {}
+    mock_redis.set.side_effect = lambda key, value, ex=None: saved.__setitem__(key, value)
+    mock_redis.get.side_effect = lambda key: saved.get(key)
+    mock_redis.pipeline.return_value.set.side_effect = mock_redis.set.side_effect
+    submitted = []
+
+    def submit(job_id, user_id, priority, run):
+        submitted.append((job_id, priority, main.spleeter_affinity.get()))
+        run().close()
+
+    try:
+        with patch('main.UPLOAD_DIR', str(tmp_path)), patch('main.job_scheduler.submit', submit), \
+                patch('main.UPLOAD_COPY_CHUNK_SIZE', 4), patch('main.tracer', tracing.Tracer("api")):
+            rejected = client.post("/api/batches", files=[
+                ('files', ('01.mp3', b'one', 'audio/mpeg')), ('files', ('notes.txt', b'x', 'text/plain'))
+            ])
+            assert rejected.status_code == 400
+            assert os.listdir(tmp_path) == []
+
+            response = client.post("/api/batches", files=[
+                ('files', (f'{n:02}.mp3', f'track {n}'.encode(), 'audio/mpeg')) for n in range(1, 4)
+            ])
+            assert response.status_code == 200
+            batch_id, job_ids = response.json()["batchId"], response.json()["jobIds"]
+
+            # One Redis round trip for every record, children queued in upload order with one affinity
+            mock_redis.pipeline.return_value.execute.assert_called_once()
+            assert [job_id for job_id, _, _ in submitted] == job_ids
+            assert {(priority, affinity) for _, priority, affinity in submitted} == {("batch", f"batch:{batch_id}")}
+            assert json.loads(saved[f"project:{job_ids[0]}"])["batchId"] == batch_id
+            # Copied to disk in chunks
+            assert (tmp_path / f"{job_ids[2]}.mp3").read_bytes() == b'track 3'
+
+            main.set_job_status(job_ids[0], ProcessingStatus(state="completed", progress=1.0))
+            main.set_job_status(job_ids[1], ProcessingStatus(state="processing", progress=0.5))
+            status = client.get(f"/api/batches/{batch_id}").json()
+            assert status["state"] == "processing"
+            assert status["progress"] == 0.5
+            assert [job["state"] for job in status["jobs"]] == ["completed", "processing", "uploaded"]
+
+            # Only its owner sees a batch
+            app.dependency_overrides[main.get_current_active_user] = lambda: other
+            assert client.get(f"/api/batches/{batch_id}").status_code == 403
+            app.dependency_overrides[main.get_current_active_user] = lambda: user
+
+            main.set_job_status(job_ids[1], ProcessingStatus(state="completed", progress=1.0))
+            main.set_job_status(job_ids[2], ProcessingStatus(state="failed", error="boom"))
+            assert client.get(f"/api/batches/{batch_id}").json()["state"] == "partial"
+            assert not any(job_id in main.job_batches for job_id in job_ids)
+
+            assert client.get("/api/batches/missing").status_code == 404
+
+            # A batch whose key has expired is forgotten, and a late child doesn't bring the key back
+            response = client.post("/api/batches", files=[('files', ('04.mp3', b'four', 'audio/mpeg'))])
+            lost_id, (lost_job,) = response.json()["batchId"], response.json()["jobIds"]
+            main.job_batches[lost_job].expires_at = 0
+            del saved[f"batch:{lost_id}"]
+            main.set_job_status(lost_job, ProcessingStatus(state="processing", progress=0.5))
+            assert lost_job not in main.job_batches
+            assert f"batch:{lost_id}" not in saved
+    finally:
+        app.dependency_overrides.clear()
+        for job_id in main.job_flights.jobs.copy():
+            main.job_flights.detach(job_id)
+
+
+def test_separate_stage_is_retried_when_every_spleeter_backend_is_busy(tmp_path):
+    import asyncio
+    import main
+    import tracing
+    from main import ProcessingMode, ProcessingStatus
+    from spleeter_pool import BackendBusy, SpleeterPool
+
+    statuses = {}
+    attempts = []
+    job_dir = tmp_path / "job-1"
+    pool = SpleeterPool(["http://spleeter:8000"])
+
+    async def busy_then_free(backend_url):
+        attempts.append(backend_url)
+        if len(attempts) == 1:
+            raise BackendBusy(f"{backend_url} returned 503: busy")
+        stems = {}
+        for name in ("vocals", "accompaniment"):
+            stems[name] = str(job_dir / f"{name}.wav")
+            with open(stems[name], "wb") as f:
+                f.write(b"stem")
+        return {}, stems
+
+    async def request_separation(source_path, output_dir, params):
+        return await main.spleeter_pool.run(busy_then_free)
+
+    with patch('main.OUTPUT_DIR', str(tmp_path)), \
+            patch('main.STAGE_RETRY_BACKOFF_SECONDS', 0), \
+            patch('main.tracer', tracing.Tracer("api")), \
+            patch('main.spleeter_pool', pool), \
+            patch('main.get_job_status', lambda job_id: statuses.get(job_id)), \
+            patch('main.set_job_status', lambda job_id, status: statuses.__setitem__(job_id, status)), \
+            patch('main.ingest.decode_to_canonical',
+                  lambda input_path, output_dir: (job_dir / "source.wav").write_bytes(b"pcm") and
+                  {"decodeSeconds": 0.0, "duration": 1.0}), \
+            patch('main.request_separation', request_separation), \
+            patch('main.generate_waveform_peaks', AsyncMock()), \
+            patch('main.extract_pitch_contour', AsyncMock()):
+        statuses["job-1"] = ProcessingStatus(state="uploaded")
+        asyncio.run(main.process_audio("job-1", str(tmp_path / "job-1.mp3"), ProcessingMode.instrumental))
+
+    # The only backend refused the first attempt, which exhausted the pool; the stage retry succeeded
+    assert len(attempts) == 2
+    assert statuses["job-1"].state == "completed"
+    assert statuses["job-1"].stages["separate"]["state"] == "completed"
+    assert statuses["job-1"].stages["separate"]["retries"] == 1
+    # Busy is not broken: the backend was never taken out of rotation
+    assert pool.backends[0].healthy and pool.backends[0].failures == 0
+
+
+def test_signed_token_without_expiry_is_accepted(mock_redis):
+    import asyncio
+    import jwt
+    import main
+    from datetime import datetime
+    from main import User
+
+    user = User(id="u1", email="u1@example.com", username="u1", created_at=datetime.utcnow())
+    token = jwt.encode({"sub": "u1"}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+    with patch('main.get_user', {"u1": user}.get):
+        assert asyncio.run(main.get_current_user(token)) is user
+        # Served from the cache the second time
+        assert main.token_cache.get(token) == "u1"
+
+
+def test_cancel_tells_apart_jobs_queued_on_another_worker(mock_redis):
+    import main
+    from datetime import datetime
+    from main import ProcessingStatus, User
+
+    user = User(id="u1", email="u1@example.com", username="u1", created_at=datetime.utcnow())
+    app.dependency_overrides[main.get_current_active_user] = lambda: user
+    mock_redis.get.return_value = json.dumps({"jobId": "job-1", "userId": "u1"})
+    try:
+        # Running, but not in this worker's flight table
+        with patch('main.get_job_status', lambda job_id: ProcessingStatus(state="processing")):
+            response = client.delete("/api/jobs/job-1")
+        assert response.status_code == 409
+        assert "another worker" in response.json()["detail"]
+
+        with patch('main.get_job_status', lambda job_id: ProcessingStatus(state="completed")):
+            assert client.delete("/api/jobs/job-1").json()["detail"] == "Job is not queued or running"
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,92 @@
+import os
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pitch
+
+
+def write_wav(path, samples, sample_rate=44100):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+
+
+def cents(a, b):
+    return 1200 * np.log2(a / b)
+
+
+@pytest.mark.parametrize("frequency", [82.4, 220.0, 523.3])
+def test_tracks_a_steady_voice(frequency):
+    sample_rate = 11025
+    t = np.arange(2 * sample_rate) / sample_rate
+    signal = 0.4 * np.sin(2 * np.pi * frequency * t) + 0.2 * np.sin(2 * np.pi * 2 * frequency * t)
+    f0, confidence, frame_rate = pitch.pitch_contour(signal.astype(np.float32), sample_rate)
+
+    assert frame_rate == sample_rate / pitch.HOP_LENGTH
+    inner = slice(10, -10)
+    assert np.all(np.abs(cents(f0[inner], frequency)) < 10)
+    assert confidence[inner].min() > 0.9
+
+
+def test_silence_and_noise_are_unvoiced():
+    sample_rate = 11025
+    rng = np.random.default_rng(0)
+    silence = np.zeros(sample_rate, dtype=np.float32)
+    noise = (0.3 * rng.standard_normal(sample_rate)).astype(np.float32)
+    for signal in (silence, noise):
+        f0, confidence, _ = pitch.pitch_contour(signal, sample_rate)
+        assert np.count_nonzero(f0) == 0
+        assert confidence.max() == 0
+
+
+def test_pitch_file_serves_time_windows(tmp_path):
+    # One second of A3, one of silence, one of A4
+    sample_rate = 44100
+    t = np.arange(sample_rate) / sample_rate
+    mono = np.concatenate((np.sin(2 * np.pi * 220 * t), np.zeros(sample_rate), np.sin(2 * np.pi * 440 * t)))
+    path = tmp_path / "vocals.wav"
+    write_wav(path, np.column_stack((mono, mono)) * 12000)
+
+    pitch_path = tmp_path / pitch.PITCH_FILENAME
+    info = pitch.write_pitch_file(str(path), str(pitch_path))
+    assert info["frames"] == pytest.approx(3 * info["frameRate"], abs=2)
+
+    window = pitch.read_pitch(str(pitch_path), start=2.2, end=2.8)
+    assert window["start"] >= 2.2
+    assert len(window["f0"]) == pytest.approx(0.6 * window["frameRate"], abs=1)
+    assert abs(np.median(window["f0"]) - 440) < 3
+    assert min(window["confidence"]) > 0.9
+
+    gap = pitch.read_pitch(str(pitch_path), start=1.2, end=1.8)
+    assert set(gap["f0"]) == {0.0}
+
+    assert pitch.read_pitch(str(pitch_path), start=10.0)["f0"] == []
+
+
+def test_tracker_matches_offline_contour_in_any_chunking():
+    sample_rate = 44100
+    t = np.arange(3 * sample_rate) / sample_rate
+    signal = (0.4 * np.sin(2 * np.pi * 220 * 2 ** (t / 3) * t)).astype(np.float32)
+    offline, _, _ = pitch.pitch_contour(pitch._decimate(signal, 4), sample_rate / 4)
+
+    tracker = pitch.PitchTracker(sample_rate)
+    rng = np.random.default_rng(1)
+    streamed, position = [], 0
+    while position < signal.shape[0]:
+        size = int(rng.integers(1, 3000))
+        f0, _ = tracker.push(signal[position:position + size])
+        streamed.append(f0)
+        position += size
+    streamed = np.concatenate(streamed)
+
+    assert tracker.frame_rate == pytest.approx(offline.shape[0] / 3, rel=0.01)
+    # Only the last half frame, which needs the end padding, is missing
+    assert offline.shape[0] - streamed.shape[0] <= pitch.FRAME_LENGTH // pitch.HOP_LENGTH // 2
+    np.testing.assert_allclose(streamed, offline[:streamed.shape[0]], atol=0.01)
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add the parent directory to the Python path so we can import profiler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiler
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    thread.start()
+    yield
+    stop.set()
+    thread.join()
+
+
+def parse(collapsed):
+    counts = {}
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        counts[stack] = int(count)
+    return counts
+
+
+def test_profile_for_collects_collapsed_stacks(busy_thread):
+    result = profiler.SamplingProfiler(interval=0.005).profile_for(0.2)
+    stacks = parse(result["collapsed"])
+    assert result["samples"] > 0
+    assert any(stack.startswith("busy;") and "busy_loop (test_profiler.py" in stack for stack in stacks)
+    assert 0 <= result["overhead"] < 1
+
+
+def test_duration_is_capped():
+    result = profiler.SamplingProfiler(interval=0.005, max_seconds=0.05).profile_for(10)
+    assert result["seconds"] < 1
+
+
+def test_profile_jobs_samples_only_while_jobs_run(busy_thread):
+    sampler = profiler.SamplingProfiler(interval=0.005, max_seconds=5)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(sampler.profile_jobs(1)))
+    thread.start()
+    while not sampler.running:
+        time.sleep(0.001)
+
+    time.sleep(0.05)
+    token = sampler.job_started()
+    assert sampler.job_started() is None  # only one job was asked for
+    time.sleep(0.05)
+    sampler.job_finished(token)
+    thread.join()
+
+    assert results[0]["jobs"] == 1
+    assert 0 < results[0]["samples"] <= 20
+
+
+def test_only_one_profile_at_a_time():
+    sampler = profiler.SamplingProfiler(interval=0.005)
+    thread = threading.Thread(target=sampler.profile_for, args=(0.2,))
+    thread.start()
+    while not sampler.running:
+        time.sleep(0.001)
+    with pytest.raises(profiler.ProfilerBusy):
+        sampler.profile_for(0.1)
+    thread.join()
+
+
+def test_spleeter_copy_is_identical():
+    spleeter_copy = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                 "spleeter", "app", "profiler.py")
+    if not os.path.exists(spleeter_copy):
+        pytest.skip("The Spleeter service is not checked out next to the API")
+    with open(profiler.__file__, "rb") as ours, open(spleeter_copy, "rb") as theirs:
+        assert ours.read() == theirs.read(), "server/profiler.py and spleeter/app/profiler.py have drifted"
@@ -0,0 +1,33 @@
+import os
+import sys
+
+# Add the parent directory to the Python path so we can import resumable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resumable
+
+
+def test_chunk_layout():
+    assert resumable.total_chunks(10, 4) == 3
+    assert resumable.total_chunks(8, 4) == 2
+    assert [resumable.chunk_length(10, 4, i) for i in range(3)] == [4, 4, 2]
+
+
+def test_progress_with_out_of_order_chunks():
+    received = {0, 1, 3}
+    assert resumable.missing_chunks(received, 5) == [2, 4]
+    assert resumable.contiguous_offset(received, 18, 4) == 8
+    assert resumable.contiguous_offset({0, 1, 2, 3, 4}, 18, 4) == 18
+    assert resumable.contiguous_offset(set(), 18, 4) == 0
+
+
+def test_chunks_assemble_in_place(tmp_path):
+    path = resumable.partial_path(str(tmp_path), "abc")
+    data = bytes(range(10))
+    resumable.preallocate(path, len(data))
+    for index in (2, 0, 1):
+        with open(path, "r+b") as f:
+            f.seek(index * 4)
+            f.write(data[index * 4:index * 4 + resumable.chunk_length(len(data), 4, index)])
+    with open(path, "rb") as f:
+        assert f.read() == data
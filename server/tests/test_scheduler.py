@@ -0,0 +1,183 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import JobScheduler
+
+
+def make_scheduler(max_concurrent=1, max_per_user=1, interactive=4, batch=1):
+    return JobScheduler(max_concurrent, max_per_user, {"interactive": interactive, "batch": batch})
+
+
+def test_users_get_equal_shares():
+    async def scenario():
+        scheduler = make_scheduler()
+        started = []
+        gate = asyncio.Event()
+
+        def job(name):
+            async def run():
+                started.append(name)
+                await gate.wait()
+            return run
+
+        # The first job holds the only slot while the rest queue up
+        scheduler.submit("hold", "x", "interactive", job("hold"))
+        for i in range(4):
+            scheduler.submit(f"a{i}", "alice", "interactive", job(f"a{i}"))
+        scheduler.submit("b0", "bob", "interactive", job("b0"))
+        scheduler.submit("b1", "bob", "interactive", job("b1"))
+        gate.set()
+        while scheduler.running or any(scheduler.queued(c) for c in scheduler.class_weights):
+            await asyncio.sleep(0)
+        return started
+
+    started = asyncio.run(scenario())
+    assert started[0] == "hold"
+    # Bob's jobs are interleaved with Alice's instead of waiting behind all four
+    assert started[1:5] == ["a0", "b0", "a1", "b1"]
+    assert started[5:] == ["a2", "a3"]
+
+
+def test_class_weights_split_slots():
+    async def noop():
+        pass
+
+    # No slots, so nothing starts and the picker can be driven directly
+    scheduler = make_scheduler(max_concurrent=0, interactive=3, batch=1)
+    picked = []
+    for i in range(8):
+        scheduler.submit(f"i{i}", "alice", "interactive", noop)
+        scheduler.submit(f"b{i}", "bob", "batch", noop)
+    for _ in range(8):
+        job = scheduler._pick()
+        scheduler._pop(job)
+        picked.append(job.priority)
+    assert picked.count("interactive") == 6
+    assert picked.count("batch") == 2
+
+
+def test_per_user_limit():
+    async def scenario():
+        scheduler = make_scheduler(max_concurrent=3, max_per_user=1)
+        gate = asyncio.Event()
+
+        async def run():
+            await gate.wait()
+
+        scheduler.submit("a0", "alice", "interactive", run)
+        scheduler.submit("a1", "alice", "interactive", run)
+        scheduler.submit("b0", "bob", "batch", run)
+        running = sorted(scheduler.running)
+        snapshot = scheduler.snapshot()
+        gate.set()
+        while scheduler.running:
+            await asyncio.sleep(0)
+        return running, snapshot, scheduler.snapshot()
+
+    running, during, after = asyncio.run(scenario())
+    # Alice's second job waits although a slot is free
+    assert running == ["a0", "b0"]
+    assert during["classes"]["interactive"]["queued"] == 1
+    assert after["classes"]["interactive"]["completed"] == 2
+    assert after["classes"]["batch"]["completed"] == 1
+    assert after["classes"]["interactive"]["waitMaxSeconds"] is not None
+
+
+def test_position_and_cancel():
+    async def noop():
+        pass
+
+    scheduler = make_scheduler(max_concurrent=0)
+    scheduler.submit("a0", "alice", "interactive", noop)
+    scheduler.submit("a1", "alice", "interactive", noop)
+    scheduler.submit("b0", "bob", "interactive", noop)
+    assert scheduler.position("a0") == 0
+    assert scheduler.position("b0") == 1
+    assert scheduler.position("a1") == 2
+    assert scheduler.position("unknown") is None
+    # Replaying the policy leaves the real queues untouched
+    assert scheduler.queued("interactive") == 3
+
+    assert scheduler.cancel("b0") is True
+    assert scheduler.position("a1") == 1
+    assert scheduler.queued("interactive") == 2
+    assert scheduler.cancel("b0") is False
+    assert scheduler.snapshot()["classes"]["interactive"]["cancelled"] == 1
+
+
+def test_cancel_running_job():
+    async def scenario():
+        scheduler = make_scheduler()
+
+        async def run():
+            await asyncio.sleep(60)
+
+        scheduler.submit("a0", "alice", "interactive", run)
+        await asyncio.sleep(0)
+        assert scheduler.cancel("a0") is True
+        while scheduler.running:
+            await asyncio.sleep(0)
+        return scheduler.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["running"] == 0
+    assert snapshot["classes"]["interactive"]["cancelled"] == 1
+
+
+def test_cancel_before_first_step_frees_slot():
+    async def scenario():
+        scheduler = make_scheduler()
+        started = []
+
+        async def run():
+            started.append(True)
+
+        scheduler.submit("a0", "alice", "interactive", run)
+        scheduler.submit("a1", "alice", "interactive", run)
+        # a0 has a task, but it has not run yet
+        assert scheduler.cancel("a0") is True
+        while scheduler.running or scheduler.queued("interactive"):
+            await asyncio.sleep(0)
+        return started, scheduler.snapshot()
+
+    started, snapshot = asyncio.run(scenario())
+    assert started == [True]
+    assert snapshot["classes"]["interactive"]["cancelled"] == 1
+    assert snapshot["classes"]["interactive"]["completed"] == 1
+
+
+def test_schedule_resolves_with_the_outcome_of_the_job():
+    async def scenario():
+        scheduler = make_scheduler()
+
+        async def answer():
+            return 42
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def hang():
+            await asyncio.sleep(60)
+
+        results = [await scheduler.schedule("a0", "alice", "interactive", answer)]
+        try:
+            await scheduler.schedule("a1", "alice", "interactive", fail)
+        except RuntimeError as e:
+            results.append(str(e))
+        # Cancelled before its first step, and while still queued
+        running = scheduler.schedule("a2", "alice", "interactive", hang)
+        queued = [scheduler.schedule(f"a{i}", "alice", "interactive", hang) for i in range(3, 6)]
+        assert scheduler.cancel("a2") and scheduler.cancel("a5")
+        for future in (running, queued[-1]):
+            try:
+                await future
+            except asyncio.CancelledError:
+                results.append("cancelled")
+        scheduler.cancel("a3")
+        scheduler.cancel("a4")
+        return results
+
+    assert asyncio.run(scenario()) == [42, "boom", "cancelled", "cancelled"]
@@ -0,0 +1,91 @@
+import os
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pitch
+import scoring
+
+SAMPLE_RATE = 44100
+
+
+def melody(seconds, transpose=1.0, sample_rate=SAMPLE_RATE):
+    """Two-second notes of A3 and C4, each followed by a one-second rest."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    frequency = np.where(t % 6 < 3, 220.0, 261.6) * transpose
+    phase = 2 * np.pi * np.cumsum(frequency) / sample_rate
+    voice = 0.4 * np.sin(phase) + 0.1 * np.sin(2 * phase)
+    return (voice * (t % 3 < 2)).astype(np.float32)
+
+
+@pytest.fixture
+def reference(tmp_path):
+    wav_path = tmp_path / "vocals.wav"
+    with wave.open(str(wav_path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes((melody(12) * 32767).astype('<i2').tobytes())
+    pitch_path = tmp_path / pitch.PITCH_FILENAME
+    pitch.write_pitch_file(str(wav_path), str(pitch_path))
+    return scoring.ReferenceMelody.load(str(pitch_path))
+
+
+def sing(reference, signal, sample_rate=SAMPLE_RATE, start=0.0, chunk_seconds=0.02):
+    session = scoring.LiveScore(reference, sample_rate, start)
+    chunk = int(chunk_seconds * sample_rate)
+    phrases = []
+    for position in range(0, signal.shape[0], chunk):
+        phrases += session.push(signal[position:position + chunk])["phrases"]
+    remaining, total = session.finish()
+    return phrases + remaining, total
+
+
+def test_phrases_follow_the_rests(reference):
+    assert reference.phrases.shape == (4, 2)
+    starts = reference.phrases[:, 0] / reference.frame_rate
+    np.testing.assert_allclose(starts, [0, 3, 6, 9], atol=0.05)
+
+
+def test_singing_the_melody_scores_every_phrase(reference):
+    phrases, total = sing(reference, melody(12))
+    assert [phrase["index"] for phrase in phrases] == [0, 1, 2, 3]
+    assert all(phrase["score"] > 95 for phrase in phrases)
+    assert total > 95
+    assert phrases[0]["meanCentsError"] < 10
+
+
+def test_octave_is_forgiven_and_wrong_notes_are_not(reference):
+    _, octave_up = sing(reference, melody(12, transpose=2.0))
+    _, a_fifth_off = sing(reference, melody(12, transpose=1.5))
+    _, silent = sing(reference, np.zeros(12 * SAMPLE_RATE, dtype=np.float32))
+    assert octave_up > 95
+    assert a_fifth_off < 5
+    assert silent == 0
+
+
+def test_other_sample_rates_and_a_late_start(reference):
+    sample_rate = 48000
+    # Joining in the third phrase
+    phrases, total = sing(reference, melody(12, sample_rate=sample_rate)[6 * sample_rate:], sample_rate, start=6.0)
+    assert [phrase["index"] for phrase in phrases] == [2, 3]
+    assert total > 95
+
+
+def test_phrases_are_reported_once_passed(reference):
+    session = scoring.LiveScore(reference, SAMPLE_RATE)
+    signal = melody(12)
+    first = session.push(signal[:int(2.1 * SAMPLE_RATE)])
+    assert first["phrases"] == []
+    second = session.push(signal[int(2.1 * SAMPLE_RATE):int(2.5 * SAMPLE_RATE)])
+    assert [phrase["index"] for phrase in second["phrases"]] == [0]
+
+    message = scoring.pitch_message(second)
+    assert message["type"] == "pitch"
+    assert len(message["f0"]) == len(message["cents"])
+    # Sung rest against a sung reference phrase end: nothing to match
+    assert None in message["cents"]
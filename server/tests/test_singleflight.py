@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight, content_key, share_outputs
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_content_key_covers_audio_and_options(tmp_path):
+    a, b, c = tmp_path / "a.mp3", tmp_path / "b.mp3", tmp_path / "c.mp3"
+    write(a, b"same audio")
+    write(b, b"same audio")
+    write(c, b"other audio")
+    assert content_key(str(a), "full", "fast") == content_key(str(b), "full", "fast")
+    assert content_key(str(a), "full", "fast") != content_key(str(a), "full", "quality")
+    assert content_key(str(a), "full", "fast") != content_key(str(c), "full", "fast")
+
+
+def test_jobs_with_the_same_key_share_a_flight():
+    flights = SingleFlight()
+    first, started = flights.join("key", "job-1")
+    assert started
+    second, started = flights.join("key", "job-2")
+    assert not started
+    assert second is first
+    assert first.subscribers == ["job-1", "job-2"]
+    assert flights.join("other", "job-3")[1]
+    assert flights.snapshot()["coalesced"] == 1
+
+    # Once the pipeline finishes, the same key starts a new one
+    assert flights.finish("job-1") is first
+    assert first.closed
+    assert flights.join("key", "job-4")[1]
+
+
+def test_pipeline_is_cancelled_only_when_the_last_job_detaches():
+    flights = SingleFlight()
+    flight, _ = flights.join("key", "job-1")
+    flights.join("key", "job-2")
+
+    # The leader leaves, but its pipeline still serves job-2
+    assert flights.detach("job-1") is flight
+    assert flight.subscribers == ["job-2"]
+    assert not flight.closed
+    assert flights.led_by("job-1") is flight
+
+    assert flights.detach("job-2") is flight
+    assert flight.closed
+    assert flights.detach("job-2") is None
+    assert flights.led_by("job-1") is None
+    assert flights.snapshot()["cancelled"] == 1
+
+
+def test_share_outputs_links_every_file(tmp_path):
+    source = tmp_path / "job-1"
+    source.mkdir()
+    write(source / "vocals.wav", b"vocals")
+    write(source / "lyrics.json", b"[]")
+    target = tmp_path / "job-2"
+
+    share_outputs(str(source), [str(target)])
+
+    assert sorted(os.listdir(target)) == ["lyrics.json", "vocals.wav"]
+    assert os.path.samefile(source / "vocals.wav", target / "vocals.wav")
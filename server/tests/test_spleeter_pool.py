@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the Python path so we can import spleeter_pool
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spleeter_pool import BackendBusy, BackendUnavailable, SpleeterPool
+
+
+def test_choose_prefers_least_loaded_healthy_backend():
+    pool = SpleeterPool(["http://a:8000", "http://b:8000/", "http://c:8000"])
+    a, b, c = pool.backends
+    a.outstanding = 2
+    b.reported_active = 1
+    c.healthy = False
+
+    assert pool.choose() is b
+    assert pool.choose(exclude=[b]) is a
+    # With every healthy backend excluded, unhealthy ones are still tried
+    assert pool.choose(exclude=[a, b]) is c
+    assert pool.choose(exclude=[a, b, c]) is None
+
+
+def test_run_fails_over_to_another_backend():
+    pool = SpleeterPool(["http://a:8000", "http://b:8000"])
+    calls = []
+
+    async def request(url):
+        calls.append(url)
+        if len(calls) == 1:
+            raise BackendUnavailable("busy")
+        return url
+
+    result = asyncio.run(pool.run(request))
+
+    assert result == calls[1] and calls[0] != calls[1]
+    failed = next(b for b in pool.backends if b.url == calls[0])
+    assert not failed.healthy and failed.failures == 1
+    assert all(b.outstanding == 0 for b in pool.backends)
+
+
+def test_busy_backend_is_passed_over_but_stays_in_rotation():
+    pool = SpleeterPool(["http://a:8000", "http://b:8000"])
+    calls = []
+
+    async def request(url):
+        calls.append(url)
+        if len(calls) == 1:
+            raise BackendBusy(f"{url} returned 503: busy")
+        return url
+
+    assert asyncio.run(pool.run(request)) == calls[1] != calls[0]
+    busy = next(b for b in pool.backends if b.url == calls[0])
+    assert busy.healthy and busy.failures == 0 and busy.busy_rejections == 1
+    assert all(b.outstanding == 0 for b in pool.backends)
+
+
+def test_run_does_not_retry_job_errors():
+    pool = SpleeterPool(["http://a:8000", "http://b:8000"])
+    calls = []
+
+    async def request(url):
+        calls.append(url)
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run(request))
+    assert len(calls) == 1
+    assert all(b.healthy for b in pool.backends)
+
+
+def test_run_gives_up_after_all_backends_fail():
+    pool = SpleeterPool(["http://a:8000", "http://b:8000"], max_attempts=5)
+
+    async def request(url):
+        raise BackendUnavailable(url)
+
+    with pytest.raises(BackendUnavailable, match="All Spleeter backends failed") as error:
+        asyncio.run(pool.run(request))
+    assert isinstance(error.value.__cause__, BackendUnavailable)
+
+
+def test_affinity_keeps_related_jobs_on_one_backend_while_it_is_not_busier():
+    pool = SpleeterPool(["http://a:8000", "http://b:8000", "http://c:8000"])
+    a, b, c = pool.backends
+    chosen = []
+
+    async def request(url):
+        chosen.append(url)
+        return url
+
+    asyncio.run(pool.run(request, affinity="batch:1"))
+    first = next(backend for backend in pool.backends if backend.url == chosen[0])
+    # Without affinity, equally idle backends rotate
+    assert len({pool.choose().url for _ in range(3)}) == 3
+
+    for _ in range(3):
+        asyncio.run(pool.run(request, affinity="batch:1"))
+    assert set(chosen) == {first.url}
+
+    # Two more in flight than the idlest backend is too many
+    first.outstanding = 2
+    assert pool.choose(affinity="batch:1") is not first
+    first.outstanding = 1
+    assert pool.choose(affinity="batch:1") is first
+    first.healthy = False
+    assert pool.choose(affinity="batch:1") is not first
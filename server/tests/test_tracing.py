@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import sys
+from unittest.mock import MagicMock
+
+# Add the parent directory to the Python path so we can import tracing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracing
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+def test_spans_nest_and_inherit_job():
+    exporter = ListExporter()
+    tracer = tracing.Tracer("api", [exporter])
+    with tracer.span("process_audio", job_id="job-1") as root:
+        with tracer.span("separate") as child:
+            headers = tracer.inject()
+    assert [s["name"] for s in exporter.spans] == ["separate", "process_audio"]
+    assert exporter.spans[0]["parentSpanId"] == root.span_id
+    assert exporter.spans[0]["traceId"] == root.trace_id
+    assert exporter.spans[0]["jobId"] == "job-1"
+    assert tracing.parse_traceparent(headers["traceparent"]) == (root.trace_id, child.span_id)
+
+
+def test_context_follows_background_tasks():
+    exporter = ListExporter()
+    tracer = tracing.Tracer("api", [exporter])
+
+    async def job():
+        with tracer.span("process_audio"):
+            await asyncio.sleep(0)
+
+    async def upload():
+        with tracer.span("upload", job_id="job-2"):
+            task = asyncio.create_task(job())
+        await task
+
+    asyncio.run(upload())
+    upload_span = next(s for s in exporter.spans if s["name"] == "upload")
+    job_span = next(s for s in exporter.spans if s["name"] == "process_audio")
+    assert job_span["parentSpanId"] == upload_span["spanId"]
+    assert job_span["jobId"] == "job-2"
+
+
+def test_failed_span_records_error():
+    exporter = ListExporter()
+    tracer = tracing.Tracer("api", [exporter])
+    try:
+        with tracer.span("whisper"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert exporter.spans[0]["error"] == "ValueError: boom"
+
+
+def test_timeline_offsets_depth_and_self_time():
+    spans = [
+        {"spanId": "b", "parentSpanId": "a", "name": "separate", "service": "api",
+         "startTime": 101.0, "durationSeconds": 6.0},
+        {"spanId": "a", "parentSpanId": None, "name": "process_audio", "service": "api",
+         "startTime": 100.0, "durationSeconds": 10.0},
+        {"spanId": "c", "parentSpanId": "b", "name": "separation", "service": "spleeter",
+         "startTime": 102.0, "durationSeconds": 4.0},
+    ]
+    result = tracing.timeline(spans)
+    assert result["totalSeconds"] == 10.0
+    assert [(s["name"], s["depth"], s["offsetSeconds"], s["selfSeconds"]) for s in result["spans"]] == [
+        ("process_audio", 0, 0.0, 4.0),
+        ("separate", 1, 1.0, 2.0),
+        ("separation", 2, 2.0, 4.0),
+    ]
+
+
+def test_redis_exporter_groups_by_job():
+    redis_mock = MagicMock()
+    pipe = redis_mock.pipeline.return_value
+    tracing.RedisTimelineExporter(redis_mock, ttl=60).export([
+        {"jobId": "job-1", "name": "a"}, {"jobId": None, "name": "b"}, {"jobId": "job-1", "name": "c"},
+    ])
+    key, *values = pipe.rpush.call_args.args
+    assert key == "trace:job-1"
+    assert [json.loads(v)["name"] for v in values] == ["a", "c"]
+    pipe.expire.assert_called_once_with("trace:job-1", 60)
+
+
+def test_buffered_exporter_writes_in_batches_off_the_caller():
+    exporter = ListExporter()
+    buffered = tracing.BufferedExporter([exporter], flush_interval=60, batch_size=3, max_buffered=5)
+    tracer = tracing.Tracer("api", [buffered])
+    with tracer.span("upload", job_id="job-1"):
+        pass
+    # Waiting for the interval or a full batch
+    assert exporter.spans == []
+
+    buffered.flush()
+    assert [s["name"] for s in exporter.spans] == ["upload"]
+
+    buffered.export([{"name": str(n)} for n in range(7)])
+    buffered.close()
+    # The two oldest didn't fit in the buffer
+    assert buffered.dropped == 2
+    assert [s["name"] for s in exporter.spans[1:]] == ["2", "3", "4", "5", "6"]
+
+
+def test_buffered_exporter_flushes_from_its_thread():
+    import time
+
+    exporter = ListExporter()
+    buffered = tracing.BufferedExporter([exporter], flush_interval=0.01)
+    buffered.export([{"name": "a"}])
+    deadline = time.monotonic() + 2
+    while not exporter.spans and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert exporter.spans == [{"name": "a"}]
+    buffered.close()
@@ -0,0 +1,65 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+# Add the parent directory to the Python path so we can import users
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import users
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_redis():
+    data = {}
+    mock = MagicMock()
+    mock.get.side_effect = lambda key: data.get(key)
+
+    def set_(key, value, nx=False):
+        if nx and key in data:
+            return None
+        data[key] = value
+        return True
+
+    mock.set.side_effect = set_
+    return mock, data
+
+
+def test_cache_expires_and_evicts_least_recent():
+    clock = FakeClock()
+    cache = users.LocalCache(max_size=2, ttl=10, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2, expires_at=5)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None  # evicted, "a" was used more recently
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_store_shares_users_and_rejects_duplicates():
+    redis_mock, data = make_redis()
+    worker_a = users.UserStore(redis_mock)
+    worker_b = users.UserStore(redis_mock)
+
+    assert worker_b.get("alice") is None
+    assert worker_a.create("alice", '{"username": "alice"}')
+    assert worker_b.get("alice") == '{"username": "alice"}'
+    assert not worker_b.create("alice", '{"username": "other"}')
+    assert data["user:alice"] == '{"username": "alice"}'
+
+
+def test_store_reads_through_cache():
+    redis_mock, data = make_redis()
+    data["user:bob"] = b'{"username": "bob"}'
+    store = users.UserStore(redis_mock)
+    assert store.get("bob") == '{"username": "bob"}'
+    assert store.get("bob") == '{"username": "bob"}'
+    assert redis_mock.get.call_count == 1
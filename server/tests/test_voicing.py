@@ -0,0 +1,82 @@
+import os
+import sys
+import wave
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import voicing
+
+SAMPLE_RATE = 16000
+
+
+def write_wav(path, samples):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+
+
+def vocals_with_gaps(tmp_path):
+    """20 s of near silence with singing at 5-7 s and 12-13 s."""
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-3, 3, size=(20 * SAMPLE_RATE, 2)).astype(np.int16)
+    t = np.arange(SAMPLE_RATE * 2) / SAMPLE_RATE
+    tone = (8000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+    samples[5 * SAMPLE_RATE:7 * SAMPLE_RATE] = tone[:, None]
+    samples[12 * SAMPLE_RATE:13 * SAMPLE_RATE] = tone[:SAMPLE_RATE, None]
+    path = tmp_path / "vocals.wav"
+    write_wav(path, samples)
+    return path
+
+
+def test_detects_voiced_regions_with_padding(tmp_path):
+    levels = voicing.frame_levels(str(vocals_with_gaps(tmp_path)))
+    assert levels.shape == (1000,)
+    regions = voicing.detect_voiced_regions(levels)
+    np.testing.assert_allclose(regions, [[4.75, 7.25], [11.75, 13.25]], atol=0.03)
+
+
+def test_short_pauses_are_bridged():
+    levels = np.full(500, -90.0)
+    levels[100:150] = -10.0
+    levels[170:200] = -10.0   # 0.4 s after the first phrase
+    levels[400:410] = -10.0
+    regions = voicing.detect_voiced_regions(levels, padding=0.0)
+    np.testing.assert_allclose(regions, [[2.0, 4.0], [8.0, 8.2]])
+
+
+def test_offset_map_translates_back_to_song_time():
+    offset_map = voicing.OffsetMap.from_regions(np.array([[4.0, 7.0], [12.0, 13.0]]), join_silence=0.5)
+    assert offset_map.compact_duration == 4.5
+    np.testing.assert_allclose(offset_map.to_song_time([0.0, 2.0, 3.2, 3.5, 4.0]), [4.0, 6.0, 7.0, 12.0, 12.5])
+
+    segments = [{"start": 1.0, "end": 4.2, "text": "across the cut"}]
+    offset_map.remap(segments)
+    assert segments == [{"start": 5.0, "end": 12.7, "text": "across the cut"}]
+
+
+def test_compact_voiced_writes_only_voiced_audio(tmp_path):
+    path = vocals_with_gaps(tmp_path)
+    output = tmp_path / "vocals_voiced.wav"
+    offset_map = voicing.compact_voiced(str(path), str(output))
+
+    with wave.open(str(output)) as wav_file:
+        seconds = wav_file.getnframes() / wav_file.getframerate()
+    assert abs(seconds - offset_map.compact_duration) < 0.01
+    assert seconds < 5
+
+    offset_map.save(str(tmp_path / voicing.OFFSET_MAP_FILENAME))
+    loaded = voicing.OffsetMap.load(str(tmp_path / voicing.OFFSET_MAP_FILENAME))
+    np.testing.assert_allclose(loaded.to_song_time([1.0]), offset_map.to_song_time([1.0]))
+
+
+def test_nothing_to_cut_leaves_audio_alone(tmp_path):
+    t = np.arange(SAMPLE_RATE * 3) / SAMPLE_RATE
+    path = tmp_path / "vocals.wav"
+    write_wav(path, (8000 * np.sin(2 * np.pi * 220 * t))[:, None].astype(np.int16))
+    output = tmp_path / "vocals_voiced.wav"
+    assert voicing.compact_voiced(str(path), str(output)) is None
+    assert not output.exists()
@@ -0,0 +1,81 @@
+import os
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+# Add the parent directory to the Python path so we can import waveform
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import waveform
+
+
+def write_wav(path, samples, sample_rate=44100):
+    """Write an int16 array of shape (frames, channels) as a PCM WAV file."""
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+
+
+@pytest.fixture
+def stereo_wav(tmp_path):
+    """Three seconds of stereo noise with a known spike in the second second."""
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-1000, 1000, size=(44100 * 3 + 123, 2)).astype(np.int16)
+    samples[44100 + 500, 1] = 30000
+    samples[44100 + 700, 0] = -30000
+    path = tmp_path / "vocals.wav"
+    write_wav(path, samples)
+    return path, samples
+
+
+def test_read_pcm_layout(stereo_wav):
+    path, samples = stereo_wav
+    layout = waveform.read_pcm_layout(str(path))
+    assert layout.dtype == "<i2"
+    assert layout.channels == 2
+    assert layout.sample_rate == 44100
+    assert layout.frames == samples.shape[0]
+
+
+def test_peak_pyramid_matches_naive_reduction(stereo_wav):
+    path, samples = stereo_wav
+    pyramid = waveform.compute_peak_pyramid(str(path))
+
+    assert sorted(pyramid) == list(waveform.PEAK_LEVELS)
+    for level, peaks in pyramid.items():
+        expected_count = -(-samples.shape[0] // level)
+        assert peaks.shape == (expected_count, 2)
+        for i in (0, expected_count // 2, expected_count - 1):
+            block = samples[i * level:(i + 1) * level]
+            assert peaks[i, 0] == block.min()
+            assert peaks[i, 1] == block.max()
+
+
+def test_read_peaks_window(stereo_wav, tmp_path):
+    path, _ = stereo_wav
+    peaks_path = waveform.write_peaks_file(str(path), str(tmp_path / "vocals.peaks"))
+
+    result = waveform.read_peaks(peaks_path, start=1.0, end=2.0, resolution=1000)
+    assert result["samplesPerPeak"] == 256
+    assert result["sampleRate"] == 44100
+    assert result["start"] <= 1.0 and result["end"] >= 2.0
+    assert len(result["min"]) == len(result["max"])
+    assert max(result["max"]) == 30000
+    assert min(result["min"]) == -30000
+
+    # Coarser requests pick coarser levels and return fewer points
+    coarse = waveform.read_peaks(peaks_path, start=1.0, end=2.0, resolution=5000)
+    assert coarse["samplesPerPeak"] == 4096
+    assert len(coarse["max"]) < len(result["max"])
+    assert max(coarse["max"]) == 30000
+
+
+def test_rejects_non_wav(tmp_path):
+    path = tmp_path / "not.wav"
+    path.write_bytes(b"ID3 not a wave file")
+    with pytest.raises(ValueError):
+        waveform.read_pcm_layout(str(path))
@@ -0,0 +1,284 @@
+"""
+Lightweight per-job tracing shared by the API and the Spleeter service.
+
+Spans are timed sections of work, nested through a context variable, so
+spans opened inside tasks spawned from a request become its children. Trace
+context crosses service boundaries in a W3C ``traceparent`` header. Spleeter
+returns its own spans with the separation metadata, so a job's whole trace
+ends up here in one place.
+
+Finished spans go to every configured exporter: a JSON-lines file (one span
+per line, OTLP-style field names, to be shipped to a collector) and a Redis
+list per job that backs the timeline endpoint. Wrapped in a
+BufferedExporter, both are written from a background thread in batches, so
+finishing a span never blocks the event loop on disk or Redis.
+"""
+
+import collections
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+TRACEPARENT_HEADER = "traceparent"
+TIMELINE_KEY = "trace:{job_id}"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, service: str, trace_id: str, parent_id: Optional[str] = None,
+                 job_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.service = service
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.job_id = job_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "jobId": self.job_id,
+            "startTime": self.start,
+            "durationSeconds": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id) from a ``traceparent`` header, or None if it is malformed."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class FileExporter:
+    """Append finished spans to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, spans: List[dict]):
+        lines = "".join(json.dumps(span) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class RedisTimelineExporter:
+    """Keep each job's spans in a Redis list for the timeline endpoint."""
+
+    def __init__(self, redis_client, ttl: Optional[int] = None):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    def export(self, spans: List[dict]):
+        by_job: Dict[str, List[str]] = {}
+        for span in spans:
+            if span.get("jobId"):
+                by_job.setdefault(span["jobId"], []).append(json.dumps(span))
+        for job_id, encoded in by_job.items():
+            key = TIMELINE_KEY.format(job_id=job_id)
+            pipe = self.redis.pipeline()
+            pipe.rpush(key, *encoded)
+            if self.ttl:
+                pipe.expire(key, self.ttl)
+            pipe.execute()
+
+
+class BufferedExporter:
+    """
+    Queue spans and hand them to ``exporters`` in batches from a background
+    thread, every ``flush_interval`` seconds or as soon as ``batch_size`` are
+    waiting. When more than ``max_buffered`` spans are waiting, the oldest
+    are dropped and counted.
+    """
+
+    def __init__(self, exporters, flush_interval: float = 1.0, batch_size: int = 512, max_buffered: int = 10000):
+        self.exporters = list(exporters)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._buffer = collections.deque(maxlen=max_buffered)
+        self._condition = threading.Condition()
+        # Serializes writes, so a flush() and the thread can't interleave batches
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def export(self, spans: List[dict]):
+        with self._condition:
+            overflow = len(self._buffer) + len(spans) - self._buffer.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self._buffer.extend(spans)
+            if self._thread is None and not self._closed:
+                # Started lazily, so importing the module doesn't start threads
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+
+    def _take(self) -> List[dict]:
+        spans = list(self._buffer)
+        self._buffer.clear()
+        return spans
+
+    def _write(self, spans: List[dict]):
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                print(f"[WARNING] Failed to export spans with {type(exporter).__name__}: {str(e)}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """Write every waiting span now. Blocking; off the event loop, run it in an executor."""
+        with self._write_lock:
+            with self._condition:
+                spans = self._take()
+            if spans:
+                self._write(spans)
+
+    def close(self):
+        """Stop the thread after a last flush."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+        self.flush()
+
+
+class Tracer:
+    def __init__(self, service: str, exporters=()):
+        self.service = service
+        self.exporters = list(exporters)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, job_id: Optional[str] = None, traceparent: Optional[str] = None, **attributes):
+        """
+        Time a block as a span. It is a child of the current span, or of the
+        remote parent in ``traceparent``; otherwise it starts a new trace.
+        """
+        parent = _current_span.get()
+        remote = parse_traceparent(traceparent)
+        if remote:
+            trace_id, parent_id = remote
+        elif parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+        if job_id is None and parent is not None:
+            job_id = parent.job_id
+
+        span = Span(name, self.service, trace_id, parent_id, job_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self.export([span.to_dict()])
+
+    def inject(self) -> dict:
+        """Headers that carry the current span to another service."""
+        span = _current_span.get()
+        return {TRACEPARENT_HEADER: span.traceparent} if span is not None else {}
+
+    def export(self, spans: List[dict]):
+        """Hand finished spans, local or received from another service, to every exporter."""
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                # Tracing must never break the traced work
+                print(f"[WARNING] Failed to export spans with {type(exporter).__name__}: {str(e)}")
+
+
+def timeline(spans: List[dict]) -> dict:
+    """
+    Order a job's spans by start time with offsets from the first span, the
+    nesting depth, and self time (duration not covered by child spans).
+    """
+    spans = sorted(spans, key=lambda s: s["startTime"])
+    if not spans:
+        return {"totalSeconds": 0.0, "spans": []}
+    by_id = {s["spanId"]: s for s in spans}
+    child_seconds: Dict[str, float] = {}
+    for s in spans:
+        if s.get("parentSpanId") in by_id:
+            child_seconds[s["parentSpanId"]] = child_seconds.get(s["parentSpanId"], 0.0) + (s["durationSeconds"] or 0.0)
+
+    def depth(s):
+        level = 0
+        while s.get("parentSpanId") in by_id and level < len(spans):
+            s = by_id[s["parentSpanId"]]
+            level += 1
+        return level
+
+    origin = spans[0]["startTime"]
+    end = max(s["startTime"] + (s["durationSeconds"] or 0.0) for s in spans)
+    return {
+        "totalSeconds": round(end - origin, 4),
+        "spans": [
+            {
+                "name": s["name"],
+                "service": s["service"],
+                "spanId": s["spanId"],
+                "parentSpanId": s.get("parentSpanId"),
+                "depth": depth(s),
+                "offsetSeconds": round(s["startTime"] - origin, 4),
+                "durationSeconds": s["durationSeconds"],
+                "selfSeconds": round(max(0.0, (s["durationSeconds"] or 0.0) - child_seconds.get(s["spanId"], 0.0)), 4),
+                "attributes": s.get("attributes") or {},
+                "error": s.get("error"),
+            }
+            for s in spans
+        ],
+    }
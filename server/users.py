@@ -0,0 +1,82 @@
+"""
+Shared user store and authentication caches.
+
+Users live in Redis (``user:{username}``) so every API worker sees the same
+accounts. Each process keeps a small read-through cache of user records in
+front of Redis, and a cache of already-verified access tokens so repeated
+requests skip JWT decoding. Lookups that miss are never cached, which means
+a user registered on another worker is visible right away.
+"""
+
+import collections
+import threading
+import time
+from typing import Callable, Optional
+
+USER_KEY = "user:{username}"
+
+
+class LocalCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, expires_at: Optional[float] = None):
+        expiry = self.clock() + self.ttl
+        if expires_at is not None:
+            expiry = min(expiry, expires_at)
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class UserStore:
+    """User records in Redis behind a per-process read-through cache."""
+
+    def __init__(self, redis_client, cache_size: int = 1024, cache_ttl: float = 60.0):
+        self.redis = redis_client
+        self.cache = LocalCache(cache_size, cache_ttl)
+
+    def get(self, username: str) -> Optional[str]:
+        """The stored JSON record of ``username``, or None."""
+        record = self.cache.get(username)
+        if record is not None:
+            return record
+        data = self.redis.get(USER_KEY.format(username=username))
+        if data is None:
+            return None
+        record = data.decode() if isinstance(data, bytes) else data
+        self.cache.put(username, record)
+        return record
+
+    def create(self, username: str, record: str) -> bool:
+        """Store a new user; False if the username is already taken on any worker."""
+        if not self.redis.set(USER_KEY.format(username=username), record, nx=True):
+            return False
+        self.cache.put(username, record)
+        return True
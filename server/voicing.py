@@ -0,0 +1,185 @@
+"""
+Voiced-region compaction for transcription.
+
+Intros, solos and outros are silent in the vocals stem but still take
+Whisper time and are still billed. One vectorized pass computes the energy
+of short frames of the stem. Frames far below the stem's loud frames count
+as unvoiced. Only the voiced regions, padded and with short pauses bridged,
+are concatenated into the file sent for transcription. An offset map then
+translates times in that compacted file back to song time.
+"""
+
+import json
+import wave
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+import waveform
+
+OFFSET_MAP_FILENAME = "voiced_regions.json"
+
+FRAME_SECONDS = 0.02
+# Frames this far below the loud (95th percentile) frames are unvoiced...
+THRESHOLD_DB = -35.0
+# ...and so is anything under this absolute level, so a stem of pure bleed stays silent
+FLOOR_DB = -60.0
+PADDING_SECONDS = 0.25
+# Pauses shorter than this stay in, so phrases aren't cut apart
+MIN_GAP_SECONDS = 1.0
+MIN_REGION_SECONDS = 0.1
+# Silence between concatenated regions, so Whisper doesn't join words across a cut
+JOIN_SILENCE_SECONDS = 0.5
+# Compaction that would cut less than this fraction of the audio isn't worth it
+MIN_SAVED_FRACTION = 0.1
+
+# Analysis frames read from the memory-mapped stem at a time
+_CHUNK_FRAMES = 4096
+
+
+def _open_pcm(wav_path: str):
+    layout = waveform.read_pcm_layout(wav_path)
+    samples = np.memmap(wav_path, dtype=layout.dtype, mode="r", offset=layout.data_offset,
+                        shape=(layout.frames, layout.channels))
+    return layout, samples
+
+
+def frame_levels(wav_path: str, frame_seconds: float = FRAME_SECONDS) -> np.ndarray:
+    """RMS level in dBFS of each ``frame_seconds`` frame of a PCM WAV, channels folded together."""
+    layout, samples = _open_pcm(wav_path)
+    hop = max(1, int(round(frame_seconds * layout.sample_rate)))
+    n_frames = layout.frames // hop
+    energies = np.empty(n_frames, dtype=np.float64)
+    for first in range(0, n_frames, _CHUNK_FRAMES):
+        count = min(_CHUNK_FRAMES, n_frames - first)
+        block = waveform.to_float(samples[first * hop:first * hop + count * hop])
+        energies[first:first + count] = np.mean(np.square(block).reshape(count, -1), axis=1)
+    del samples
+    return 10.0 * np.log10(energies + 1e-12)
+
+
+def _merge(starts: np.ndarray, ends: np.ndarray, max_gap: float):
+    """Join sorted regions separated by at most ``max_gap``."""
+    new_region = np.concatenate(([True], starts[1:] - ends[:-1] > max_gap))
+    first = np.flatnonzero(new_region)
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+def detect_voiced_regions(
+    levels: np.ndarray,
+    frame_seconds: float = FRAME_SECONDS,
+    threshold_db: float = THRESHOLD_DB,
+    floor_db: float = FLOOR_DB,
+    padding: float = PADDING_SECONDS,
+    min_gap: float = MIN_GAP_SECONDS,
+    min_region: float = MIN_REGION_SECONDS,
+) -> np.ndarray:
+    """Voiced ``(start, end)`` regions in seconds, as an ``(n, 2)`` array, from per-frame levels."""
+    if levels.size == 0:
+        return np.empty((0, 2))
+    threshold = max(np.percentile(levels, 95) + threshold_db, floor_db)
+    voiced = np.concatenate(([False], levels > threshold, [False]))
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8)))
+    if edges.size == 0:
+        return np.empty((0, 2))
+    starts, ends = edges[0::2] * frame_seconds, edges[1::2] * frame_seconds
+
+    starts, ends = _merge(starts, ends, min_gap)
+    keep = ends - starts >= min_region
+    starts, ends = starts[keep], ends[keep]
+    if starts.size == 0:
+        return np.empty((0, 2))
+
+    duration = levels.size * frame_seconds
+    starts = np.maximum(starts - padding, 0.0)
+    ends = np.minimum(ends + padding, duration)
+    starts, ends = _merge(starts, ends, 0.0)
+    return np.column_stack((starts, ends))
+
+
+class OffsetMap:
+    """Maps times in the compacted audio back to song time."""
+
+    def __init__(self, song_starts: Sequence[float], compact_starts: Sequence[float], durations: Sequence[float]):
+        self.song_starts = np.asarray(song_starts, dtype=np.float64)
+        self.compact_starts = np.asarray(compact_starts, dtype=np.float64)
+        self.durations = np.asarray(durations, dtype=np.float64)
+
+    @classmethod
+    def from_regions(cls, regions: np.ndarray, join_silence: float = JOIN_SILENCE_SECONDS) -> "OffsetMap":
+        durations = regions[:, 1] - regions[:, 0]
+        compact_starts = np.concatenate(([0.0], np.cumsum(durations + join_silence)[:-1]))
+        return cls(regions[:, 0], compact_starts, durations)
+
+    @property
+    def compact_duration(self) -> float:
+        return float(self.compact_starts[-1] + self.durations[-1]) if self.durations.size else 0.0
+
+    def to_song_time(self, times) -> np.ndarray:
+        """
+        Song time of each compacted time. Times in the silence inserted
+        between two regions map to the end of the earlier region.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        region = np.clip(np.searchsorted(self.compact_starts, times, side="right") - 1, 0, len(self.durations) - 1)
+        return self.song_starts[region] + np.clip(times - self.compact_starts[region], 0.0, self.durations[region])
+
+    def remap(self, items: List[dict], keys: Sequence[str] = ("start", "end")):
+        """Rewrite the ``keys`` times of each item (Whisper segments or words) in place."""
+        if not items or not self.durations.size:
+            return
+        for key in keys:
+            mapped = self.to_song_time([item[key] for item in items])
+            for item, value in zip(items, mapped.tolist()):
+                item[key] = round(value, 3)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "songStarts": self.song_starts.round(4).tolist(),
+                "compactStarts": self.compact_starts.round(4).tolist(),
+                "durations": self.durations.round(4).tolist(),
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "OffsetMap":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["songStarts"], data["compactStarts"], data["durations"])
+
+
+def write_compacted(wav_path: str, output_path: str, offset_map: OffsetMap,
+                    join_silence: float = JOIN_SILENCE_SECONDS):
+    """Write the regions of ``offset_map`` from ``wav_path``, separated by silence, as a 16-bit WAV."""
+    layout, samples = _open_pcm(wav_path)
+    silence = np.zeros((int(round(join_silence * layout.sample_rate)), layout.channels), dtype="<i2")
+    with wave.open(output_path, "wb") as out:
+        out.setnchannels(layout.channels)
+        out.setsampwidth(2)
+        out.setframerate(layout.sample_rate)
+        for index, (start, duration) in enumerate(zip(offset_map.song_starts, offset_map.durations)):
+            if index:
+                out.writeframes(silence.tobytes())
+            first = int(round(start * layout.sample_rate))
+            region = waveform.to_float(samples[first:first + int(round(duration * layout.sample_rate))])
+            out.writeframes(np.clip(np.round(region * 32767.0), -32768, 32767).astype("<i2").tobytes())
+    del samples
+
+
+def compact_voiced(wav_path: str, output_path: str) -> Optional[OffsetMap]:
+    """
+    Write the voiced regions of ``wav_path`` to ``output_path`` and return
+    their offset map, or None (writing nothing) when there is nothing to
+    transcribe or too little to cut.
+
+    Blocking; run it in an executor.
+    """
+    levels = frame_levels(wav_path)
+    regions = detect_voiced_regions(levels)
+    if regions.shape[0] == 0:
+        return None
+    offset_map = OffsetMap.from_regions(regions)
+    if offset_map.compact_duration > (1.0 - MIN_SAVED_FRACTION) * levels.size * FRAME_SECONDS:
+        return None
+    write_compacted(wav_path, output_path, offset_map)
+    return offset_map
@@ -0,0 +1,235 @@
+"""
+Multi-resolution min/max waveform peaks for separated stems.
+
+The peaks are computed straight from the memory-mapped PCM data of a WAV
+file, one chunk at a time, so a long stem is never loaded into memory as a
+whole. Each zoom level is reduced from the level below it and the result is
+written to a small binary file next to the other job outputs:
+
+    header   <8sHIQH   magic, version, sample_rate, total_frames, n_levels
+    levels   <IQQ      samples_per_peak, peak_count, data_offset (per level)
+    data     <i2       interleaved (min, max) pairs, one block per level
+
+All values are scaled to the int16 range regardless of the source format.
+"""
+
+import os
+import struct
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+PEAKS_MAGIC = b"SWMPEAKS"
+PEAKS_VERSION = 1
+PEAKS_EXTENSION = ".peaks"
+
+# Samples (frames) per peak for every zoom level, finest first. Each level
+# must be an integer multiple of the previous one.
+PEAK_LEVELS = (256, 1024, 4096, 16384)
+
+# Number of base-level buckets reduced per chunk of the memory map.
+_CHUNK_PEAKS = 4096
+
+_HEADER = struct.Struct("<8sHIQH")
+_LEVEL = struct.Struct("<IQQ")
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class PcmLayout(NamedTuple):
+    dtype: str
+    channels: int
+    sample_rate: int
+    data_offset: int
+    frames: int
+
+
+def read_pcm_layout(wav_path: str) -> PcmLayout:
+    """Locate the PCM data chunk of a WAV file and describe its layout."""
+    file_size = os.path.getsize(wav_path)
+    fmt = None
+    with open(wav_path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError(f"Not a RIFF/WAVE file: {wav_path}")
+
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_id = chunk_header[:4]
+            chunk_size = struct.unpack("<I", chunk_header[4:])[0]
+
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits)
+                if chunk_size & 1:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"WAV data chunk precedes fmt chunk: {wav_path}")
+                format_tag, channels, sample_rate, bits = fmt
+                dtype = _pcm_dtype(format_tag, bits)
+                data_offset = f.tell()
+                # Streamed writers may leave the size as 0 or 0xFFFFFFFF
+                data_size = min(chunk_size, file_size - data_offset) or file_size - data_offset
+                frame_size = np.dtype(dtype).itemsize * channels
+                return PcmLayout(dtype, channels, sample_rate, data_offset, data_size // frame_size)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    raise ValueError(f"No PCM data chunk found in {wav_path}")
+
+
+def _pcm_dtype(format_tag: int, bits: int) -> str:
+    if format_tag == _WAVE_FORMAT_PCM and bits == 16:
+        return "<i2"
+    if format_tag == _WAVE_FORMAT_PCM and bits == 32:
+        return "<i4"
+    if format_tag == _WAVE_FORMAT_PCM and bits == 8:
+        return "u1"
+    if format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        return "<f4"
+    raise ValueError(f"Unsupported WAV encoding (format={format_tag}, bits={bits})")
+
+
+def _to_int16(values: np.ndarray) -> np.ndarray:
+    """Scale reduced sample values of any supported dtype to int16."""
+    if values.dtype == np.int16:
+        return values
+    if values.dtype == np.int32:
+        return (values >> 16).astype(np.int16)
+    if values.dtype == np.uint8:
+        return ((values.astype(np.int16) - 128) << 8).astype(np.int16)
+    return np.clip(np.round(values * 32767.0), -32768, 32767).astype(np.int16)
+
+
+def to_float(values: np.ndarray) -> np.ndarray:
+    """Scale samples of any supported dtype to float32 in [-1, 1]."""
+    if values.dtype == np.int16:
+        return values.astype(np.float32) / 32768.0
+    if values.dtype == np.int32:
+        return values.astype(np.float32) / 2147483648.0
+    if values.dtype == np.uint8:
+        return (values.astype(np.float32) - 128.0) / 128.0
+    return values.astype(np.float32)
+
+
+def compute_peak_pyramid(wav_path: str, levels: Sequence[int] = PEAK_LEVELS) -> Dict[int, np.ndarray]:
+    """
+    Compute min/max peaks for every level in ``levels``.
+
+    Returns a mapping of samples-per-peak to an ``(n, 2)`` int16 array of
+    (min, max) pairs. Channels are folded together, so each pair covers the
+    full stereo image of its time slice.
+    """
+    levels = sorted(levels)
+    for finer, coarser in zip(levels, levels[1:]):
+        if coarser % finer:
+            raise ValueError(f"Peak level {coarser} is not a multiple of {finer}")
+
+    layout = read_pcm_layout(wav_path)
+    base = levels[0]
+    samples = np.memmap(
+        wav_path,
+        dtype=layout.dtype,
+        mode="r",
+        offset=layout.data_offset,
+        shape=(layout.frames * layout.channels,),
+    )
+
+    bucket = base * layout.channels
+    n_peaks = -(-samples.shape[0] // bucket)
+    mins = np.empty(n_peaks, dtype=samples.dtype)
+    maxs = np.empty(n_peaks, dtype=samples.dtype)
+
+    chunk = bucket * _CHUNK_PEAKS
+    for start in range(0, samples.shape[0], chunk):
+        block = samples[start:start + chunk]
+        starts = np.arange(0, block.shape[0], bucket)
+        first = start // bucket
+        mins[first:first + starts.shape[0]] = np.minimum.reduceat(block, starts)
+        maxs[first:first + starts.shape[0]] = np.maximum.reduceat(block, starts)
+    del samples
+
+    pyramid = {base: np.column_stack((_to_int16(mins), _to_int16(maxs)))}
+    previous = base
+    for level in levels[1:]:
+        finer = pyramid[previous]
+        starts = np.arange(0, finer.shape[0], level // previous)
+        pyramid[level] = np.column_stack((
+            np.minimum.reduceat(finer[:, 0], starts),
+            np.maximum.reduceat(finer[:, 1], starts),
+        ))
+        previous = level
+    return pyramid
+
+
+def write_peaks_file(wav_path: str, peaks_path: str, levels: Sequence[int] = PEAK_LEVELS) -> str:
+    """Compute the peak pyramid for ``wav_path`` and store it at ``peaks_path``."""
+    layout = read_pcm_layout(wav_path)
+    pyramid = compute_peak_pyramid(wav_path, levels)
+
+    offset = _HEADER.size + _LEVEL.size * len(pyramid)
+    table = []
+    for level in sorted(pyramid):
+        table.append((level, pyramid[level].shape[0], offset))
+        offset += pyramid[level].nbytes
+
+    tmp_path = f"{peaks_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, layout.sample_rate, layout.frames, len(table)))
+        for entry in table:
+            f.write(_LEVEL.pack(*entry))
+        for level in sorted(pyramid):
+            f.write(pyramid[level].astype("<i2", copy=False).tobytes())
+    os.replace(tmp_path, peaks_path)
+    return peaks_path
+
+
+def read_peaks(
+    peaks_path: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    resolution: int = PEAK_LEVELS[0],
+) -> dict:
+    """
+    Read the peaks covering ``[start, end)`` seconds from a peaks file.
+
+    ``resolution`` is the requested number of samples per peak; the coarsest
+    stored level that is at least that detailed is used (or the finest level
+    if the request is finer than anything stored).
+    """
+    with open(peaks_path, "rb") as f:
+        magic, version, sample_rate, total_frames, n_levels = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+            raise ValueError(f"Unrecognised peaks file: {peaks_path}")
+        table = [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(n_levels)]
+
+    candidates = [entry for entry in table if entry[0] <= resolution]
+    samples_per_peak, count, offset = max(candidates) if candidates else min(table)
+
+    duration = total_frames / sample_rate
+    start = min(max(start, 0.0), duration)
+    end = duration if end is None else min(max(end, start), duration)
+    first = int(start * sample_rate) // samples_per_peak
+    last = min(count, -(-int(np.ceil(end * sample_rate)) // samples_per_peak))
+
+    peaks = np.memmap(peaks_path, dtype="<i2", mode="r", offset=offset, shape=(count, 2))
+    window = np.array(peaks[first:max(first, last)])
+    del peaks
+
+    return {
+        "sampleRate": sample_rate,
+        "duration": duration,
+        "samplesPerPeak": samples_per_peak,
+        "start": first * samples_per_peak / sample_rate,
+        "end": max(first, last) * samples_per_peak / sample_rate,
+        "min": window[:, 0].tolist(),
+        "max": window[:, 1].tolist(),
+    }
@@ -1,8 +1,32 @@
-from flask import Flask, request, jsonify, send_file
-from spleeter.separator import Separator
+import time
+_import_started = time.perf_counter()
+
 import os
+import tuning
+
+# Thread pools and CPU pinning have to be set up before TensorFlow is imported
+WORKER_TUNING = tuning.configure_worker(int(os.getenv('WORKER_INDEX', '0')))
+
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+_tensorflow_started = time.perf_counter()
+from spleeter.separator import Separator
+_tensorflow_seconds = time.perf_counter() - _tensorflow_started
 import uuid
-import time
+import json
+import shutil
+import threading
+import collections
+import functools
+import numpy as np
+import audio_io
+import streaming
+import tracing
+import hmac
+import profiler
+from batching import MicroBatcher
+from limits import EndpointLimit, LimitExceeded
+
+tuning.apply_tf_threading(WORKER_TUNING)
 
 app = Flask(__name__)
 
@@ -11,33 +35,314 @@ UPLOAD_FOLDER = '/audio'
 OUTPUT_FOLDER = '/output'
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'flac', 'm4a'}
 
+# Separated stems are downloaded by the API right away, so keep them only briefly
+OUTPUT_RETENTION_SECONDS = float(os.getenv('OUTPUT_RETENTION_SECONDS', '3600'))
+UPLOAD_RETENTION_SECONDS = float(os.getenv('UPLOAD_RETENTION_SECONDS', '3600'))
+SWEEP_INTERVAL_SECONDS = float(os.getenv('SWEEP_INTERVAL_SECONDS', '300'))
+
+# Short clips arriving close together are separated in one inference call
+BATCH_ENABLED = os.getenv('BATCH_ENABLED', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '10'))
+BATCH_MAX_CLIP_SECONDS = float(os.getenv('BATCH_MAX_CLIP_SECONDS', '30'))
+
+# Separation tiers map to Spleeter models. The stock 2stems model cuts at
+# 11 kHz and is the fast tier; the 16 kHz-bandwidth variant is the quality tier.
+SEPARATION_TIERS = {
+    'fast': os.getenv('TIER_FAST_MODEL', 'spleeter:2stems'),
+    'quality': os.getenv('TIER_QUALITY_MODEL', 'spleeter:2stems-16kHz'),
+}
+DEFAULT_TIER = os.getenv('DEFAULT_TIER', 'fast')
+# Tiers whose models are loaded and run once at worker start, so no job pays for it
+PRELOAD_TIERS = [t for t in os.getenv('PRELOAD_TIERS', ','.join(SEPARATION_TIERS)).split(',') if t]
+# Multi-stem models for the extra stems (drums, bass, piano) the API computes on demand.
+# Once loaded they stay in memory; those listed here are warmed after the worker is ready.
+STEM_MODELS = {
+    '4stems': os.getenv('STEMS4_MODEL', 'spleeter:4stems'),
+    '5stems': os.getenv('STEMS5_MODEL', 'spleeter:5stems'),
+}
+PRELOAD_STEM_MODELS = [m for m in os.getenv('PRELOAD_STEM_MODELS', '4stems').split(',') if m]
+# Latency samples kept per tier for percentiles
+TIER_LATENCY_WINDOW = 512
+
+# On-demand sampling profiler; /debug/profile only exists when a token is configured
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN')
+sampling_profiler = profiler.SamplingProfiler(
+    interval=float(os.getenv('PROFILER_INTERVAL_MS', '10')) / 1000,
+    max_seconds=float(os.getenv('PROFILER_MAX_SECONDS', '60'))
+)
+
+# Concurrency limits per endpoint; keep these below the server's thread count
+# so /health always has a free thread. Separations take their slot once the
+# upload is in, so slow uploads don't hold one.
+separate_limit = EndpointLimit(
+    'separate',
+    int(os.getenv('SEPARATE_MAX_CONCURRENCY', '8')),
+    float(os.getenv('SEPARATE_LIMIT_WAIT_SECONDS', '0'))
+)
+download_limit = EndpointLimit(
+    'download',
+    int(os.getenv('DOWNLOAD_MAX_CONCURRENCY', '4')),
+    float(os.getenv('DOWNLOAD_LIMIT_WAIT_SECONDS', '5'))
+)
+# Time allowed to receive an upload, so a stalled client can't hold a server thread
+UPLOAD_TIMEOUT_SECONDS = float(os.getenv('UPLOAD_TIMEOUT_SECONDS', '300'))
+
 # Create necessary directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Import and warm-up timings; the worker is ready once every preloaded tier is warm
+startup_state = {
+    "phases": {"tensorflow_import": round(_tensorflow_seconds, 4)},
+    "warm_tiers": [],
+    "failed_tiers": [],
+    "warm_stem_models": [],
+    "ready_after": None
+}
+
+storage_metrics = {
+    "sweeps": 0,
+    "uploads_removed": 0,
+    "outputs_removed": 0,
+    "bytes_freed": 0,
+    "last_sweep_seconds": None
+}
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def sweep_storage():
+    """Remove leftover uploads and separations older than their retention period."""
+    start = time.time()
+    for folder, ttl, counter in ((UPLOAD_FOLDER, UPLOAD_RETENTION_SECONDS, "uploads_removed"),
+                                 (OUTPUT_FOLDER, OUTPUT_RETENTION_SECONDS, "outputs_removed")):
+        for entry in os.scandir(folder):
+            try:
+                if start - entry.stat().st_mtime <= ttl:
+                    continue
+                size = _tree_size(entry.path)
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                storage_metrics[counter] += 1
+                storage_metrics["bytes_freed"] += size
+            except OSError as e:
+                app.logger.warning(f"Failed to remove {entry.path}: {str(e)}")
+    storage_metrics["sweeps"] += 1
+    storage_metrics["last_sweep_seconds"] = round(time.time() - start, 3)
+
+def _sweeper_loop():
+    while True:
+        try:
+            sweep_storage()
+        except Exception as e:
+            app.logger.error(f"Storage sweep failed: {str(e)}")
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+
+def start_storage_sweeper():
+    if SWEEP_INTERVAL_SECONDS > 0:
+        threading.Thread(target=_sweeper_loop, name="storage-sweeper", daemon=True).start()
+
+# Separators kept loaded for the in-memory path, keyed by model
+_separators = {}
+_separator_lock = threading.Lock()
+
+def get_separator(model='spleeter:2stems'):
+    """Return a loaded separator for ``model`` and the lock guarding its use."""
+    with _separator_lock:
+        if model not in _separators:
+            _separators[model] = (Separator(model, multiprocess=False), threading.Lock())
+        return _separators[model]
+
+def _warm_model(model):
+    """Load ``model`` and run it once on a second of silence. Returns the seconds it took."""
+    start = time.perf_counter()
+    separator, separator_lock = get_separator(model)
+    with separator_lock:
+        separator.separate(np.zeros((audio_io.SAMPLE_RATE, audio_io.CHANNELS), dtype=np.float32))
+    return time.perf_counter() - start
+
+def preload_tiers():
+    """Warm each preloaded tier's model, then the preloaded extra-stem models."""
+    for tier in PRELOAD_TIERS:
+        try:
+            seconds = _warm_model(SEPARATION_TIERS[tier])
+            startup_state["phases"][f"warm_{tier}"] = round(seconds, 4)
+            startup_state["warm_tiers"].append(tier)
+            app.logger.info(f"Loaded {tier} tier model in {seconds:.2f}s")
+        except Exception as e:
+            startup_state["failed_tiers"].append(tier)
+            app.logger.error(f"Failed to preload {tier} tier model: {str(e)}")
+    if not startup_state["failed_tiers"]:
+        startup_state["ready_after"] = round(time.perf_counter() - _import_started, 4)
+
+    # Extra stems are optional, so their models don't hold up readiness
+    for name in PRELOAD_STEM_MODELS:
+        try:
+            seconds = _warm_model(STEM_MODELS[name])
+            startup_state["phases"][f"warm_{name}"] = round(seconds, 4)
+            startup_state["warm_stem_models"].append(name)
+            app.logger.info(f"Loaded {name} model in {seconds:.2f}s")
+        except Exception as e:
+            app.logger.error(f"Failed to preload {name} model: {str(e)}")
+
+def is_ready():
+    return startup_state["ready_after"] is not None
+
+def start_model_preload():
+    threading.Thread(target=preload_tiers, name="model-preload", daemon=True).start()
+
+# One micro-batcher per model, since a batch can only run through one network
+_batchers = {}
+_batcher_lock = threading.Lock()
+
+def get_batcher(model='spleeter:2stems'):
+    """Return the micro-batcher for ``model``, creating it on first use."""
+    with _batcher_lock:
+        if model not in _batchers:
+            separator, separator_lock = get_separator(model)
+            params = separator._params
+            _batchers[model] = MicroBatcher(
+                separator.separate,
+                segment_samples=params['T'] * params['frame_step'],
+                guard_samples=params['frame_length'],
+                max_batch_size=BATCH_MAX_SIZE,
+                max_wait_ms=BATCH_MAX_WAIT_MS,
+                lock=separator_lock
+            )
+        return _batchers[model]
+
+# Separation latency per tier (and extra-stem model), so the fast/quality trade-off is visible
+_tier_latency = {
+    tier: collections.deque(maxlen=TIER_LATENCY_WINDOW) for tier in {**SEPARATION_TIERS, **STEM_MODELS}
+}
+_tier_counts = collections.Counter()
+_tier_lock = threading.Lock()
+
+def record_tier_latency(tier, seconds, audio_seconds):
+    with _tier_lock:
+        _tier_latency[tier].append((seconds, audio_seconds))
+        _tier_counts[tier] += 1
+
+def tier_stats():
+    stats = {}
+    with _tier_lock:
+        for tier, model in {**SEPARATION_TIERS, **STEM_MODELS}.items():
+            samples = sorted(seconds for seconds, _ in _tier_latency[tier])
+            audio = sum(audio_seconds for _, audio_seconds in _tier_latency[tier])
+            stats[tier] = {
+                "model": model,
+                "loaded": model in _separators,
+                "separations": _tier_counts[tier],
+                "p50_seconds": samples[len(samples) // 2] if samples else None,
+                "p95_seconds": samples[min(len(samples) - 1, int(0.95 * len(samples)))] if samples else None,
+                # Seconds of compute per second of audio
+                "real_time_factor": sum(samples) / audio if audio else None
+            }
+    return stats
+
+def should_batch(waveform):
+    return BATCH_ENABLED and waveform.shape[0] <= BATCH_MAX_CLIP_SECONDS * audio_io.SAMPLE_RATE
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.route('/live')
+def live():
+    """Liveness probe: the worker is up, even if models are still loading."""
+    return jsonify({"status": "alive"})
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: every preloaded tier's model is loaded and has run once."""
+    return jsonify({"status": "ready" if is_ready() else "starting", **startup_state}), 200 if is_ready() else 503
+
 @app.route('/health')
 def health():
-    return jsonify({"status": "healthy"})
+    return jsonify({
+        "status": "healthy",
+        "ready": is_ready(),
+        "startup": startup_state,
+        "storage": storage_metrics,
+        "tuning": WORKER_TUNING,
+        "limits": {"separate": separate_limit.stats(), "download": download_limit.stats()},
+        "batching": {model: batcher.stats for model, batcher in _batchers.items()},
+        "tiers": tier_stats()
+    })
+
+def profiled_job(view):
+    """Count a separation as a job for the profiler's job mode."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = sampling_profiler.job_started()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            sampling_profiler.job_finished(token)
+    return wrapper
+
+@app.route('/debug/profile', methods=['POST'])
+def profile_worker():
+    """
+    Profile this worker for ``seconds``, or while the next ``jobs``
+    separations run, and return collapsed stacks for flamegraph.pl.
+    """
+    if not PROFILER_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    token = request.headers.get('X-Debug-Token', '')
+    if not hmac.compare_digest(token, PROFILER_TOKEN):
+        return jsonify({"error": "Invalid debug token"}), 401
+    seconds = request.args.get('seconds', type=float)
+    jobs = request.args.get('jobs', type=int)
+    if (seconds is None) == (jobs is None):
+        return jsonify({"error": "Pass either seconds or jobs"}), 400
+    if (seconds is not None and seconds <= 0) or (jobs is not None and jobs <= 0):
+        return jsonify({"error": "seconds and jobs must be positive"}), 400
+
+    try:
+        if seconds is not None:
+            result = sampling_profiler.profile_for(seconds)
+        else:
+            result = sampling_profiler.profile_jobs(jobs)
+    except profiler.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+
+    collapsed = result.pop("collapsed")
+    headers = {f"X-Profile-{key[0].upper()}{key[1:]}": str(value) for key, value in result.items()}
+    return Response(collapsed + "\n" if collapsed else "", mimetype='text/plain', headers=headers)
 
 @app.route('/separate', methods=['POST'])
+@profiled_job
 def separate_audio():
     start_time = time.time()
     timing = {}
     input_path = None
     
-    if 'file' not in request.files:
-        return jsonify({"error": "No file provided"}), 400
+    try:
+        filename, chunks = streaming.open_file_field(request, timeout=UPLOAD_TIMEOUT_SECONDS)
+    except streaming.UploadTimeout as e:
+        return jsonify({"error": str(e)}), 408
+    except streaming.UploadError as e:
+        return jsonify({"error": str(e)}), 400
     
-    file = request.files['file']
-    if file.filename == '':
+    if filename == '':
         return jsonify({"error": "No file selected"}), 400
     
-    if not allowed_file(file.filename):
+    if not allowed_file(filename):
         return jsonify({"error": "File type not allowed"}), 400
 
+    trace = tracing.RequestTrace('spleeter.separate_to_file', request.headers.get('traceparent'))
     try:
         # Generate unique ID for this separation
         separation_id = str(uuid.uuid4())
@@ -45,22 +350,27 @@ def separate_audio():
         # Save uploaded file
         save_start = time.time()
         input_path = os.path.join(UPLOAD_FOLDER, f"{separation_id}.wav")
-        file.save(input_path)
+        with trace.span('file_save'), open(input_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
         timing['file_save'] = f"{time.time() - save_start:.2f}s"
         
-        # Initialize separator
-        init_start = time.time()
-        separator = Separator('spleeter:2stems')
-        timing['model_init'] = f"{time.time() - init_start:.2f}s"
+        with separate_limit:
+            # Initialize separator
+            init_start = time.time()
+            with trace.span('model_init'):
+                separator = Separator('spleeter:2stems')
+            timing['model_init'] = f"{time.time() - init_start:.2f}s"
         
-        # Create output directory
-        output_path = os.path.join(OUTPUT_FOLDER, separation_id)
-        os.makedirs(output_path, exist_ok=True)
+            # Create output directory
+            output_path = os.path.join(OUTPUT_FOLDER, separation_id)
+            os.makedirs(output_path, exist_ok=True)
         
-        # Perform separation
-        separation_start = time.time()
-        separator.separate_to_file(input_path, output_path)
-        timing['separation'] = f"{time.time() - separation_start:.2f}s"
+            # Perform separation
+            separation_start = time.time()
+            with trace.span('separation'):
+                separator.separate_to_file(input_path, output_path)
+            timing['separation'] = f"{time.time() - separation_start:.2f}s"
         
         # Clean up input file
         if os.path.exists(input_path):
@@ -73,19 +383,153 @@ def separate_audio():
             "message": "Audio separation completed",
             "separation_id": separation_id,
             "timing": timing,
+            "spans": trace.finish(),
             "files": {
                 "vocals": f"/download/{separation_id}/vocals.wav",
                 "accompaniment": f"/download/{separation_id}/accompaniment.wav"
             }
         })
         
+    except (streaming.UploadTimeout, LimitExceeded) as e:
+        trace.finish(error=str(e))
+        if input_path and os.path.exists(input_path):
+            os.remove(input_path)
+        if isinstance(e, streaming.UploadTimeout):
+            return jsonify({"error": str(e)}), 408
+        return separate_limit.rejection()
     except Exception as e:
         app.logger.error(f"Error during separation: {str(e)}")
+        trace.finish(error=str(e))
         if input_path and os.path.exists(input_path):
             os.remove(input_path)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/separate/stream', methods=['POST'])
+@profiled_job
+def separate_audio_stream():
+    """
+    Separate an upload entirely in memory and stream the stems back.
+
+    The response is ``multipart/mixed``: a JSON part with the separation
+    metadata and timings, followed by one 16-bit WAV part per stem. The
+    upload is decoded while it is still being received.
+
+    ``stems=4stems|5stems`` separates with a multi-stem model instead of a
+    tier's, and ``only=drums,bass`` limits the stems sent back.
+    """
+    start_time = time.time()
+    timing = {}
+
+    try:
+        filename, chunks = streaming.open_file_field(request, timeout=UPLOAD_TIMEOUT_SECONDS)
+    except streaming.UploadTimeout as e:
+        return jsonify({"error": str(e)}), 408
+    except streaming.UploadError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if filename == '':
+        return jsonify({"error": "No file selected"}), 400
+
+    if not allowed_file(filename):
+        return jsonify({"error": "File type not allowed"}), 400
+
+    stem_set = request.args.get('stems')
+    if stem_set:
+        if stem_set not in STEM_MODELS:
+            return jsonify({"error": f"Unknown stem model: {stem_set}"}), 400
+        # Latency is reported under the stem model's name, like a tier
+        tier, model = stem_set, STEM_MODELS[stem_set]
+    else:
+        tier = request.args.get('tier', DEFAULT_TIER)
+        if tier not in SEPARATION_TIERS:
+            return jsonify({"error": f"Unknown tier: {tier}"}), 400
+        model = SEPARATION_TIERS[tier]
+    only = [name for name in request.args.get('only', '').split(',') if name]
+
+    decoder = None
+    trace = tracing.RequestTrace('spleeter.separate', request.headers.get('traceparent'))
+    trace.root['attributes'].update(tier=tier, model=model)
+    try:
+        separation_id = str(uuid.uuid4())
+
+        decode_start = time.time()
+        with trace.span('decode'):
+            decoder = audio_io.StreamingDecoder(filename.rsplit('.', 1)[1].lower())
+            for chunk in chunks:
+                decoder.feed(chunk)
+            waveform = decoder.finish()
+        decoder = None
+        timing['decode'] = f"{time.time() - decode_start:.2f}s"
+
+        # The upload is in; only inference holds a separation slot
+        with separate_limit:
+            init_start = time.time()
+            with trace.span('model_init'):
+                separator, separator_lock = get_separator(model)
+            timing['model_init'] = f"{time.time() - init_start:.2f}s"
+
+            separation_start = time.time()
+            batched = should_batch(waveform)
+            with trace.span('separation', batched=batched, audio_seconds=waveform.shape[0] / audio_io.SAMPLE_RATE):
+                if batched:
+                    stems = get_batcher(model).submit(waveform)
+                else:
+                    with separator_lock:
+                        stems = separator.separate(waveform)
+            separation_seconds = time.time() - separation_start
+            record_tier_latency(tier, separation_seconds, waveform.shape[0] / audio_io.SAMPLE_RATE)
+            timing['separation'] = f"{separation_seconds:.2f}s"
+            timing['total'] = f"{time.time() - start_time:.2f}s"
+        del waveform
+        if only:
+            stems = {name: stem for name, stem in stems.items() if name in only}
+    except (streaming.UploadTimeout, LimitExceeded) as e:
+        trace.finish(error=str(e))
+        if decoder is not None:
+            decoder.abort()
+        if isinstance(e, streaming.UploadTimeout):
+            return jsonify({"error": str(e)}), 408
+        return separate_limit.rejection()
+    except Exception as e:
+        app.logger.error(f"Error during in-memory separation: {str(e)}")
+        trace.finish(error=str(e))
+        if decoder is not None:
+            decoder.abort()
+        return jsonify({"error": str(e)}), 500
+
+    boundary = uuid.uuid4().hex
+    metadata = json.dumps({
+        "status": "success",
+        "message": "Audio separation completed",
+        "separation_id": separation_id,
+        "timing": timing,
+        "tier": tier,
+        "model": model,
+        "batched": batched,
+        "stems": list(stems),
+        # Streaming the stems back is timed by the caller
+        "spans": trace.finish()
+    })
+
+    def generate():
+        yield (f"--{boundary}\r\n"
+               f"Content-Type: application/json\r\n"
+               f"Content-Disposition: inline; name=\"metadata\"\r\n\r\n"
+               f"{metadata}\r\n").encode()
+        for name in list(stems):
+            waveform = stems.pop(name)
+            yield (f"--{boundary}\r\n"
+                   f"Content-Type: audio/wav\r\n"
+                   f"Content-Length: {audio_io.wav_size(waveform)}\r\n"
+                   f"Content-Disposition: attachment; name=\"{name}\"; filename=\"{name}.wav\"\r\n\r\n").encode()
+            yield from audio_io.iter_wav(waveform)
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    return Response(stream_with_context(generate()), mimetype=f"multipart/mixed; boundary={boundary}")
+
 @app.route('/download/<separation_id>/<filename>')
+@download_limit
 def download_file(separation_id, filename):
     if not filename.endswith('.wav'):
         filename = f"{filename}.wav"
@@ -101,5 +545,22 @@ def download_file(separation_id, filename):
     
     return jsonify({"error": "File not found"}), 404
 
+@app.route('/download/<separation_id>', methods=['DELETE'])
+def delete_separation(separation_id):
+    """Delete the stems of a separation once the caller has downloaded them."""
+    output_path = os.path.join(OUTPUT_FOLDER, os.path.basename(separation_id))
+    if not os.path.isdir(output_path):
+        return jsonify({"error": "Separation not found"}), 404
+
+    size = _tree_size(output_path)
+    shutil.rmtree(output_path, ignore_errors=True)
+    storage_metrics["outputs_removed"] += 1
+    storage_metrics["bytes_freed"] += size
+    return jsonify({"status": "deleted", "separation_id": separation_id})
+
+startup_state["phases"]["import"] = round(time.perf_counter() - _import_started, 4)
+
 if __name__ == '__main__':
+    start_storage_sweeper()
+    start_model_preload()
     app.run(host='0.0.0.0', port=8000) 
\ No newline at end of file
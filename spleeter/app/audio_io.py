@@ -0,0 +1,181 @@
+"""
+In-memory audio decoding and encoding for the separation service.
+
+Uploads are decoded once through an ffmpeg pipe straight into a float32
+NumPy waveform while they are still being received, and separated stems
+are encoded back to 16-bit PCM WAV incrementally, so no audio touches the
+disk around inference.
+"""
+
+import os
+import struct
+import tempfile
+import threading
+
+import ffmpeg
+import numpy as np
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+# Frames encoded per chunk when streaming a WAV (about one second of audio)
+WAV_CHUNK_FRAMES = SAMPLE_RATE
+
+# Containers ffmpeg can only demux from a seekable input (index at the end)
+SEEKABLE_ONLY_EXTENSIONS = {'m4a', 'mp4'}
+
+
+def _decoder_output(stream_input):
+    return stream_input.output('pipe:1', format='f32le', acodec='pcm_f32le', ac=CHANNELS, ar=SAMPLE_RATE)
+
+
+def _to_waveform(pcm):
+    return np.frombuffer(pcm, dtype='<f4').reshape(-1, CHANNELS)
+
+
+def parse_canonical_wav(data):
+    """
+    Return the waveform of a WAV that is already 44.1 kHz stereo 16-bit or
+    float PCM (as produced by the API's ingest stage), or None if the file
+    needs a real decode.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    fmt = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = bytes(data[position:position + 4])
+        chunk_size = struct.unpack("<I", data[position + 4:position + 8])[0]
+        body = position + 8
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", data[body:body + 16])
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            format_tag, channels, sample_rate, _, _, bits = fmt
+            if channels != CHANNELS or sample_rate != SAMPLE_RATE:
+                return None
+            end = min(body + chunk_size, len(data)) if chunk_size else len(data)
+            if format_tag == 1 and bits == 16:
+                samples = np.frombuffer(data, dtype='<i2', count=(end - body) // 2, offset=body)
+                return (samples.astype(np.float32) / 32768.0).reshape(-1, CHANNELS)
+            if format_tag == 3 and bits == 32:
+                samples = np.frombuffer(data, dtype='<f4', count=(end - body) // 4, offset=body)
+                return samples.reshape(-1, CHANNELS).copy()
+            return None
+        position = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+class StreamingDecoder:
+    """
+    Decode an upload to a ``(frames, 2)`` float32 waveform at 44.1 kHz
+    while it is still arriving.
+
+    Chunks passed to ``feed`` go straight into ffmpeg's stdin and the PCM
+    output is collected by a reader thread, so decoding overlaps the upload
+    and the encoded file is never held in memory or written to disk.
+    Containers that need seeking are spooled to a temporary file instead,
+    and WAV uploads are buffered so canonical PCM can skip ffmpeg entirely.
+    """
+
+    def __init__(self, extension=None):
+        self._spool = None
+        self._process = None
+        self._buffer = None
+        if extension == 'wav':
+            self._buffer = bytearray()
+            return
+        if extension in SEEKABLE_ONLY_EXTENSIONS:
+            self._spool = tempfile.NamedTemporaryFile(suffix=f".{extension}", delete=False)
+            return
+
+        self._process = _decoder_output(ffmpeg.input('pipe:0')).run_async(
+            pipe_stdin=True, pipe_stdout=True, pipe_stderr=True
+        )
+        self._pcm = []
+        self._stderr = []
+        self._readers = [
+            threading.Thread(target=self._drain, args=(self._process.stdout, self._pcm), daemon=True),
+            threading.Thread(target=self._drain, args=(self._process.stderr, self._stderr), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    @staticmethod
+    def _drain(pipe, sink):
+        for chunk in iter(lambda: pipe.read(1024 * 1024), b''):
+            sink.append(chunk)
+
+    def feed(self, chunk):
+        if self._buffer is not None:
+            self._buffer.extend(chunk)
+            return
+        if self._spool is not None:
+            self._spool.write(chunk)
+            return
+        try:
+            self._process.stdin.write(chunk)
+        except BrokenPipeError:
+            # ffmpeg gave up on the input; finish() reports its error
+            pass
+
+    def finish(self):
+        if self._buffer is not None:
+            waveform = parse_canonical_wav(self._buffer)
+            if waveform is None:
+                out, _ = _decoder_output(ffmpeg.input('pipe:0')).run(
+                    input=bytes(self._buffer), capture_stdout=True, capture_stderr=True
+                )
+                waveform = _to_waveform(out)
+            self._buffer = None
+            return waveform
+
+        if self._spool is not None:
+            self._spool.close()
+            try:
+                out, _ = _decoder_output(ffmpeg.input(self._spool.name)).run(capture_stdout=True, capture_stderr=True)
+            finally:
+                os.remove(self._spool.name)
+            return _to_waveform(out)
+
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        for reader in self._readers:
+            reader.join()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode the upload: {b''.join(self._stderr).decode(errors='replace').strip()}")
+        return _to_waveform(b''.join(self._pcm))
+
+    def abort(self):
+        if self._buffer is not None:
+            self._buffer = None
+        elif self._spool is not None:
+            self._spool.close()
+            os.remove(self._spool.name)
+        elif self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+
+def wav_header(frames, channels=CHANNELS, sample_rate=SAMPLE_RATE):
+    data_size = frames * channels * 2
+    return b"".join((
+        b"RIFF", struct.pack("<I", 36 + data_size), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16),
+        b"data", struct.pack("<I", data_size),
+    ))
+
+
+def wav_size(waveform):
+    return 44 + waveform.shape[0] * waveform.shape[1] * 2
+
+
+def iter_wav(waveform, sample_rate=SAMPLE_RATE):
+    """Yield a float waveform as 16-bit PCM WAV bytes, one chunk at a time."""
+    yield wav_header(waveform.shape[0], waveform.shape[1], sample_rate)
+    for start in range(0, waveform.shape[0], WAV_CHUNK_FRAMES):
+        block = waveform[start:start + WAV_CHUNK_FRAMES]
+        yield (np.clip(block, -1.0, 1.0) * 32767).astype('<i2').tobytes()
@@ -0,0 +1,90 @@
+"""
+Find the throughput-optimal worker count x thread count for this host.
+
+Every combination whose total thread count fits the available cores is run
+as real worker processes (pinned and sized exactly as the service would
+be), each separating the same synthetic track. The fastest combination is
+written to ``TUNING_FILE`` and picked up by the service on its next start.
+
+    python autotune.py --seconds 30 --repeats 2
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+
+import tuning
+
+
+def _powers_of_two(limit):
+    value = 1
+    while value <= limit:
+        yield value
+        value *= 2
+
+
+def _worker(worker_index, config, seconds, repeats, barrier, results):
+    applied = tuning.configure_worker(worker_index, config)
+
+    import numpy as np
+    from spleeter.separator import Separator
+    tuning.apply_tf_threading(applied)
+
+    t = np.arange(int(seconds * 44100)) / 44100
+    mono = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 330 * t)
+    waveform = np.stack([mono, mono], axis=1).astype(np.float32)
+
+    separator = Separator('spleeter:2stems', multiprocess=False)
+    separator.separate(waveform)  # warm up before the clock starts
+
+    barrier.wait()
+    start = time.time()
+    for _ in range(repeats):
+        separator.separate(waveform)
+    results.put((worker_index, time.time() - start))
+
+
+def measure(config, seconds, repeats):
+    """Tracks separated per second by ``config['workers']`` concurrent workers."""
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(config["workers"])
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(i, config, seconds, repeats, barrier, results))
+        for i in range(config["workers"])
+    ]
+    for process in processes:
+        process.start()
+    elapsed = [results.get()[1] for _ in processes]
+    for process in processes:
+        process.join()
+    return config["workers"] * repeats / max(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=30.0, help="length of the synthetic track")
+    parser.add_argument('--repeats', type=int, default=2, help="separations per worker")
+    parser.add_argument('--output', default=tuning.TUNING_FILE)
+    args = parser.parse_args()
+
+    cpus = len(tuning.available_cpus())
+    results = []
+    for workers in _powers_of_two(cpus):
+        for threads in _powers_of_two(cpus // workers):
+            config = dict(tuning.DEFAULTS, workers=workers, intra_op_threads=threads)
+            throughput = measure(config, args.seconds, args.repeats)
+            results.append((throughput, config))
+            print(f"workers={workers:<3} intra_op_threads={threads:<3} {throughput:.3f} tracks/sec")
+
+    throughput, best = max(results, key=lambda result: result[0])
+    best = dict(best, tracks_per_second=round(throughput, 4), cpus=cpus, track_seconds=args.seconds)
+    with open(args.output, 'w') as f:
+        json.dump(best, f, indent=2)
+    print(f"Best: workers={best['workers']} intra_op_threads={best['intra_op_threads']} "
+          f"({throughput:.3f} tracks/sec), written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
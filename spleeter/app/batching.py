@@ -0,0 +1,90 @@
+"""
+Micro-batching of short separation requests.
+
+Spleeter cuts the spectrogram of its input into fixed segments of ``T``
+frames and runs them through the model as one batch. Short clips queued
+within a few milliseconds of each other are therefore padded to a whole
+number of segments (plus a silent guard covering the STFT offset) and
+concatenated, so that no model segment ever mixes two clips. One inference
+call then separates all of them, and the stems are split back per clip.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, separate_fn, segment_samples, guard_samples,
+                 max_batch_size=8, max_wait_ms=10.0, lock=None):
+        self._separate = separate_fn
+        self._segment = segment_samples
+        self._guard = guard_samples
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = lock or threading.Lock()
+        self._queue = queue.Queue()
+        self.stats = {"batches": 0, "clips": 0, "largest_batch": 0}
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, waveform):
+        """Queue a ``(frames, channels)`` waveform and block until its stems are ready."""
+        future = Future()
+        self._queue.put((waveform, future))
+        return future.result()
+
+    def _padded_length(self, frames):
+        segments = -(-(frames + self._guard) // self._segment)
+        return segments * self._segment
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._separate_batch(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _separate_batch(self, batch):
+        channels = batch[0][0].shape[1]
+        offsets = []
+        total = 0
+        for waveform, _ in batch:
+            offsets.append(total)
+            total += self._padded_length(waveform.shape[0])
+
+        joined = np.zeros((total, channels), dtype=np.float32)
+        for (waveform, _), offset in zip(batch, offsets):
+            joined[offset:offset + waveform.shape[0]] = waveform
+
+        with self._lock:
+            stems = self._separate(joined)
+
+        for (waveform, future), offset in zip(batch, offsets):
+            future.set_result({
+                name: np.ascontiguousarray(stem[offset:offset + waveform.shape[0]])
+                for name, stem in stems.items()
+            })
+
+        self.stats["batches"] += 1
+        self.stats["clips"] += len(batch)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
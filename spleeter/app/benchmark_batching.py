@@ -0,0 +1,78 @@
+"""
+Benchmark separation throughput for short clips with and without micro-batching.
+
+Run inside the Spleeter container:
+
+    python benchmark_batching.py --clips 32 --seconds 10 --concurrency 8
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import app as service
+import audio_io
+from batching import MicroBatcher
+
+
+def synthetic_clip(seconds, seed):
+    """A stereo mix of two detuned tones with a little noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * audio_io.SAMPLE_RATE)) / audio_io.SAMPLE_RATE
+    base = rng.uniform(110, 880)
+    mono = 0.3 * np.sin(2 * np.pi * base * t) + 0.2 * np.sin(2 * np.pi * base * 1.5 * t)
+    mono += 0.02 * rng.standard_normal(t.shape[0])
+    return np.stack([mono, mono], axis=1).astype(np.float32)
+
+
+def run(separate, clips, concurrency):
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(separate, clips))
+    return len(clips) / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clips', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=service.BATCH_MAX_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=service.BATCH_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    clips = [synthetic_clip(args.seconds, seed) for seed in range(args.clips)]
+    separator, separator_lock = service.get_separator()
+
+    # Warm up the model so neither run pays for graph construction
+    separator.separate(clips[0])
+
+    def unbatched(waveform):
+        with separator_lock:
+            return separator.separate(waveform)
+
+    params = separator._params
+    batcher = MicroBatcher(
+        separator.separate,
+        segment_samples=params['T'] * params['frame_step'],
+        guard_samples=params['frame_length'],
+        max_batch_size=args.batch_size,
+        max_wait_ms=args.max_wait_ms,
+        lock=separator_lock
+    )
+
+    off = run(unbatched, clips, args.concurrency)
+    on = run(batcher.submit, clips, args.concurrency)
+
+    print(f"Clips: {args.clips} x {args.seconds:.1f}s, concurrency {args.concurrency}")
+    print(f"Batching off: {off:.2f} clips/sec")
+    print(f"Batching on:  {on:.2f} clips/sec "
+          f"(batch size {args.batch_size}, wait {args.max_wait_ms:.0f}ms, "
+          f"{batcher.stats['batches']} batches, largest {batcher.stats['largest_batch']})")
+    print(f"Speedup: {on / off:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
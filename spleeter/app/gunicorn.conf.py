@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for the Spleeter service.
+
+Threaded workers keep slow uploads and downloads off the inference path
+and leave free threads for /health while separations run. Each worker gets
+a stable index so it can be pinned to its own CPU slice (see tuning.py).
+"""
+
+import itertools
+import os
+
+import tuning
+
+_tuning = tuning.load_tuning()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = _tuning["workers"]
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+# Separations of long tracks can take minutes; gthread workers heartbeat
+# from their main loop, so this only catches genuinely stuck workers
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '900'))
+graceful_timeout = 60
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+accesslog = '-'
+
+
+def pre_fork(server, worker):
+    used = {getattr(w, 'worker_index', None) for w in server.WORKERS.values()}
+    worker.worker_index = next(i for i in itertools.count() if i not in used)
+
+
+def post_fork(server, worker):
+    # Read by app.py before TensorFlow is imported
+    os.environ['WORKER_INDEX'] = str(worker.worker_index)
+
+
+def post_worker_init(worker):
+    import app
+    # Models live in each worker's own memory
+    app.start_model_preload()
+    # One storage sweeper per container is enough
+    if worker.worker_index == 0:
+        app.start_storage_sweeper()
@@ -0,0 +1,79 @@
+"""
+Per-endpoint concurrency limits.
+
+Each limited endpoint gets a fixed number of slots. A request that cannot
+get a slot within ``wait_seconds`` is turned away with 503 and
+``Retry-After`` instead of piling up threads, so cheap endpoints such as
+``/health`` always find a free server thread.
+
+A limit wraps a whole view as a decorator, or just the costly part of one
+as a ``with`` block, which raises ``LimitExceeded`` when no slot is free.
+"""
+
+import functools
+import threading
+
+from flask import jsonify
+
+
+class LimitExceeded(Exception):
+    """No slot of an endpoint limit was free in time."""
+
+
+class EndpointLimit:
+    def __init__(self, name, max_concurrent, wait_seconds=0.0, retry_after=5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.wait_seconds = wait_seconds
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self.wait_seconds > 0:
+            acquired = self._slots.acquire(timeout=self.wait_seconds)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        with self._lock:
+            if acquired:
+                self.active += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def rejection(self):
+        """The 503 response for a request that got no slot."""
+        response = jsonify({"error": f"Too many concurrent {self.name} requests"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(self.retry_after)
+        return response
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LimitExceeded(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __call__(self, view):
+        @functools.wraps(view)
+        def limited(*args, **kwargs):
+            if not self.acquire():
+                return self.rejection()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                self.release()
+        return limited
+
+    def stats(self):
+        with self._lock:
+            return {"active": self.active, "limit": self.max_concurrent, "rejected": self.rejected}
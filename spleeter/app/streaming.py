@@ -0,0 +1,90 @@
+"""
+Streaming multipart/form-data parsing.
+
+Flask's ``request.files`` makes Werkzeug read the whole body into memory or
+a spooled temp file before the view runs. Here the body is read from
+``request.stream`` in small chunks through Werkzeug's sans-IO decoder, so
+the view can hand the uploaded bytes to ffmpeg or a file as they arrive.
+
+An upload can be given a deadline, so a client that sends slowly or stalls
+is cut off rather than holding its server thread indefinitely. Under
+gunicorn each read also times out at the deadline.
+"""
+
+import socket
+import time
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """The request body is not a usable upload."""
+
+
+class UploadTimeout(UploadError):
+    """The upload was not received before its deadline."""
+
+
+def _read(stream, chunk_size, deadline, sock):
+    if deadline is None:
+        return stream.read(chunk_size)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise UploadTimeout("Upload took too long")
+    if sock is None:
+        return stream.read(chunk_size)
+    sock.settimeout(remaining)
+    try:
+        return stream.read(chunk_size)
+    except socket.timeout:
+        raise UploadTimeout("Upload took too long")
+    finally:
+        sock.settimeout(None)
+
+
+def _events(decoder, stream, chunk_size, deadline=None, sock=None):
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            chunk = _read(stream, chunk_size, deadline, sock)
+            decoder.receive_data(chunk if chunk else None)
+            continue
+        yield event
+        if isinstance(event, Epilogue):
+            return
+
+
+def _file_data(events):
+    for event in events:
+        if isinstance(event, Data):
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                return
+
+
+def open_file_field(request, field_name='file', chunk_size=UPLOAD_CHUNK_SIZE, timeout=None):
+    """
+    Find the file part called ``field_name`` in a multipart request.
+
+    Returns ``(filename, chunks)`` where ``chunks`` is an iterator over the
+    file's bytes, read from the network as it is consumed. With ``timeout``,
+    reading raises ``UploadTimeout`` once that many seconds have passed.
+    """
+    content_type, options = parse_options_header(request.headers.get('Content-Type', ''))
+    if content_type != 'multipart/form-data' or 'boundary' not in options:
+        raise UploadError("Expected a multipart/form-data upload")
+
+    decoder = MultipartDecoder(options['boundary'].encode())
+    deadline = time.monotonic() + timeout if timeout else None
+    events = _events(decoder, request.stream, chunk_size, deadline, request.environ.get('gunicorn.socket'))
+    try:
+        for event in events:
+            if isinstance(event, File) and event.name == field_name:
+                return event.filename, _file_data(events)
+    except ValueError as e:
+        raise UploadError(f"Malformed multipart body: {str(e)}")
+    raise UploadError("No file provided")
@@ -0,0 +1,88 @@
+"""
+Span timing for separation requests.
+
+The API sends a W3C ``traceparent`` header with each separation. Spans
+recorded while handling the request are children of that remote span; they
+are returned to the API in the response metadata (so the job's timeline is
+complete there) and appended to a local JSON-lines file.
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_FILE = os.getenv('TRACE_FILE', '/traces/spleeter-spans.jsonl')
+
+_file_lock = threading.Lock()
+
+
+def parse_traceparent(header):
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class RequestTrace:
+    """The spans of one request, all under a single root span."""
+
+    def __init__(self, name, traceparent=None, service='spleeter'):
+        remote = parse_traceparent(traceparent)
+        self.trace_id, parent_id = remote if remote else (secrets.token_hex(16), None)
+        self.service = service
+        self.spans = []
+        self._stack = []
+        self.root = self._open(name, parent_id)
+
+    def _open(self, name, parent_id, **attributes):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": secrets.token_hex(8),
+            "parentSpanId": parent_id,
+            "name": name,
+            "service": self.service,
+            "startTime": time.time(),
+            "durationSeconds": None,
+            "attributes": attributes,
+            "error": None,
+            "_started": time.perf_counter(),
+        }
+        self._stack.append(span)
+        return span
+
+    def _close(self, span):
+        span["durationSeconds"] = time.perf_counter() - span.pop("_started")
+        self._stack.remove(span)
+        self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self._open(name, self._stack[-1]["spanId"], **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            self._close(span)
+
+    def finish(self, error=None):
+        """Close the root span and write every span to the trace file. Returns the spans."""
+        if self.root in self._stack:
+            self.root["error"] = error
+            self._close(self.root)
+        if TRACE_FILE:
+            try:
+                os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+                lines = "".join(json.dumps(span) + "\n" for span in self.spans)
+                with _file_lock, open(TRACE_FILE, 'a') as f:
+                    f.write(lines)
+            except OSError:
+                # Tracing must never fail a separation
+                pass
+        return self.spans
@@ -0,0 +1,104 @@
+"""
+TensorFlow thread-pool sizing and CPU pinning for separation workers.
+
+Spleeter's estimator sessions are created with a default ``ConfigProto``,
+so TensorFlow sizes its intra/inter-op pools from ``TF_NUM_INTRAOP_THREADS``
+and ``TF_NUM_INTEROP_THREADS`` (falling back to every core). Several workers
+on one host each grabbing every core oversubscribe the CPU, so each worker
+is pinned to its own slice of cores and its pools are sized to match.
+
+Settings come from, in increasing priority: built-in defaults, the file
+written by ``autotune.py`` (``TUNING_FILE``), and environment variables.
+``configure_worker`` must run before TensorFlow is imported.
+"""
+
+import json
+import os
+
+TUNING_FILE = os.getenv('TUNING_FILE', '/app/tuning.json')
+
+DEFAULTS = {
+    "workers": 1,
+    # 0 means "one thread per pinned core" for intra-op
+    "intra_op_threads": 0,
+    "inter_op_threads": 2,
+    "pin_cpus": True,
+}
+
+_ENV_OVERRIDES = {
+    "workers": ('SPLEETER_WORKERS', int),
+    "intra_op_threads": ('TF_INTRA_OP_THREADS', int),
+    "inter_op_threads": ('TF_INTER_OP_THREADS', int),
+    "pin_cpus": ('PIN_CPUS', lambda value: value.lower() == 'true'),
+}
+
+
+def load_tuning():
+    """Merge the defaults, the auto-tuned file and environment overrides."""
+    config = dict(DEFAULTS)
+    if os.path.exists(TUNING_FILE):
+        try:
+            with open(TUNING_FILE) as f:
+                tuned = json.load(f)
+            config.update({key: tuned[key] for key in DEFAULTS if key in tuned})
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Ignoring unreadable tuning file {TUNING_FILE}: {e}")
+    for key, (env_name, parse) in _ENV_OVERRIDES.items():
+        if os.getenv(env_name):
+            config[key] = parse(os.environ[env_name])
+    return config
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slice(worker_index, workers, cpus=None):
+    """The contiguous block of ``cpus`` assigned to ``worker_index`` out of ``workers``."""
+    cpus = cpus if cpus is not None else available_cpus()
+    workers = max(1, min(workers, len(cpus)))
+    per_worker, extra = divmod(len(cpus), workers)
+    index = worker_index % workers
+    start = index * per_worker + min(index, extra)
+    return cpus[start:start + per_worker + (1 if index < extra else 0)]
+
+
+def configure_worker(worker_index=0, config=None):
+    """
+    Pin this process to its CPU slice and size TensorFlow's thread pools.
+
+    Returns the settings that were applied, for reporting.
+    """
+    config = config or load_tuning()
+    cpus = available_cpus()
+    if config["pin_cpus"] and config["workers"] > 1:
+        cpus = cpu_slice(worker_index, config["workers"], cpus)
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+
+    intra = config["intra_op_threads"] or len(cpus)
+    inter = config["inter_op_threads"] or 1
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter)
+    os.environ.setdefault('OMP_NUM_THREADS', str(intra))
+
+    return {
+        "worker_index": worker_index,
+        "workers": config["workers"],
+        "cpus": cpus,
+        "intra_op_threads": intra,
+        "inter_op_threads": inter,
+    }
+
+
+def apply_tf_threading(applied):
+    """Mirror the thread settings on TensorFlow's eager context, if it is still configurable."""
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(applied["intra_op_threads"])
+        tf.config.threading.set_inter_op_parallelism_threads(applied["inter_op_threads"])
+    except RuntimeError:
+        # Context already initialized; the environment variables still apply to new sessions
+        pass